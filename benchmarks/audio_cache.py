@@ -0,0 +1,154 @@
+"""
+Hit rates and render speed of the glyph and word caches of MorseAudioSampler
+against the fixed 64-token chunk cache they replaced, on amateur radio style text
+(QSOs of a pool of callsigns: CQ calls, reports, names, QTHs, 73) and on random words.
+
+Every text is rendered twice with one sampler: cold (empty caches) and warm (caches filled
+by a different text of the same kind). Output is checked against the uncached renderer
+
+Usage:
+    python benchmarks/audio_cache.py [--chars 20000] [--sample-rate 8000] [--callsigns 40]
+"""
+import argparse
+import random
+import sys
+
+import numpy as np
+from loguru import logger
+
+from cwi.audio_sampler import MorseAudioSampler
+from cwi.cache import AudioCache
+from cwi.const.service import MORSE_SAMPLER_CACHE_MAX_BYTES
+from cwi.converters import MorseTokenizer
+from cwi.data_structures import TokenString, CacheStatistics
+from cwi.timer import Timer
+from cwi.tone_generators import SineWaveToneGenerator
+from cwi.utils import chunked
+
+from render_allocation import random_message
+
+
+CHUNK_SIZE = 64
+
+NAMES = ("JOHN", "MIKE", "ANNA", "IVAN", "OLGA", "PETE", "BOB", "JAN", "KEN", "SAM")
+CITIES = ("BERLIN", "PARIS", "MOSCOW", "TOKYO", "DENVER", "OSLO", "RIGA", "KYIV", "PRAGUE", "ROME")
+REPORTS = ("599", "579", "559", "449", "5NN")
+
+
+def callsign(rng: random.Random):
+    prefix = "".join(rng.choices("ABCDEFGIJKLMNOPRSUVWZ", k=rng.randint(1, 2)))
+    suffix = "".join(rng.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZ", k=rng.randint(1, 3)))
+    return f"{prefix}{rng.randint(0, 9)}{suffix}"
+
+
+def qso_text(chars: int, callsigns: int, seed: int = 0):
+    rng = random.Random(seed)
+    pool = [callsign(random.Random(index)) for index in range(callsigns)]
+    lines = []
+
+    while sum(map(len, lines)) < chars:
+        me, other = rng.sample(pool, 2)
+        lines += [
+            f"CQ CQ CQ DE {me} {me} K",
+            f"{me} DE {other} {other} K",
+            f"{other} DE {me} GM TNX FER CALL UR RST {rng.choice(REPORTS)} {rng.choice(REPORTS)} "
+            f"NAME {rng.choice(NAMES)} QTH {rng.choice(CITIES)} HW? {other} DE {me} K",
+            f"{me} DE {other} R TNX RPRT 73 ES GL {me} DE {other} SK",
+        ]
+
+    return " ".join(lines)[:chars]
+
+
+class ChunkCacheRenderer:
+    """
+    Previous MorseAudioSampler.produce_audio_data: token codes cut into fixed-size chunks, every chunk cached
+    """
+
+    def __init__(self, sampler: MorseAudioSampler):
+        self.__sampler = sampler
+        self.__cache = AudioCache(MORSE_SAMPLER_CACHE_MAX_BYTES)
+
+    @property
+    def cache_statistics(self):
+        return {"chunk": self.__cache.statistics}
+
+    def produce_audio_data(self, token_string: TokenString):
+        audio = np.empty(self.__sampler.count_samples(token_string), dtype=np.float32)
+        offset = 0
+
+        for chunk in chunked(token_string.codes, CHUNK_SIZE):
+            key = chunk.tobytes()
+
+            if (piece := self.__cache.get(key)) is None:
+                piece = np.zeros(int(self.__sampler.token_lengths(chunk).sum()), dtype=np.float32)
+                self.__sampler.render_codes_into(chunk, piece)
+                self.__cache.put(key, piece)
+
+            audio[offset:offset + piece.size] = piece
+            offset += piece.size
+
+        return audio
+
+
+def hit_rate(before: dict[str, CacheStatistics], after: dict[str, CacheStatistics]):
+    """
+    Returns:
+        "name hit rate" of every cache, over lookups made between two statistics snapshots
+    """
+    rates = []
+
+    for name, statistics in after.items():
+        hits = statistics.hits - before[name][0]
+        lookups = hits + statistics.misses - before[name][1]
+        rates.append(f"{name} {hits / lookups if lookups else 0:6.1%} of {lookups:>6}")
+
+    return ", ".join(rates)
+
+
+def snapshot(statistics: dict[str, CacheStatistics]):
+    return {name: (entry.hits, entry.misses) for name, entry in statistics.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chars", type=int, default=20000)
+    parser.add_argument("--sample-rate", type=int, default=8000)
+    parser.add_argument("--wpm", type=int, default=25)
+    parser.add_argument("--callsigns", type=int, default=40)
+    args = parser.parse_args()
+
+    logger.remove()
+
+    tokenizer = MorseTokenizer()
+    texts = {
+        "qso": [qso_text(args.chars, args.callsigns, seed) for seed in (1, 2)],
+        "random": [random_message(args.chars, seed) for seed in (1, 2)],
+    }
+
+    for kind, (warmup, text) in texts.items():
+        for cold in (True, False):
+            for name in ("chunk", "glyph+word"):
+                sampler = MorseAudioSampler(SineWaveToneGenerator(800, args.sample_rate), 1.2 / args.wpm)
+                renderer = ChunkCacheRenderer(sampler) if name == "chunk" else sampler
+
+                if not cold:
+                    renderer.produce_audio_data(tokenizer.tokenize(warmup))
+
+                token_string = tokenizer.tokenize(text)
+                before = snapshot(renderer.cache_statistics)
+
+                with Timer() as timer:
+                    audio = renderer.produce_audio_data(token_string)
+
+                expected = sampler.produce_audio_data_vectorized(token_string).data
+
+                if not np.array_equal(getattr(audio, "data", audio), expected):
+                    print(f"{name} output differs from uncached render", file=sys.stderr)
+                    sys.exit(1)
+
+                print(f"{kind:<7} {'cold' if cold else 'warm':<5} {name:<11} {timer.prev_toc() * 1000:8.1f}ms  "
+                      f"{hit_rate(before, renderer.cache_statistics)}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
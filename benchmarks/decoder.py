@@ -0,0 +1,105 @@
+"""
+Round trip of MorseAudioSampler output through MorseDecoder: checks that decoded
+tokens and text equal the original and measures decoding speed. Every mismatch
+is reported on stderr with its first difference and the exit code is 1.
+Audio is rendered and decoded block by block, so long messages (about 6000 chars
+are an hour of audio at 20 WPM) run in constant memory
+
+Usage:
+    python benchmarks/decoder.py [--chars 6000] [--sample-rates 8000 44100] [--wpms 5 20 30]
+"""
+import argparse
+import sys
+
+from loguru import logger
+
+from cwi.audio_sampler import MorseAudioSampler
+from cwi.const.service import DECODER_BLOCK_SIZE
+from cwi.converters import MorseTokenizer
+from cwi.data_structures import ToneGeneratorType
+from cwi.decoder import MorseDecoder, tokens_to_text
+from cwi.timer import Timer
+from cwi.tone_generators import TONE_GENERATORS
+
+from render_allocation import random_message
+
+
+class RoundTripError(AssertionError):
+    pass
+
+
+def first_difference(expected: str, actual: str, context: int = 20):
+    """
+    Returns:
+        Position of the first differing character and both strings around it
+    """
+    position = next((index for index, (a, b) in enumerate(zip(expected, actual)) if a != b), min(len(expected), len(actual)))
+    start = max(0, position - context)
+
+    return (f"at {position} (lengths {len(expected)}, {len(actual)}): "
+            f"expected {expected[start:position + context]!r}, got {actual[start:position + context]!r}")
+
+
+def check_round_trip(expected_tokens: str, expected_text: str, tokens: str, text: str):
+    """
+    Raises:
+        RoundTripError: if decoded tokens or text differ from the original
+    """
+    if tokens != expected_tokens:
+        raise RoundTripError(f"tokens differ {first_difference(expected_tokens, tokens)}")
+    if text != expected_text:
+        raise RoundTripError(f"text differs {first_difference(expected_text, text)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chars", type=int, default=6000)
+    parser.add_argument("--sample-rates", type=int, nargs="+", default=[8000, 44100])
+    parser.add_argument("--wpms", type=int, nargs="+", default=[5, 20, 30])
+    parser.add_argument("--tones", nargs="+", default=[tone.value for tone in TONE_GENERATORS],
+                        choices=[tone.value for tone in TONE_GENERATORS])
+    parser.add_argument("--known-wpm", action="store_true", help="Pass WPM to decoder instead of estimating dit length")
+    args = parser.parse_args()
+
+    logger.remove()
+
+    tokenizer = MorseTokenizer()
+    message = random_message(args.chars)
+    token_string = tokenizer.tokenize(message)
+    expected_text = " ".join(message.upper().split())
+    failures = []
+
+    for tone in args.tones:
+        for sample_rate in args.sample_rates:
+            for wpm in args.wpms:
+                dit_duration = 1.2 / wpm
+                sampler = MorseAudioSampler(TONE_GENERATORS[ToneGeneratorType(tone)](800, sample_rate), dit_duration)
+                decoder = MorseDecoder(800, sample_rate, dit_duration if args.known_wpm else None)
+                blocks = sampler.produce_audio_blocks(token_string, DECODER_BLOCK_SIZE)
+                
+                # Rendering is included in the timer, decoding alone is faster
+                with Timer() as timer:
+                    tokens = "".join(decoder.decode_tokens(blocks))
+
+                text = "".join(tokens_to_text([tokens]))
+                case = f"{tone:>8} {sample_rate:>6}Hz {wpm:>3}WPM"
+
+                try:
+                    check_round_trip(token_string.tokens, expected_text, tokens, text)
+                except RoundTripError as error:
+                    failures.append(f"{case.strip()}: {error}")
+                    status = "MISMATCH"
+                else:
+                    status = "ok"
+
+                print(f"{case} | {decoder.duration:9.1f}s audio in {timer.prev_toc():6.2f}s "
+                      f"({decoder.duration / timer.prev_toc():8.0f}x realtime) | "
+                      f"dit error {decoder.dit_duration / dit_duration - 1:+.2%} | {status}", flush=True)
+
+    if failures:
+        print(f"\n{len(failures)} round trips failed:", *failures, sep="\n", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Compares encode throughput and output size of the WAV sample encoders
+against plain 16-bit PCM
+
+Usage:
+    python benchmarks/encoders.py [--chars 20000] [--sample-rate 8000]
+"""
+import argparse
+import io
+
+from loguru import logger
+
+from cwi.audio_sampler import MorseAudioSampler
+from cwi.converters import MorseTokenizer
+from cwi.data_structures import AudioFormat
+from cwi.encoders import ENCODERS
+from cwi.timer import Timer
+from cwi.tone_generators import SineWaveToneGenerator
+from cwi.writers import WavWriter
+
+from render_allocation import random_message
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chars", type=int, default=20_000)
+    parser.add_argument("--sample-rate", type=int, default=8000)
+    parser.add_argument("--wpm", type=int, default=30)
+    args = parser.parse_args()
+
+    logger.remove()
+
+    sampler = MorseAudioSampler(SineWaveToneGenerator(800, args.sample_rate), 1.2 / args.wpm)
+    token_string = MorseTokenizer().tokenize(random_message(args.chars))
+    samples = sampler.produce_audio_data_vectorized(token_string).as_int16
+
+    pcm16_size = None
+
+    for audio_format in AudioFormat:
+        buffer = io.BytesIO()
+
+        with Timer(audio_format) as timer:
+            with WavWriter(buffer, args.sample_rate, samples.size, ENCODERS[audio_format]()) as writer:
+                writer.write(samples)
+
+        size = buffer.getbuffer().nbytes
+        pcm16_size = pcm16_size or size
+        print(f"{audio_format:>10} | {size:>11} bytes ({size / pcm16_size:6.1%}) | "
+              f"{timer.prev_toc():8.3f}s | {samples.size / timer.prev_toc() / 1e6:8.2f} Msamples/s")
+
+
+if __name__ == "__main__":
+    main()
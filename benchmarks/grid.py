@@ -0,0 +1,94 @@
+"""
+Renders one message with a grid of tone x frequency x speed variants:
+
+    separate    a new App per variant: tokenize, tone setup and render every time
+    grid        GridRenderer: one tokenization, bank indices once per speed, one gather per variant
+                into an output buffer reused within the speed
+
+Audio of every grid variant is checked against its separate render
+
+Usage:
+    python benchmarks/grid.py [--chars 2000] [--frequencies 5] [--speeds 4] [--sample-rate 8000]
+"""
+import argparse
+import hashlib
+import itertools
+import sys
+
+import numpy as np
+from loguru import logger
+
+from cwi.app import App
+from cwi.data_structures import RenderVariant, ToneGeneratorType
+from cwi.grid import GridRenderer
+from cwi.timer import Timer
+
+from render_allocation import random_message
+
+
+def digest(audio: np.ndarray):
+    return hashlib.blake2b(audio.data).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chars", type=int, default=2000)
+    parser.add_argument("--frequencies", type=int, default=5)
+    parser.add_argument("--speeds", type=int, default=4)
+    parser.add_argument("--sample-rate", type=int, default=8000)
+    args = parser.parse_args()
+
+    logger.remove()
+
+    message = random_message(args.chars)
+    variants = [
+        RenderVariant(tone.value, frequency, wpm)
+        for tone, frequency, wpm in itertools.product(ToneGeneratorType, np.linspace(500, 1000, args.frequencies).tolist(),
+                                                      range(15, 15 + 3 * args.speeds, 3))
+    ]
+
+    # Audio is compared by digest, so only one variant is held in memory at a time
+    separate = []
+    separate_time = 0
+    samples = 0
+
+    for variant in variants:
+        with Timer() as timer:
+            app = App(variant.tone, variant.frequency, args.sample_rate, variant.words_per_minute)
+            app.message = message
+            audio = app.generate_audio_data().data
+        separate_time += timer.prev_toc()
+        separate.append(digest(audio))
+        samples += audio.size
+        del app, audio
+
+    with Timer() as timer:
+        renderer = GridRenderer(message, variants, args.sample_rate)
+    setup_time = timer.prev_toc()
+
+    grid = {}
+    render_time = 0
+
+    for group in renderer.groups:
+        # One output buffer per group, as render_grid does
+        audio = None
+
+        for index in group:
+            with Timer() as timer:
+                audio = renderer.render(index, audio).data
+            render_time += timer.prev_toc()
+            grid[index] = digest(audio)
+
+    for index, variant in enumerate(variants):
+        if grid[index] != separate[index]:
+            print(f"Grid render of {variant} differs from separate render", file=sys.stderr)
+            sys.exit(1)
+
+    print(f"{len(variants)} variants, {len(renderer.groups)} speeds, {samples / args.sample_rate:.0f}s of audio")
+    print(f"separate  {separate_time * 1000:8.1f}ms")
+    print(f"grid      {(setup_time + render_time) * 1000:8.1f}ms  (setup {setup_time * 1000:.1f}ms, "
+          f"render {render_time * 1000:.1f}ms)  {separate_time / (setup_time + render_time):.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Edit latency of App in incremental mode against full re-render, for growing messages.
+Every case sets the edited message and renders it (message setter + generate_audio_data):
+
+    append      one character typed at the end
+    edit        one character replaced in the middle
+    full        append without incremental mode (whole message tokenized and rendered again)
+
+Time is the median of --edits edits, worst append is reported too. Final audio of incremental mode is checked against full render
+
+Usage:
+    python benchmarks/incremental.py [--lengths 100 1000 5000] [--edits 50] [--sample-rate 8000]
+"""
+import argparse
+import statistics
+import sys
+
+import numpy as np
+from loguru import logger
+
+from cwi.app import App
+from cwi.timer import Timer
+
+from render_allocation import random_message
+
+
+def latencies(app: App, versions: list[str]):
+    """
+    Returns:
+        Times of setting and rendering every version [seconds]
+    """
+    times = []
+
+    for version in versions:
+        with Timer() as timer:
+            app.message = version
+            app.generate_audio_data()
+        times.append(timer.prev_toc())
+
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--edits", type=int, default=50)
+    parser.add_argument("--sample-rate", type=int, default=8000)
+    args = parser.parse_args()
+
+    logger.remove()
+
+    print(f"{'length':>8} {'append':>10} {'worst':>10} {'edit':>10} {'full':>10}")
+
+    for length in args.lengths:
+        message = random_message(length)
+        typed = random_message(args.edits)
+        appends = [message + typed[:count] for count in range(1, args.edits + 1)]
+        middle = len(message) // 2
+        edits = [f"{message[:middle]}{char}{message[middle + 1:]}" for char in typed]
+
+        app = App("sine", 800, args.sample_rate, 20, incremental=True)
+        app.message = message
+        app.generate_audio_data()
+
+        append_times = latencies(app, appends)
+        edit_time = statistics.median(latencies(app, edits))
+        incremental_audio = app.generate_audio_data().data.copy()
+
+        reference = App("sine", 800, args.sample_rate, 20)
+        full_time = statistics.median(latencies(reference, appends[:max(1, args.edits // 10)]))
+        reference.message = edits[-1]
+
+        if not np.array_equal(incremental_audio, reference.generate_audio_data().data):
+            print(f"Incremental audio of {length} characters differs from full render", file=sys.stderr)
+            sys.exit(1)
+
+        print(f"{length:>8} {statistics.median(append_times) * 1000:8.2f}ms {max(append_times) * 1000:8.2f}ms "
+              f"{edit_time * 1000:8.2f}ms {full_time * 1000:8.2f}ms", flush=True)
+
+
+if __name__ == "__main__":
+    main()
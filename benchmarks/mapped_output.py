@@ -0,0 +1,77 @@
+"""
+Peak resident memory of rendering one long message to a WAV file, every mode in a fresh process:
+
+    stream      cwi render -o <tmp>.wav             (blocks rendered and written one by one)
+    mmap        cwi render --mmap -o <tmp>.wav      (int16 rendered into memory-mapped file)
+    whole       cwi render -j 2 -o <tmp>.wav        (whole message rendered before writing)
+
+Outputs of stream and mmap modes are checked to be equal
+
+Usage:
+    python benchmarks/mapped_output.py [--chars 2000] [--sample-rate 96000]
+"""
+import argparse
+import filecmp
+import os
+import subprocess
+import sys
+import tempfile
+
+from cwi.timer import Timer
+
+from render_allocation import random_message
+
+
+_CHILD = """
+import resource, sys
+from cwi.app import cli
+cli.main(sys.argv[1:], standalone_mode=False)
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file=sys.stderr)
+"""
+
+
+def run(args: list[str]):
+    """
+    Returns:
+        (wall time [seconds], peak resident memory [bytes]) of cwi invoked with args
+    """
+    with Timer() as timer:
+        result = subprocess.run([sys.executable, "-c", _CHILD, *args], check=True, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, text=True)
+
+    # ru_maxrss is in kilobytes on Linux
+    return timer.prev_toc(), int(result.stderr.split()[-1]) * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chars", type=int, default=2000)
+    parser.add_argument("--sample-rate", type=int, default=96000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        message_path = os.path.join(directory, "message.txt")
+
+        with open(message_path, "w", encoding="UTF-8") as file:
+            file.write(random_message(args.chars))
+
+        common = ["render", "-q", "-t", "sine", "-r", str(args.sample_rate), "--no-cache", "-i", message_path]
+        modes = {
+            "stream": [],
+            "mmap": ["--mmap"],
+            "whole": ["-j", "2"],
+        }
+
+        for name, options in modes.items():
+            output = os.path.join(directory, f"{name}.wav")
+            elapsed, peak = run(common + options + ["-o", output])
+            print(f"{name:<8} {elapsed:8.2f}s  peak RSS {peak / 2 ** 20:8.1f}MiB  "
+                  f"output {os.path.getsize(output) / 2 ** 20:8.1f}MiB", flush=True)
+
+        if not filecmp.cmp(os.path.join(directory, "stream.wav"), os.path.join(directory, "mmap.wav"), shallow=False):
+            print("Memory-mapped output differs from streamed output", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
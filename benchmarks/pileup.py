@@ -0,0 +1,107 @@
+"""
+Renders a pileup of --stations random stations with PileupMixer: whole mix and block stream.
+Checks that the mix equals the sum of stations rendered one by one (for the first --check stations)
+and reports mixing speed and peak traced memory relative to the size of the output
+
+Usage:
+    python benchmarks/pileup.py [--stations 300] [--chars 60] [--sample-rate 8000] [--check 8]
+"""
+import argparse
+import random
+import sys
+import tracemalloc
+
+import numpy as np
+from loguru import logger
+
+from cwi.audio_sampler import MorseAudioSampler
+from cwi.converters import MorseTokenizer
+from cwi.data_structures import Station
+from cwi.mixer import PileupMixer
+from cwi.timer import Timer
+from cwi.tone_generators import TONE_GENERATORS
+
+from render_allocation import random_message
+
+
+def random_stations(count: int, chars: int, spread: float, seed: int = 0):
+    generator = random.Random(seed)
+
+    return [
+        Station(random_message(chars), frequency=generator.uniform(400, 1200), words_per_minute=generator.randint(15, 35),
+                offset=generator.uniform(0, spread), amplitude=generator.uniform(0.2, 1.0))
+        for _ in range(count)
+    ]
+
+
+def reference_mix(stations: list[Station], sample_rate: int):
+    """
+    Returns:
+        Sum of stations rendered separately into full-length buffers
+    """
+    tokenizer = MorseTokenizer()
+    tracks = []
+
+    for station in stations:
+        sampler = MorseAudioSampler(TONE_GENERATORS[station.tone](station.frequency, sample_rate), 1.2 / station.words_per_minute)
+        audio = sampler.produce_audio_data_vectorized(tokenizer.tokenize(station.message)).data
+        tracks.append((round(station.offset * sample_rate), audio * np.float32(station.amplitude)))
+
+    mix = np.zeros(max(offset + audio.size for offset, audio in tracks), dtype=np.float32)
+
+    for offset, audio in tracks:
+        mix[offset:offset + audio.size] += audio
+
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=300)
+    parser.add_argument("--chars", type=int, default=60)
+    parser.add_argument("--spread", type=float, default=30, help="Start offsets are spread over this many seconds")
+    parser.add_argument("--sample-rate", type=int, default=8000)
+    parser.add_argument("--check", type=int, default=8, help="Number of stations to compare with reference mix")
+    args = parser.parse_args()
+
+    logger.remove()
+
+    stations = random_stations(args.stations, args.chars, args.spread)
+
+    if args.check:
+        expected = reference_mix(stations[:args.check], args.sample_rate)
+        actual = PileupMixer(stations[:args.check], args.sample_rate).mix().data
+
+        if actual.shape != expected.shape or not np.allclose(actual, expected, atol=1e-5):
+            print(f"Mix of {args.check} stations differs from reference", file=sys.stderr)
+            sys.exit(1)
+
+        print(f"check           {args.check} stations match reference mix")
+
+    with Timer() as timer:
+        mixer = PileupMixer(stations, args.sample_rate)
+    print(f"setup           {timer.prev_toc() * 1000:8.1f}ms  {args.stations} stations, {mixer.duration:.1f}s of audio")
+
+    output_bytes = mixer.length * np.dtype(np.float32).itemsize
+
+    tracemalloc.start()
+    with Timer() as timer:
+        audio = mixer.mix()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"mix             {timer.prev_toc() * 1000:8.1f}ms  {mixer.duration / timer.prev_toc():8.1f}x realtime  "
+          f"peak memory {peak / output_bytes:.2f}x output")
+
+    del audio
+
+    tracemalloc.start()
+    with Timer() as timer:
+        samples = sum(block.size for block in mixer.mix_blocks())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"mix_blocks      {timer.prev_toc() * 1000:8.1f}ms  {samples / args.sample_rate / timer.prev_toc():8.1f}x realtime  "
+          f"peak memory {peak / 2 ** 20:.2f}MiB")
+
+
+if __name__ == "__main__":
+    main()
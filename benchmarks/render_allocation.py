@@ -0,0 +1,92 @@
+"""
+Compares the single-allocation renderer of MorseAudioSampler
+against the concatenation-based renderer it replaced
+
+Usage:
+    python benchmarks/render_allocation.py [--chars 100000] [--legacy-chars 5000]
+"""
+import argparse
+import random
+
+import numpy as np
+from loguru import logger
+
+from cwi.audio_sampler import MorseAudioSampler
+from cwi.const.morse_codes import LATIN, NUMERICAL
+from cwi.converters import MorseTokenizer
+from cwi.data_structures import MorseToken
+from cwi.tone_generators import SineWaveToneGenerator, SilenceGenerator
+from cwi.timer import Timer
+from cwi.utils import chunked
+
+
+LEGACY_CHUNK_SIZE = 64
+
+
+def random_message(length: int, seed: int = 0):
+    rng = random.Random(seed)
+    alphabet = list(LATIN) + list(NUMERICAL)
+    words = ("".join(rng.choices(alphabet, k=rng.randint(1, 8))) for _ in range(length))
+    return " ".join(words)[:length]
+
+
+def legacy_produce_audio_data(audio_lookup: dict, token_string, chunk_size: int):
+    cache = {}
+    audio = np.array([])
+
+    for token_chunk in chunked(token_string.tokens, chunk_size):
+        if token_chunk not in cache:
+            audio_chunk = np.array([])
+            for symbol in token_chunk:
+                audio_chunk = np.concatenate([audio_chunk, audio_lookup[symbol]])
+            cache[token_chunk] = audio_chunk
+        audio = np.concatenate([audio, cache[token_chunk]])
+
+    return audio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chars", type=int, default=100_000)
+    parser.add_argument("--legacy-chars", type=int, default=5_000,
+                        help="Legacy renderer is quadratic, so it is measured on a shorter message")
+    parser.add_argument("--sample-rate", type=int, default=8000)
+    parser.add_argument("--wpm", type=int, default=30)
+    args = parser.parse_args()
+
+    logger.remove()
+
+    dit_duration = 1.2 / args.wpm
+    tone_generator = SineWaveToneGenerator(800, args.sample_rate)
+    sampler = MorseAudioSampler(tone_generator, dit_duration)
+    tokenizer = MorseTokenizer()
+    
+    silence_generator = SilenceGenerator.copy_of(tone_generator)
+    audio_lookup = {
+        MorseToken.DIT: tone_generator.sound(dit_duration),
+        MorseToken.DAH: tone_generator.sound(dit_duration * 3),
+        MorseToken.INTRA_CHARACTER: silence_generator.sound(dit_duration),
+        MorseToken.INTER_CHARACTER: silence_generator.sound(dit_duration * 3),
+        MorseToken.INTER_WORD: silence_generator.sound(dit_duration * 7),
+        MorseToken.UNKNOWN: silence_generator.sound(dit_duration * 3),
+    }
+
+    for chars in sorted({args.legacy_chars, args.chars}):
+        token_string = tokenizer.tokenize(random_message(chars))
+        
+        with Timer("single-allocation") as timer:
+            audio = sampler.produce_audio_data(token_string).data
+        print(f"{chars:>9} chars | {audio.size:>11} samples | single-allocation: {timer.prev_toc():8.3f}s")
+
+        if chars <= args.legacy_chars:
+            with Timer("legacy") as timer:
+                legacy_audio = legacy_produce_audio_data(audio_lookup, token_string, LEGACY_CHUNK_SIZE)
+            print(f"{chars:>9} chars | {legacy_audio.size:>11} samples | legacy:            {timer.prev_toc():8.3f}s")
+            
+            assert np.array_equal(audio, legacy_audio), "Renderers output differs"
+            
+        del audio
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Measures cold start of the CLI: every case runs in a fresh interpreter,
+time is the median wall time of --repeat runs
+
+    interpreter     python -c pass
+    import          import cwi.app
+    help            cwi --help
+    render          cwi render -q -r 8000 sos -o <tmp>.wav
+
+With --importtime, also lists the slowest imports of cwi.app (python -X importtime)
+
+Usage:
+    python benchmarks/startup.py [--repeat 10] [--importtime 15]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from cwi.timer import Timer
+
+
+def run(args: list[str], repeat: int):
+    """
+    Returns:
+        Median wall time of running args [seconds]
+    """
+    times = []
+
+    for _ in range(repeat):
+        with Timer() as timer:
+            subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(timer.prev_toc())
+
+    return statistics.median(times)
+
+
+def slowest_imports(count: int):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import cwi.app"],
+                            check=True, capture_output=True, text=True)
+    entries = []
+
+    # Lines are "import time: <self us> | <cumulative us> | <module>", the first one is a header
+    for line in result.stderr.splitlines()[1:]:
+        self_time, cumulative, name = line.removeprefix("import time:").split("|")
+        entries.append((int(cumulative), int(self_time), name.strip()))
+
+    return sorted(entries, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--importtime", type=int, default=0, help="Number of slowest imports to list")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "startup.wav")
+        cli = [sys.executable, "-m", "cwi.app"]
+
+        cases = {
+            "interpreter": [sys.executable, "-c", "pass"],
+            "import": [sys.executable, "-c", "import cwi.app"],
+            "help": cli + ["--help"],
+            "render": cli + ["render", "-q", "-t", "sine", "-r", "8000", "sos", "-o", output],
+        }
+
+        for name, command in cases.items():
+            print(f"{name:<12} {run(command, args.repeat) * 1000:8.1f}ms", flush=True)
+
+    if args.importtime:
+        print(f"\n{'cumulative':>12} {'self':>10}  module")
+        for cumulative, self_time, name in slowest_imports(args.importtime):
+            print(f"{cumulative / 1000:10.1f}ms {self_time / 1000:8.1f}ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Peak resident memory of rendering a long message piped to cwi, every mode in a fresh process:
+
+    stream      cat message | cwi render -i - -o <tmp>.wav      (read, tokenized and rendered in chunks)
+    whole       cat message | cwi render -i - -j 2 -o <tmp>.wav (whole message read and rendered first)
+
+Message is fed to stdin by a pipe. Outputs of both modes are checked to be equal
+
+Usage:
+    python benchmarks/stream_input.py [--chars 20000] [--sample-rate 8000]
+"""
+import argparse
+import filecmp
+import os
+import subprocess
+import sys
+import tempfile
+
+from cwi.timer import Timer
+
+from mapped_output import _CHILD
+from render_allocation import random_message
+
+
+def run(args: list[str], message_path: str):
+    """
+    Returns:
+        (wall time [seconds], peak resident memory [bytes]) of cwi invoked with args, message piped to stdin
+    """
+    with Timer() as timer, open(message_path, "rb") as message:
+        result = subprocess.run([sys.executable, "-c", _CHILD, *args], check=True, stdin=message,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+    # ru_maxrss is in kilobytes on Linux
+    return timer.prev_toc(), int(result.stderr.split()[-1]) * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chars", type=int, default=20000)
+    parser.add_argument("--sample-rate", type=int, default=8000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        message_path = os.path.join(directory, "message.txt")
+
+        with open(message_path, "w", encoding="UTF-8") as file:
+            # Lines, so word gaps fall on chunk boundaries too
+            message = random_message(args.chars)
+            file.write("\n".join(message[start:start + 70] for start in range(0, len(message), 70)))
+
+        common = ["render", "-q", "-t", "sine", "-r", str(args.sample_rate), "--no-cache", "-i", "-"]
+        modes = {
+            "stream": [],
+            "whole": ["-j", "2"],
+        }
+
+        for name, options in modes.items():
+            output = os.path.join(directory, f"{name}.wav")
+            elapsed, peak = run(common + options + ["-o", output], message_path)
+            print(f"{name:<8} {elapsed:8.2f}s  peak RSS {peak / 2 ** 20:8.1f}MiB  "
+                  f"output {os.path.getsize(output) / 2 ** 20:8.1f}MiB", flush=True)
+
+        if not filecmp.cmp(os.path.join(directory, "stream.wav"), os.path.join(directory, "whole.wav"), shallow=False):
+            print("Streamed output differs from whole message output", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Benchmark suite of the rendering pipeline stages: tokenizer, sampler,
+tone generators and WAV writer
+
+Every axis is swept around a base configuration (one axis at a time):
+    tokenizer   message length
+    sampler     message length, sample rate, WPM, generator type
+    generator   generator type x sample rate, 1 second of tone
+    writer      message length (int16 conversion and WAV file writing)
+
+Time is the best of at least --repeat runs (more for cases shorter than --min-time), so sampler cases measure a warm audio cache.
+Peak memory is measured in one extra run under tracemalloc.
+Cases rendering more than --max-samples samples are skipped.
+
+Results are saved as JSON. With --baseline, cases slower (or using more memory)
+than baseline by more than --threshold are reported and the exit code is 1.
+
+Usage:
+    python benchmarks/suite.py [--output results.json] [--baseline baseline.json] [--threshold 0.1]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+from functools import partial
+from typing import Callable
+
+import numpy as np
+from loguru import logger
+
+from cwi.audio_sampler import MorseAudioSampler
+from cwi.const.service import SAVING_BUFFER_SIZE
+from cwi.converters import MorseTokenizer
+from cwi.data_structures import ToneGeneratorType, AudioData
+from cwi.timer import Timer
+from cwi.tone_generators import TONE_GENERATORS
+from cwi.utils import chunked
+from cwi.writers import WavWriter
+
+from render_allocation import random_message
+
+
+def measure(function: Callable, repeat: int, min_time: float):
+    """
+    Calls function at least repeat times and until min_time is spent, so short cases are not dominated by noise
+
+    Returns:
+        (best time [seconds], peak traced memory [bytes], result of the last call)
+    """
+    best = float("inf")
+    total = Timer().tic()
+    calls = 0
+
+    while calls < repeat or total.toc() < min_time:
+        with Timer() as timer:
+            result = function()
+        best = min(best, timer.prev_toc())
+        calls += 1
+        del result
+
+    tracemalloc.start()
+    try:
+        result = function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return best, peak, result
+
+
+class Suite:
+    def __init__(self, args: argparse.Namespace):
+        self.__args = args
+        self.__tokenizer = MorseTokenizer()
+        self.__messages = {}
+        self.__results = []
+
+    @property
+    def results(self):
+        return self.__results
+
+    def __message(self, length: int):
+        if length not in self.__messages:
+            self.__messages[length] = random_message(length)
+        return self.__messages[length]
+
+    def __sampler(self, tone: str, sample_rate: int, wpm: int):
+        return MorseAudioSampler(TONE_GENERATORS[tone](800, sample_rate), 1.2 / wpm)
+
+    @staticmethod
+    def __name(stage: str, params: dict):
+        return "/".join([stage] + [f"{key}={value}" for key, value in params.items()])
+
+    def __record(self, stage: str, params: dict, function: Callable, samples: Callable | None = None):
+        name = self.__name(stage, params)
+        seconds, peak, result = measure(function, self.__args.repeat, self.__args.min_time)
+        sample_count = samples(result) if samples else None
+        del result
+
+        entry = {
+            "name": name,
+            "stage": stage,
+            "params": params,
+            "seconds": seconds,
+            "samples": sample_count,
+            "samples_per_second": sample_count / seconds if sample_count and seconds else None,
+            "peak_bytes": peak,
+        }
+        self.__results.append(entry)
+
+        rate = f"{entry['samples_per_second'] / 1e6:10.2f} Ms/s" if entry["samples_per_second"] else " " * 15
+        print(f"{name:<72} {seconds:10.5f}s {rate} {peak / 2 ** 20:10.2f} MiB", flush=True)
+
+    def __fits(self, name: str, sampler: MorseAudioSampler, token_string):
+        samples = sampler.count_samples(token_string)
+
+        if samples > self.__args.max_samples:
+            print(f"{name:<72} skipped: {samples} samples > {self.__args.max_samples}", flush=True)
+            return False
+
+        return True
+
+    def run_tokenizer(self):
+        for length in self.__args.lengths:
+            message = self.__message(length)
+            self.__record("tokenizer", {"chars": length}, lambda: self.__tokenizer.tokenize(message))
+
+    def run_sampler(self):
+        base = self.__args
+        base_length, base_rate, base_wpm, base_tone = base.lengths[len(base.lengths) // 2], 44100, 20, ToneGeneratorType.SINE
+
+        cases = [(length, base_rate, base_wpm, base_tone) for length in base.lengths]
+        cases += [(base_length, rate, base_wpm, base_tone) for rate in base.sample_rates]
+        cases += [(base_length, base_rate, wpm, base_tone) for wpm in base.wpms]
+        cases += [(base_length, base_rate, base_wpm, tone) for tone in base.tones]
+
+        for length, rate, wpm, tone in dict.fromkeys(cases):
+            sampler = self.__sampler(tone, rate, wpm)
+            token_string = self.__tokenizer.tokenize(self.__message(length))
+            params = {"chars": length, "sample_rate": rate, "wpm": wpm, "tone": str(tone)}
+
+            if not self.__fits(self.__name("sampler", params), sampler, token_string):
+                continue
+
+            self.__record("sampler", params, lambda: sampler.produce_audio_data(token_string),
+                          lambda audio_data: audio_data.data.size)
+            self.__record("sampler_vectorized", params, lambda: sampler.produce_audio_data_vectorized(token_string),
+                          lambda audio_data: audio_data.data.size)
+
+    def run_generator(self):
+        for tone in self.__args.tones:
+            for rate in self.__args.sample_rates:
+                generator = TONE_GENERATORS[tone](800, rate)
+                self.__record("generator", {"tone": str(tone), "sample_rate": rate}, lambda: generator.sound(1.0), np.size)
+
+    def run_writer(self):
+        sampler = self.__sampler(ToneGeneratorType.SINE, 44100, 20)
+
+        def write(audio_data: AudioData, path: str):
+            samples = audio_data.to_int16()
+            with open(path, "wb") as file, WavWriter(file, 44100, samples.size) as writer:
+                for block in chunked(samples, SAVING_BUFFER_SIZE):
+                    writer.write(block)
+            return samples.size
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "benchmark.wav")
+
+            for length in self.__args.lengths:
+                token_string = self.__tokenizer.tokenize(self.__message(length))
+
+                if not self.__fits(self.__name("writer", {"chars": length}), sampler, token_string):
+                    continue
+
+                audio_data = sampler.produce_audio_data_vectorized(token_string)
+                self.__record("writer", {"chars": length}, partial(write, audio_data, path), lambda samples: samples)
+                del audio_data
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float, noise_floor: float):
+    """
+    Slowdowns shorter than noise_floor [seconds] are not counted as regressions
+
+    Returns:
+        Names of cases slower or using more memory than baseline by more than threshold
+    """
+    baseline = {entry["name"]: entry for entry in baseline}
+    regressions = []
+
+    print(f"\n{'case':<72} {'time':>9} {'memory':>9}")
+
+    for entry in results:
+        if (reference := baseline.get(entry["name"])) is None:
+            continue
+
+        time_ratio = entry["seconds"] / reference["seconds"] if reference["seconds"] else 1.0
+        memory_ratio = entry["peak_bytes"] / reference["peak_bytes"] if reference["peak_bytes"] else 1.0
+        slower = time_ratio > 1 + threshold and entry["seconds"] - reference["seconds"] > noise_floor
+        regressed = slower or memory_ratio > 1 + threshold
+
+        if regressed:
+            regressions.append(entry["name"])
+
+        print(f"{entry['name']:<72} {time_ratio:8.2f}x {memory_ratio:8.2f}x{'  REGRESSION' if regressed else ''}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", default=["tokenizer", "sampler", "generator", "writer"],
+                        choices=["tokenizer", "sampler", "generator", "writer"])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 1_000, 100_000, 1_000_000])
+    parser.add_argument("--sample-rates", type=int, nargs="+", default=[8000, 44100, 96000])
+    parser.add_argument("--wpms", type=int, nargs="+", default=[5, 20, 30])
+    parser.add_argument("--tones", nargs="+", default=[tone.value for tone in TONE_GENERATORS],
+                        choices=[tone.value for tone in TONE_GENERATORS])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimal time spent on repeats of every case [seconds]")
+    parser.add_argument("--max-samples", type=int, default=2 ** 26)
+    parser.add_argument("--output", help="Save results as JSON")
+    parser.add_argument("--baseline", help="Compare against results JSON saved before")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Allowed slowdown, 0.1 is 10%%")
+    parser.add_argument("--noise-floor", type=float, default=1e-3, help="Slowdowns shorter than this are ignored [seconds]")
+    args = parser.parse_args()
+    args.tones = [ToneGeneratorType(tone) for tone in args.tones]
+
+    logger.remove()
+
+    suite = Suite(args)
+
+    for stage in args.stages:
+        getattr(suite, f"run_{stage}")()
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": suite.results,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="UTF-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="UTF-8") as file:
+            baseline = json.load(file)["results"]
+
+        regressions = compare(suite.results, baseline, args.threshold, args.noise_floor)
+
+        if regressions:
+            print(f"\n{len(regressions)} regressions above {args.threshold:.0%} threshold")
+            sys.exit(1)
+
+        print(f"\nNo regressions above {args.threshold:.0%} threshold")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,45 @@
-import wave as wav
-from typing import TextIO
+import os
+import sys
+from contextlib import contextmanager, closing, ExitStack
+from functools import partial
+from itertools import chain, product
+from typing import BinaryIO, TextIO, Iterable
 from textwrap import TextWrapper
 from sys import exit
 
 import click
 import numpy as np
-import pyaudio
-from rich.logging import RichHandler
-from rich.progress import Progress, SpinnerColumn, TimeElapsedColumn, MofNCompleteColumn
-from rich.console import Console
-from loguru import logger
-from pyaudio import PyAudio
-
-logger.remove()
-logger.level("NOSHOW", 999, "black", "X")
-console = Console()
-
-import cwi.tone_generators as tone_generators
+import numpy.typing as npt
+
+import cwi.ui as ui
+from cwi.log import logger
 from cwi.const.log_fmt import CONSOLE_FORMAT
-from cwi.const.service import PLAYBACK_BUFFER_SIZE, SAVING_BUFFER_SIZE
-from cwi.const.service import MORSE_SAMPLER_TOKEN_CHUNK_SIZE
-from cwi.data_structures import ToneGeneratorType, AudioData, Message
-from cwi.converters import MorseTokenizer, TokenPurifier
-from cwi.audio_sampler import MorseAudioSampler
+from cwi.const.service import PLAYBACK_BUFFER_SIZE, PLAYBACK_RING_BUFFER_SIZE, SAVING_BUFFER_SIZE
+from cwi.const.service import DISK_CACHE_MAX_BYTES, STDOUT_PATH, INPUT_CHUNK_SIZE
+from cwi.const.service import SERVER_HOST, SERVER_PORT, SERVER_MAX_APPS, MAPPED_WINDOW_TOKENS
+from cwi.data_structures import ToneGeneratorType, AudioFormat, AudioData, Message, RenderVariant
+from cwi.converters import MorseTokenizer, IncrementalTokenizer, TokenPurifier
+from cwi.audio_sampler import MorseAudioSampler, IncrementalRender
+from cwi.tone_generators import TONE_GENERATORS
+from cwi.metrics import registry
+from cwi.encoders import ENCODERS
+from cwi.writers import PcmWriter, WavWriter, MappedWavWriter
 from cwi.timer import Timer
+from cwi.utils import chunked
+from cwi.ui import console
 
 
 class App:
-    def __init__(self, tone_generator_type: str, frequency: float, sample_rate: int, words_per_minute: int):
+    def __init__(self, tone_generator_type: str, frequency: float, sample_rate: int, words_per_minute: int,
+                 cache_dir: str | None = None, audio_format: str = AudioFormat.PCM16, incremental: bool = False):
+        """
+        incremental keeps tokens and audio of the previous message, so after an edit only the changed
+        characters are tokenized and rendered again (see generate_audio_data)
+        """
         dit_duration = 1.2 / words_per_minute
-        tone_generators_mapping = {
-            ToneGeneratorType.SINE: tone_generators.SineWaveToneGenerator,
-            ToneGeneratorType.SAW: tone_generators.SawtoothToneGenerator,
-            ToneGeneratorType.TRIANGLE: tone_generators.TriangleToneGenerator,
-            ToneGeneratorType.SQUARE: tone_generators.SquareToneGenerator,
-        }
 
         try:
-            tone_generator = tone_generators_mapping[tone_generator_type](frequency, sample_rate)
+            tone_generator = TONE_GENERATORS[tone_generator_type](frequency, sample_rate)
         except KeyError:
             logger.exception(f"Invalid tone generator type provided: {tone_generator_type}")
             raise ValueError(f"Invalid tone generator type provided: {tone_generator_type}")
@@ -47,6 +49,7 @@ class App:
         self.__dit_duration = dit_duration
         self.__wpm = words_per_minute
         self.__tone_generator_type = tone_generator_type
+        self.__audio_format = AudioFormat(audio_format)
         
         try:
             self.__tokenizer = MorseTokenizer()
@@ -55,31 +58,112 @@ class App:
             logger.critical("Cannot proceed without tokenizer")
             exit(1)
 
-        self.__audio_sampler = MorseAudioSampler(tone_generator, dit_duration)
+        self.__tone_generator = tone_generator
+        self.__sampler = None
+        self.__int16_sampler = None
+        
+        self.__incremental_tokenizer = None
+        self.__incremental_render = None
+        self.__pending_edits = []
+        
+        if incremental:
+            self.__incremental_tokenizer = IncrementalTokenizer(self.__tokenizer)
+            self.__incremental_render = IncrementalRender(self.__audio_sampler)
+        
+        self.__disk_cache = None
+        
+        if cache_dir:
+            from cwi.disk_cache import DiskAudioCache
+            self.__disk_cache = DiskAudioCache(cache_dir, DISK_CACHE_MAX_BYTES)
         
         self.__message = Message()
+        self.__message_stream = None
+        self.__stream_unknown_chars = set()
+        self.__cache_entry = None
         
         logger.debug(f"{self.__class__.__name__} initialized:")
         logger.info(f"{self.__class__.__name__} WPM: {words_per_minute}, dot duration: {dit_duration}s")
         logger.info(f"{self.__class__.__name__} Sample rate: {sample_rate}, frequency: {frequency}, tone: {tone_generator_type}")
+        logger.info(f"{self.__class__.__name__} Output format: {self.__audio_format}")
         logger.debug(f"{self.__class__.__name__} {SAVING_BUFFER_SIZE=}, {PLAYBACK_BUFFER_SIZE}")
-        logger.debug(f"{self.__class__.__name__} {MORSE_SAMPLER_TOKEN_CHUNK_SIZE=}")
+        logger.debug(f"{self.__class__.__name__} {cache_dir=}, {DISK_CACHE_MAX_BYTES=}")
+        logger.debug(f"{self.__class__.__name__} {incremental=}")
 
     @property
     def dit_duration(self):
         return self.__dit_duration
     
+    @property
+    def sample_rate(self):
+        return self.__sample_rate
+    
+    @property
+    def audio_cache_statistics(self):
+        return self.__sampler.cache_statistics if self.__sampler is not None else {}
+    
+    @property
+    def __audio_sampler(self):
+        # Built on first use: audio loaded from disk cache needs no tone synthesis
+        if self.__sampler is None:
+            self.__sampler = MorseAudioSampler(self.__tone_generator, self.__dit_duration)
+            
+        return self.__sampler
+    
     @property
     def message(self):
         return self.__message.actual
     
     @message.setter
     def message(self, val: str):
-        token_string = self.__tokenizer.tokenize(val)
+        with registry.stage("tokenize"):
+            if self.__incremental_tokenizer is None:
+                token_string = self.__tokenizer.tokenize(val)
+                readable = TokenPurifier.purify(token_string)
+            else:
+                self.__pending_edits.append(self.__incremental_tokenizer.update(val))
+                token_string = self.__incremental_tokenizer.token_string
+                # Kept up to date by the tokenizer, joined only when asked for
+                readable = None
         
         self.__message.actual = val
         self.__message.morse_tokens = token_string
-        self.__message.morse_readable = TokenPurifier.purify(token_string)
+        self.__message.morse_readable = readable
+        self.__message_stream = None
+        self.__cache_entry = None
+        
+    def stream_message(self, chunks: Iterable[str]):
+        """
+        Sets message read lazily from text chunks (lines, blocks of a file).
+        It is tokenized segment by segment while audio blocks are generated (generate_audio_blocks
+        and streamed playback and saving built on it), so memory does not depend on message length.
+        Text and tokens of a streamed message are not kept, its length is unknown until
+        it is rendered and it can be rendered only once. It is neither looked up in
+        nor stored to the disk cache, whose key covers the whole message
+        """
+        self.__message = Message()
+        self.__message_stream = chunks
+        self.__stream_unknown_chars = set()
+        self.__cache_entry = None
+        
+        if self.__disk_cache is not None:
+            logger.warning(f"{self.__class__.__name__} streamed message bypasses the disk cache")
+        
+    @property
+    def unknown_characters(self):
+        """
+        Returns:
+            Unknown characters of the message; of a streamed message, only those read so far
+        """
+        if self.__message_stream is not None:
+            return self.__stream_unknown_chars
+        
+        return self.message_tokens.unknown_entries
+    
+    def __stream_segments(self):
+        # Tokenization runs inside the render stage of every block pulling a segment
+        for token_string in self.__tokenizer.tokenize_stream(self.__message_stream):
+            self.__stream_unknown_chars.update(token_string.unknown_entries)
+            yield token_string
         
     @property
     def message_tokens(self):
@@ -87,30 +171,155 @@ class App:
     
     @property
     def message_morse_codes(self):
+        if self.__message.morse_readable is None:
+            self.__message.morse_readable = self.__incremental_tokenizer.readable
+            
         return self.__message.morse_readable
     
     def generate_audio_data(self):
-        return self.__audio_sampler.produce_audio_data(self.__message.morse_tokens, MORSE_SAMPLER_TOKEN_CHUNK_SIZE)
+        """
+        In incremental mode, returned audio is a view that is changed by the next call
+        """
+        with registry.stage("render"):
+            if self.__incremental_render is None:
+                audio_data = self.__audio_sampler.produce_audio_data(self.__message.morse_tokens)
+            else:
+                for edit in self.__pending_edits:
+                    self.__incremental_render.apply(edit)
+                    
+                self.__pending_edits.clear()
+                audio_data = self.__incremental_render.audio_data
+            
+        registry.add_samples("render", audio_data.data.size)
+        return audio_data
+    
+    @contextmanager
+    def generate_audio_data_parallel(self, workers: int):
+        from cwi.parallel import produce_audio_data_parallel
+        
+        with ExitStack() as stack:
+            with registry.stage("render"):
+                audio_data = stack.enter_context(produce_audio_data_parallel(self.__audio_sampler, self.__message.morse_tokens, workers))
+                
+            registry.add_samples("render", audio_data.data.size)
+            yield audio_data
+    
+    def generate_audio_blocks(self, block_size: int):
+        if self.__message_stream is not None:
+            blocks = self.__audio_sampler.produce_stream_blocks(self.__stream_segments(), block_size)
+            return registry.iterate("render", blocks)
+        
+        token_string = self.__message.morse_tokens
+        
+        if self.__disk_cache is None:
+            blocks = self.__audio_sampler.produce_audio_blocks(token_string, block_size)
+            return registry.iterate("render", blocks)
+        
+        key, audio, _ = self.__disk_cache_entry()
+        
+        if audio is not None:
+            logger.info(f"Audio data loaded from disk cache: {key}")
+            return registry.iterate("disk_cache_load", chunked(audio, block_size))
+        
+        blocks = self.__audio_sampler.produce_audio_blocks(token_string, block_size)
+        blocks = self.__disk_cache.store_blocks(key, blocks, self.count_audio_samples(), self.__audio_sampler.peak, self.__audio_sampler.dtype)
+        return registry.iterate("render", blocks)
+    
+    def __disk_cache_entry(self):
+        """
+        Looks the message up in disk cache once per message
+        
+        Returns:
+            (key, audio, peak), audio and peak are None if the message is not cached
+        """
+        if self.__cache_entry is None:
+            token_string = self.__message.morse_tokens
+            key = self.__disk_cache.make_key(token_string, self.__tone_generator_type, self.__frequency, self.__sample_rate, self.__dit_duration)
+            audio = self.__disk_cache.load(key)
+            peak = self.__disk_cache.load_peak(key) if audio is not None else None
+            
+            if peak is None:
+                audio = None
+                
+            self.__cache_entry = (key, audio, peak)
+            
+        return self.__cache_entry
+    
+    def __is_cached(self):
+        return self.__disk_cache is not None and self.__message_stream is None and self.__disk_cache_entry()[1] is not None
+    
+    @property
+    def __peak(self):
+        return self.__disk_cache_entry()[2] if self.__is_cached() else self.__audio_sampler.peak
+    
+    def generate_int16_blocks(self, block_size: int):
+        """
+        Same as generate_audio_blocks, but every block is converted to int16 in one reused buffer
+        """
+        peak = self.__peak
+        buffer = np.empty(block_size, dtype=np.int16)
+        
+        for block in self.generate_audio_blocks(block_size):
+            with registry.stage("convert", block.size):
+                converted = AudioData(block, peak).to_int16(buffer[:block.size])
+            yield converted
+    
+    def count_audio_samples(self):
+        """
+        Returns:
+            Sample count of the message audio, None for a streamed message
+        """
+        if self.__message_stream is not None:
+            return None
+        if self.__is_cached():
+            return self.__disk_cache_entry()[1].size
+        
+        return self.__audio_sampler.count_samples(self.__message.morse_tokens)
+    
+    def count_audio_blocks(self, block_size: int):
+        return -(-self.count_audio_samples() // block_size)
     
     def play_audio_data(self, audio_data: AudioData):
-        audio_device = PyAudio()
-        stream = audio_device.open(self.__sample_rate, 1, pyaudio.paFloat32, output=True)
+        with registry.stage("convert", audio_data.data.size):
+            audio_data_f32 = audio_data.as_float32
+        
+        self.__play_blocks(chunked(audio_data_f32, PLAYBACK_BUFFER_SIZE), audio_data_f32.size)
+        
+    def play_audio_stream(self):
+        peak = self.__peak
+        buffer = np.empty(PLAYBACK_BUFFER_SIZE, dtype=np.float32)
+        
+        def blocks():
+            for block in self.generate_audio_blocks(PLAYBACK_BUFFER_SIZE):
+                with registry.stage("convert", block.size):
+                    converted = AudioData(block, peak).to_float32(buffer[:block.size])
+                yield converted
+        
+        self.__play_blocks(blocks(), self.count_audio_samples())
+    
+    def __play_blocks(self, blocks: Iterable[npt.NDArray[np.float32]], total_frames: int | None):
+        import pyaudio
+        from cwi.playback import CallbackPlayer
+        
+        audio_device = pyaudio.PyAudio()
         
         logger.debug(f"{audio_device.get_default_host_api_info()=}")
         logger.debug(f"{audio_device.get_default_output_device_info()=}")
-        logger.debug(f"{stream.get_output_latency()=}")
-
-        audio_data_f32 = audio_data.as_float32
-        chunks = np.array_split(audio_data_f32, audio_data_f32.size / PLAYBACK_BUFFER_SIZE)
-        progress = Progress("[green]|>", TimeElapsedColumn(), SpinnerColumn("point", finished_text="[gray50]___"), console=console)
+        
+        def open_stream(callback):
+            stream = audio_device.open(self.__sample_rate, 1, pyaudio.paFloat32, output=True, start=False,
+                                       frames_per_buffer=PLAYBACK_BUFFER_SIZE, stream_callback=callback)
+            logger.debug(f"{stream.get_output_latency()=}")
+            return stream
+        
+        player = CallbackPlayer(open_stream, PLAYBACK_BUFFER_SIZE, PLAYBACK_RING_BUFFER_SIZE)
+        progress = ui.playback_progress()
 
         try:
             logger.info(f"Playing audio data...")
-            with progress:
-                task = progress.add_task("playing", total=len(chunks))
-                for chunk in chunks:
-                    stream.write(chunk.tobytes())
-                    progress.update(task, advance=1)
+            with progress, registry.stage("playback", total_frames or 0):
+                task = progress.add_task("playing", total=total_frames)
+                statistics = player.play(blocks, lambda frames: progress.update(task, completed=frames))
 
         except Exception:
             logger.exception("PyAudio unknown Error")
@@ -120,31 +329,103 @@ class App:
             
         else:
             logger.info("Playback completed successfully")
+            logger.debug(f"{statistics}")
+            
+            if total_frames is None:
+                registry.add_samples("playback", statistics.frames_played)
+            
+            if statistics.underruns:
+                logger.warning(f"Playback underruns: {statistics.underruns} ({statistics.underrun_frames} frames)")
+                console.print(f"[yellow]Playback underruns: {statistics.underruns}")
             
         finally:
-            stream.close()
             audio_device.terminate()
             
-            logger.debug(f"Stream closed, PyAudio device terminated")
+            logger.debug(f"PyAudio device terminated")
             
-    def save_audio_data(self, audio_data: AudioData, path: str):   
+    def save_audio_data(self, audio_data: AudioData, path: str):
+        with registry.stage("convert", audio_data.data.size):
+            audio_data_i16 = audio_data.as_int16
+        
+        return self.__save_blocks(chunked(audio_data_i16, SAVING_BUFFER_SIZE), audio_data_i16.size, path)
+        
+    def save_audio_stream(self, path: str, show_progress: bool = True):
+        return self.__save_blocks(self.generate_int16_blocks(SAVING_BUFFER_SIZE), self.count_audio_samples(), path, show_progress)
+        
+    def __save_blocks(self, blocks: Iterable[npt.NDArray[np.int16]], total_samples: int | None, path: str, show_progress: bool = True):
+        """
+        Writes blocks as WAV file or, if path is "-", as raw encoded samples to stdout.
+        If total_samples is unknown (None), WAV header is written when all blocks are saved
+        
+        Returns:
+            True if all blocks were saved
+        """
         try:
             logger.info(f"Writing audio data to {path=}...")
-            with wav.open(path, "w") as wav_file:
+            
+            to_stdout = path == STDOUT_PATH
+            
+            encoder = ENCODERS[self.__audio_format]()
+            
+            if to_stdout:
+                file = sys.stdout.buffer
+                writer = PcmWriter(file, encoder)
+            else:
+                file = open(path, "wb")
+                writer = WavWriter(file, self.__sample_rate, total_samples or 0, encoder)
                 
-                wav_file.setnchannels(1)
-                wav_file.setsampwidth(2)
-                wav_file.setframerate(self.__sample_rate)
+            progress = ui.saving_progress(path, disable=not show_progress)
+            
+            try:
+                with progress, writer:
+                    task = progress.add_task("saving", total=total_samples)
+                    for block in blocks:
+                        with registry.stage("write", block.size):
+                            writer.write(block)
+                        progress.advance(task, block.size)
+            finally:
+                if not to_stdout:
+                    file.close()
+                        
+        except OSError:
+            logger.exception("Unexpected OS Exception")
+            
+        except KeyboardInterrupt:
+            logger.info("Saving interrupted")
+            
+        else:
+            logger.info("Saving completed successfully")
+            return True
+        
+        return False
+                    
+    def save_audio_mapped(self, path: str, show_progress: bool = True):
+        """
+        Renders int16 samples straight into a memory-mapped PCM16 WAV file of exact final size,
+        so memory use does not depend on message length
+        
+        Returns:
+            True if the file was written
+        """
+        if self.__int16_sampler is None:
+            self.__int16_sampler = MorseAudioSampler(self.__tone_generator, self.__dit_duration, dtype=np.int16)
+            
+        token_string = self.__message.morse_tokens
+        total_samples = self.__int16_sampler.count_samples(token_string)
+        progress = ui.saving_progress(path, disable=not show_progress)
+        
+        try:
+            logger.info(f"Rendering audio data into memory-mapped {path=}...")
+            
+            with progress, MappedWavWriter(path, self.__sample_rate, total_samples) as writer, registry.stage("render", total_samples):
+                task = progress.add_task("saving", total=total_samples)
+                windows = self.__int16_sampler.render_windows_into(token_string, writer.samples, MAPPED_WINDOW_TOKENS)
                 
-                audio_data_i16 = audio_data.as_int16
-                chunks = np.array_split(audio_data_i16, audio_data_i16.size / SAVING_BUFFER_SIZE)
-                progress = Progress(f"[gray50]{path}",  MofNCompleteColumn(), SpinnerColumn("line", finished_text="[gray50]Complete"), console=console)
-
-                with progress:
-                    task = progress.add_task("saving", total=len(chunks))
-                    for chunk in chunks:
-                        wav_file.writeframes(chunk)
-                        progress.advance(task, 1)
+                # Closing the generator drops its view of the map before the writer is closed
+                with closing(windows):
+                    for written in windows:
+                        writer.release(written)
+                        progress.update(task, completed=written)
                         
         except OSError:
             logger.exception("Unexpected OS Exception")
@@ -154,6 +435,9 @@ class App:
             
         else:
             logger.info("Saving completed successfully")
+            return True
+        
+        return False
                     
     def print_app_info(self):
         console.print(f"WPM: {self.__wpm}")
@@ -175,14 +459,15 @@ class App:
         console.print(wrapper.fill(self.message_morse_codes))
             
     def print_unknown_characters(self):
-        if self.message_tokens.unknown_entries:
+        if self.unknown_characters:
             console.rule("Warning", style="bold yellow")
             console.line()
-            console.print(f"Unknown characters found in message: [yellow]{' '.join(self.message_tokens.unknown_entries)}")
+            console.print(f"Unknown characters found in message: [yellow]{' '.join(self.unknown_characters)}")
             console.line()
             console.rule("Warning", style="bold yellow")
             
-    def print_no_input(self):
+    @staticmethod
+    def print_no_input():
         console.rule("CRITICAL", style="bold red")
         console.line()
         console.print("[bold red]No input provided")
@@ -190,118 +475,743 @@ class App:
         console.rule("CRITICAL", style="bold red")
 
 
-@click.command()
+class DefaultCommandGroup(click.Group):
+    """
+    Command group that invokes the default command
+    if the first argument is not a name of a known command
+    """
+    
+    def __init__(self, *args, default_command: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__default_command = default_command
+        
+    def parse_args(self, ctx: click.Context, args: list[str]):
+        if not args or (args[0] not in self.commands and args[0] not in self.get_help_option_names(ctx)):
+            args.insert(0, self.__default_command)
+            
+        return super().parse_args(ctx, args)
+
+
+def audio_options(command):
+    options = (
+        click.option(
+            "--tone-generator-type",
+            "-t",
+            type=click.Choice(
+                [
+                    ToneGeneratorType.SINE.value,
+                    ToneGeneratorType.SAW.value,
+                    ToneGeneratorType.TRIANGLE.value,
+                    ToneGeneratorType.SQUARE.value,
+                ]
+            ),
+            default=ToneGeneratorType.SINE,
+            help=f"Type of audio tone generator used",
+            show_default=True
+        ),
+        click.option(
+            "--frequency", "-f", 
+            type=click.FloatRange(80, 8000),
+            default=800,
+            help="Audio tone generator frequency",
+            show_default=True
+        ),
+        click.option(
+            "--sample-rate", "-r", 
+            type=click.IntRange(8000, 96000), 
+            default=44100,
+            help="Audio output sampling rate (for playback device and WAV file)",
+            show_default=True
+        ),
+        click.option(
+            "--words-per-minute", "-w", 
+            type=click.IntRange(5, 30),
+            default=20,
+            help="Determines the duration of each Morse signal",
+            show_default=True
+        ),
+        click.option(
+            "--debug", is_flag=True, default=False, 
+            help="Show debug information?",
+            show_default=True
+        ),
+        click.option(
+            "--quiet", "-q", is_flag=True, default=False,
+            help="Print nothing but errors and requested output, without rich terminal UI",
+            show_default=True
+        ),
+        click.option(
+            "--format", "audio_format",
+            type=click.Choice([audio_format.value for audio_format in AudioFormat]),
+            default=AudioFormat.PCM16.value,
+            help="Encoding of saved audio: 16-bit PCM, 8-bit unsigned PCM, G.711 mu-law or IMA-ADPCM WAV",
+            show_default=True
+        ),
+        click.option(
+            "--cache-dir",
+            type=click.Path(file_okay=False, writable=True),
+            envvar="CWI_CACHE_DIR",
+            help="Directory of the persistent render cache. Can also be set with CWI_CACHE_DIR [Optional]",
+        ),
+        click.option(
+            "--no-cache", is_flag=True, default=False,
+            help="Disable the persistent render cache",
+            show_default=True
+        ),
+    )
+    
+    for option in reversed(options):
+        command = option(command)
+        
+    return command
+
+
+def setup_logging(debug: bool, use_stderr: bool = False, quiet: bool = False):
+    """
+    use_stderr moves console and log output off stdout, e.g. when stdout carries audio.
+    quiet (or output that is not a terminal) skips rich entirely
+    """
+    ui.configure(quiet, use_stderr, silent_console=debug)
+    
+    if debug:
+        loguru_logger = logger.enable()
+        loguru_logger.remove()
+        loguru_logger.add(ui.log_sink(), level="DEBUG", format=CONSOLE_FORMAT)
+        logger.debug("Logger initialized")
+
+
+def print_metrics(metrics_format: str, use_stderr: bool = False):
+    import json
+    
+    metrics = registry.as_dict()
+    
+    if metrics_format == "json":
+        click.echo(json.dumps(metrics, indent=2), err=use_stderr)
+        return
+    
+    columns = ("stage", "calls", "wall s", "cpu s", "alloc MiB", "samples", "samples/s")
+    rows = [
+        (name, str(stage["calls"]), f"{stage['wall_time']:.4f}", f"{stage['cpu_time']:.4f}",
+         f"{stage['bytes_allocated'] / 2 ** 20:.2f}" if stage["bytes_allocated"] is not None else "-",
+         str(stage["samples"]), f"{stage['samples_per_second']:.0f}")
+        for name, stage in metrics["stages"].items()
+    ]
+    caches = [f"{name}: {cache['hits']} hits, {cache['misses']} misses, hit rate {cache['hit_rate']:.2%}"
+              for name, cache in metrics["caches"].items()]
+    
+    if ui.is_plain():
+        for row in (columns, *rows):
+            click.echo(" ".join(f"{cell:>16}" for cell in row), err=use_stderr)
+        for line in caches:
+            click.echo(line, err=use_stderr)
+        return
+    
+    from rich.console import Console
+    from rich.table import Table
+    
+    table = Table(*columns, title="Metrics")
+    for row in rows:
+        table.add_row(*row)
+        
+    metrics_console = Console(stderr=use_stderr)
+    metrics_console.print(table)
+    for line in caches:
+        metrics_console.print(line)
+
+
+@click.group(cls=DefaultCommandGroup, default_command="render")
+def cli():
+    """
+    CLI morse audio generator. Runs `render` if no command is given
+    """
+
+
+@cli.command()
 @click.argument("message", nargs=-1)
+@audio_options
 @click.option(
-    "--tone-generator-type",
-    "-t",
-    type=click.Choice(
-        [
-            ToneGeneratorType.SINE.value,
-            ToneGeneratorType.SAW.value,
-            ToneGeneratorType.TRIANGLE.value,
-            ToneGeneratorType.SQUARE.value,
-        ]
-    ),
-    default=ToneGeneratorType.SINE,
-    help=f"Type of audio tone generator used",
-    show_default=True
+    "--input-file", "-i",
+    type=click.File("r", encoding="UTF-8"),
+    help="The file to read message from, - for stdin. If specified, the MESSAGE argument will be ignored. "
+         "Unless the whole message is needed (--jobs, --mmap, persistent cache), it is read, rendered and written "
+         "in chunks with bounded memory [Optional] [Encoding: UTF-8]",
 )
 @click.option(
-    "--frequency", "-f", 
-    type=click.FloatRange(80, 8000),
-    default=800,
-    help="Audio tone generator frequency",
-    show_default=True
+    "--output-file", "-o",
+    type=click.Path(exists=False, writable=True),
+    help="The file to write audio to. If specified, audio will be written to the output file rather than played back. "
+         "Use - to write raw PCM (signed 16-bit little-endian, mono) to stdout [Optional]",
 )
 @click.option(
-    "--sample-rate", "-r", 
-    type=click.IntRange(8000, 96000), 
-    default=44100,
-    help="Audio output sampling rate (for playback device and WAV file)",
+    "--jobs", "-j",
+    type=click.IntRange(1),
+    default=1,
+    help="Number of processes rendering the message in parallel. Values above 1 render the whole message before output",
     show_default=True
 )
 @click.option(
-    "--words-per-minute", "-w", 
-    type=click.IntRange(5, 30),
-    default=20,
-    help="Determines the duration of each Morse signal",
+    "--mmap", "memory_mapped", is_flag=True, default=False,
+    help="Render int16 samples straight into a memory-mapped WAV file of exact final size, "
+         "keeping memory use bounded for outputs larger than RAM (pcm16 only)",
     show_default=True
 )
 @click.option(
-    "--debug", is_flag=True, default=False, 
-    help="Show debug information?",
-    show_default=True
-)
-@click.option(
-    "--input-file", "-i",
-    type=click.File("r", encoding="UTF-8"),
-    help="The file to read message from. If specified, the MESSAGE argument will be ignored [Optional] [Encoding: UTF-8]",
+    "--metrics", "metrics_format",
+    type=click.Choice(["json", "table"]),
+    help="Print wall time, CPU time, samples and cache hit rate of every stage when done [Optional]",
 )
 @click.option(
-    "--output-file", "-o",
-    type=click.Path(exists=False, writable=True),
-    help="The file to write audio to. If specified, audio will be written to the output file rather than played back [Optional]",
+    "--profile",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Run under cProfile and tracemalloc, write PROFILE.prof and PROFILE.memory.txt. "
+         "Also adds allocated bytes to --metrics [Optional]",
 )
-def cli(
+def render(
     message: tuple[str],
     tone_generator_type: str,
     frequency: float,
     sample_rate: int,
     words_per_minute: int,
     debug: bool,
+    quiet: bool,
+    audio_format: str,
+    cache_dir: str,
+    no_cache: bool,
     input_file: TextIO,
     output_file: str,
+    jobs: int,
+    memory_mapped: bool,
+    metrics_format: str,
+    profile: str,
 ):
-    log_level = "DEBUG" if debug else "NOSHOW"
-    logger.add(RichHandler(), level=log_level, format=CONSOLE_FORMAT)
-    logger.debug("Logger initialized")
+    """
+    Play MESSAGE or save it to a WAV file
+    """
+    setup_logging(debug, use_stderr=output_file == STDOUT_PATH, quiet=quiet)
     
-    if debug:
-        console.quiet = True
+    context = click.get_current_context()
+    registry.enabled = bool(metrics_format or profile)
+    
+    if metrics_format:
+        context.call_on_close(partial(print_metrics, metrics_format, use_stderr=output_file == STDOUT_PATH))
+    if profile:
+        from cwi.metrics import profiled
+        context.with_resource(profiled(profile))
     
     total_timer = Timer("Total").tic()
     
-    app = App(tone_generator_type, frequency, sample_rate, words_per_minute)
+    if output_file == STDOUT_PATH and audio_format == AudioFormat.IMA_ADPCM:
+        raise click.UsageError(f"{AudioFormat.IMA_ADPCM} output requires a WAV file")
+    if memory_mapped and (not output_file or output_file == STDOUT_PATH):
+        raise click.UsageError("--mmap requires a WAV output file")
+    if memory_mapped and audio_format != AudioFormat.PCM16:
+        raise click.UsageError(f"--mmap supports only {AudioFormat.PCM16} output")
+    if memory_mapped and jobs > 1:
+        raise click.UsageError("--mmap cannot be combined with --jobs")
+    
+    use_cache = bool(cache_dir) and not no_cache
+    app = App(tone_generator_type, frequency, sample_rate, words_per_minute, cache_dir if use_cache else None, audio_format)
+    
+    # Cache key covers the whole message, so cached input is read whole to be looked up
+    streamed = input_file is not None and jobs == 1 and not memory_mapped and not use_cache
+    
+    if input_file is not None and use_cache:
+        logger.info(f"Persistent cache enabled, {input_file.name=} is read whole instead of streamed (--no-cache streams it)")
 
-    if input_file:
-        message_str = input_file.read()
+    if streamed:
+        chunks = iter(partial(input_file.read, INPUT_CHUNK_SIZE), "")
+        # Whitespace-only chunks are read ahead, so empty input is reported before output is opened
+        first_chunk = next((chunk for chunk in chunks if not chunk.isspace()), "")
+        message_str = first_chunk.strip()
+        logger.info(f"Message streamed from {input_file.name=}")
+    elif input_file:
+        message_str = input_file.read().strip()
         logger.info(f"Message read from {input_file.name=}")
     else:
-        message_str = " ".join(message)
-        
-    message_str = message_str.strip()
+        message_str = " ".join(message).strip()
     
     if len(message_str) == 0:
         logger.critical("Cannot proceed without message!")
         app.print_no_input()
         exit(0)
-        
-    logger.info(f"Command invoked with message: {message_str}")
     
-    app.message = message_str
-
     app.print_app_info()
     console.line()
-    app.print_message_details()
-    console.rule(style="gray50")
-    app.print_unknown_characters()
+    
+    if streamed:
+        app.stream_message(chain((first_chunk,), chunks))
+        console.print(f"[bold]Input:[/] {input_file.name}")
+        console.rule(style="gray50")
+    else:
+        logger.info(f"Command invoked with message: {message_str}")
+        app.message = message_str
+        app.print_message_details()
+        console.rule(style="gray50")
+        app.print_unknown_characters()
     
     audio_timer = Timer("AudioDataProcessing").tic()
     
-    with console.status("[gray50]Generating audio...", spinner="line2"):
-        audio_data = app.generate_audio_data()
+    if jobs > 1:
+        with app.generate_audio_data_parallel(jobs) as audio_data:
+            if output_file:
+                app.save_audio_data(audio_data, output_file)
+            else:
+                app.play_audio_data(audio_data)
+            del audio_data
+    elif memory_mapped:
+        app.save_audio_mapped(output_file)
+    elif output_file:
+        app.save_audio_stream(output_file)
+    else:
+        app.play_audio_stream()
+    
+    if streamed:
+        app.print_unknown_characters()
         
     logger.debug(f"{audio_timer} -> {audio_timer.toc()=}s")
-    
-    if output_file:
-        app.save_audio_data(audio_data, output_file)
-    else:
-        app.play_audio_data(audio_data)
+    for name, statistics in app.audio_cache_statistics.items():
+        logger.debug(f"{name} cache: {statistics} -> {statistics.hit_rate=:.2%}")
+        registry.record_cache(f"{name}_cache", statistics)
     
     logger.debug(f"{total_timer} -> {total_timer.toc()=}s")
     console.print(f"[gray50] Completed in {total_timer.toc():.2f}s", justify="right")
 
 
+@cli.command()
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@audio_options
+@click.option(
+    "--jobs", "-j",
+    type=click.IntRange(1),
+    default=os.cpu_count(),
+    help="Number of worker processes",
+    show_default=True
+)
+def batch(
+    manifest: str,
+    tone_generator_type: str,
+    frequency: float,
+    sample_rate: int,
+    words_per_minute: int,
+    debug: bool,
+    quiet: bool,
+    audio_format: str,
+    cache_dir: str,
+    no_cache: bool,
+    jobs: int,
+):
+    """
+    Render every message of MANIFEST to its own WAV file.
+    
+    MANIFEST lines are either JSON objects {"message": ..., "output": ...}
+    or OUTPUT<TAB>MESSAGE pairs
+    """
+    from cwi.batch import read_manifest, render_batch
+    
+    setup_logging(debug, quiet=quiet)
+    
+    try:
+        batch_jobs = read_manifest(manifest)
+    except ValueError:
+        logger.exception(f"Invalid manifest: {manifest}")
+        ui.error(f"[bold red]Invalid manifest: {manifest}")
+        exit(1)
+    
+    app_factory = partial(App, tone_generator_type, frequency, sample_rate, words_per_minute, None if no_cache else cache_dir, audio_format)
+    progress = ui.batch_progress(manifest)
+    
+    with progress:
+        task = progress.add_task("rendering", total=len(batch_jobs))
+        report = render_batch(app_factory, batch_jobs, jobs, on_complete=lambda: progress.advance(task, 1))
+        
+    logger.debug(f"{report}")
+    
+    console.print(f"Messages: {report.messages} ([red]{report.failed} failed[/])")
+    console.print(f"Audio: {report.audio_seconds:.2f}s")
+    console.print(f"Throughput: {report.messages_per_second:.2f} msg/s, {report.audio_seconds_per_second:.2f} audio s/s")
+    console.print(f"[gray50] Completed in {report.elapsed:.2f}s", justify="right")
+
+
+@cli.command()
+@click.argument("message", nargs=-1)
+@click.option(
+    "--input-file", "-i",
+    type=click.File("r", encoding="UTF-8"),
+    help="The file to read message from, - for stdin. If specified, the MESSAGE argument will be ignored [Optional] [Encoding: UTF-8]",
+)
+@click.option(
+    "--output-dir", "-o",
+    type=click.Path(file_okay=False, writable=True),
+    required=True,
+    help="Directory of rendered WAV files, named TONE_FREQUENCYhz_WPMwpm.wav",
+)
+@click.option(
+    "--tone-generator-type", "-t", "tones",
+    type=click.Choice([tone.value for tone in ToneGeneratorType]),
+    multiple=True,
+    default=[ToneGeneratorType.SINE.value],
+    help="Type of audio tone generator. Repeat to render every type",
+    show_default=True
+)
+@click.option(
+    "--frequency", "-f", "frequencies",
+    type=click.FloatRange(80, 8000),
+    multiple=True,
+    default=[800],
+    help="Audio tone generator frequency. Repeat to render every frequency",
+    show_default=True
+)
+@click.option(
+    "--words-per-minute", "-w", "speeds",
+    type=click.IntRange(5, 30),
+    multiple=True,
+    default=[20],
+    help="Morse speed. Repeat to render every speed",
+    show_default=True
+)
+@click.option(
+    "--sample-rate", "-r", 
+    type=click.IntRange(8000, 96000), 
+    default=44100,
+    help="Audio output sampling rate",
+    show_default=True
+)
+@click.option(
+    "--format", "audio_format",
+    type=click.Choice([audio_format.value for audio_format in AudioFormat]),
+    default=AudioFormat.PCM16.value,
+    help="Encoding of saved audio: 16-bit PCM, 8-bit unsigned PCM, G.711 mu-law or IMA-ADPCM WAV",
+    show_default=True
+)
+@click.option(
+    "--jobs", "-j",
+    type=click.IntRange(1),
+    default=1,
+    help="Number of worker processes",
+    show_default=True
+)
+@click.option(
+    "--debug", is_flag=True, default=False, 
+    help="Show debug information?",
+    show_default=True
+)
+@click.option(
+    "--quiet", "-q", is_flag=True, default=False,
+    help="Print nothing but errors, without rich terminal UI",
+    show_default=True
+)
+def grid(
+    message: tuple[str],
+    input_file: TextIO,
+    output_dir: str,
+    tones: tuple[str],
+    frequencies: tuple[float],
+    speeds: tuple[int],
+    sample_rate: int,
+    audio_format: str,
+    jobs: int,
+    debug: bool,
+    quiet: bool,
+):
+    """
+    Render MESSAGE with every combination of tone, frequency and speed.
+    
+    The message is tokenized once and variants of one speed are rendered in one pass,
+    e.g. cwi grid "cq de test" -o out -t sine -t square -f 600 -f 800 -w 15 -w 25
+    """
+    from cwi.grid import GridRenderer, render_grid, variant_file_name
+    
+    setup_logging(debug, quiet=quiet)
+    
+    message_str = (input_file.read() if input_file else " ".join(message)).strip()
+    
+    if len(message_str) == 0:
+        logger.critical("Cannot proceed without message!")
+        App.print_no_input()
+        exit(0)
+    
+    # Repeated values of an option would render the same file twice
+    variants = list(dict.fromkeys(RenderVariant(tone, frequency, wpm) for tone, frequency, wpm in product(tones, frequencies, speeds)))
+    renderer = GridRenderer(message_str, variants, sample_rate)
+    
+    if renderer.token_string.unknown_entries:
+        console.print(f"Unknown characters found in message: [yellow]{' '.join(renderer.token_string.unknown_entries)}")
+    
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = [os.path.join(output_dir, variant_file_name(variant)) for variant in variants]
+    progress = ui.batch_progress(output_dir)
+    
+    with progress:
+        task = progress.add_task("rendering", total=len(variants))
+        report = render_grid(renderer, outputs, jobs, audio_format, on_complete=lambda: progress.advance(task, 1))
+        
+    logger.debug(f"{report}")
+    
+    console.print(f"Variants: {report.messages} ([red]{report.failed} failed[/]), {len(renderer.groups)} speeds")
+    console.print(f"Audio: {report.audio_seconds:.2f}s")
+    console.print(f"Throughput: {report.messages_per_second:.2f} variants/s, {report.audio_seconds_per_second:.2f} audio s/s")
+    console.print(f"[gray50] Completed in {report.elapsed:.2f}s", justify="right")
+
+
+@cli.command()
+@click.argument("input_file", type=click.File("rb"))
+@click.option(
+    "--frequency", "-f", 
+    type=click.FloatRange(80, 8000),
+    default=800,
+    help="Tone frequency to detect",
+    show_default=True
+)
+@click.option(
+    "--sample-rate", "-r", 
+    type=click.IntRange(8000, 96000), 
+    help="Sample rate of --raw input, WAV files carry their own",
+)
+@click.option(
+    "--words-per-minute", "-w", 
+    type=click.IntRange(5, 30),
+    help="Morse speed of the input. Estimated from the audio if not specified [Optional]",
+)
+@click.option(
+    "--raw", is_flag=True, default=False,
+    help="Input is raw PCM (signed 16-bit little-endian, mono) instead of a WAV file",
+    show_default=True
+)
+@click.option(
+    "--tokens", is_flag=True, default=False,
+    help="Print morse tokens instead of text",
+    show_default=True
+)
+@click.option(
+    "--debug", is_flag=True, default=False, 
+    help="Show debug information?",
+    show_default=True
+)
+@click.option(
+    "--quiet", "-q", is_flag=True, default=False,
+    help="Print nothing but decoded text and errors, without rich terminal UI",
+    show_default=True
+)
+def decode(
+    input_file: BinaryIO,
+    frequency: float,
+    sample_rate: int,
+    words_per_minute: int,
+    raw: bool,
+    tokens: bool,
+    debug: bool,
+    quiet: bool,
+):
+    """
+    Decode morse audio of INPUT_FILE (WAV or raw PCM, - for stdin) back to text
+    """
+    from cwi.const.service import DECODER_BLOCK_SIZE
+    from cwi.decoder import MorseDecoder
+    from cwi.readers import PcmReader, WavReader
+    
+    setup_logging(debug, use_stderr=True, quiet=quiet)
+    
+    if raw and sample_rate is None:
+        raise click.UsageError("--raw input requires --sample-rate")
+    
+    try:
+        reader = PcmReader(input_file, sample_rate) if raw else WavReader(input_file)
+    except ValueError as error:
+        logger.exception(f"Cannot read {input_file.name}")
+        ui.error(f"[bold red]Cannot read {input_file.name}: {error}")
+        exit(1)
+        
+    dit_duration = 1.2 / words_per_minute if words_per_minute else None
+    decoder = MorseDecoder(frequency, reader.sample_rate, dit_duration)
+    blocks = reader.blocks(DECODER_BLOCK_SIZE)
+    
+    timer = Timer("Decoding").tic()
+    
+    for piece in decoder.decode_tokens(blocks) if tokens else decoder.decode_text(blocks):
+        click.echo(piece, nl=False)
+    click.echo()
+    
+    logger.debug(f"{timer} -> {timer.toc()=}s")
+    
+    if decoder.dit_duration:
+        console.print(f"[gray50]Dit: {decoder.dit_duration * 1000:.1f}ms ({1.2 / decoder.dit_duration:.1f} WPM)")
+    console.print(f"[gray50]Decoded {decoder.duration:.2f}s of audio in {timer.toc():.2f}s "
+                  f"({decoder.duration / max(timer.toc(), 1e-9):.0f}x realtime)", justify="right")
+
+
+def server_address_options(command):
+    options = (
+        click.option(
+            "--socket", "socket_path",
+            type=click.Path(dir_okay=False),
+            help="Unix socket path. If specified, --host and --port are ignored [Optional]",
+        ),
+        click.option(
+            "--host",
+            default=SERVER_HOST,
+            help="Server TCP host",
+            show_default=True
+        ),
+        click.option(
+            "--port",
+            type=click.IntRange(1, 65535),
+            default=SERVER_PORT,
+            help="Server TCP port",
+            show_default=True
+        ),
+    )
+    
+    for option in reversed(options):
+        command = option(command)
+        
+    return command
+
+
+@cli.command()
+@server_address_options
+@click.option(
+    "--workers",
+    type=click.IntRange(1),
+    help="Number of render threads [Default: Python executor default]",
+)
+@click.option(
+    "--max-apps",
+    type=click.IntRange(1),
+    default=SERVER_MAX_APPS,
+    help="Number of warm (tone, frequency, sample rate, WPM) configurations kept in memory",
+    show_default=True
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, writable=True),
+    envvar="CWI_CACHE_DIR",
+    help="Directory of the persistent render cache. Can also be set with CWI_CACHE_DIR [Optional]",
+)
+@click.option(
+    "--debug", is_flag=True, default=False, 
+    help="Show debug information?",
+    show_default=True
+)
+@click.option(
+    "--quiet", "-q", is_flag=True, default=False,
+    help="Print nothing but errors, without rich terminal UI",
+    show_default=True
+)
+def serve(socket_path: str, host: str, port: int, workers: int, max_apps: int, cache_dir: str, debug: bool, quiet: bool):
+    """
+    Run render daemon that keeps renderers warm between requests
+    """
+    import asyncio
+    from cwi.server import RenderServer
+    
+    setup_logging(debug, quiet=quiet)
+    
+    app_factory = partial(App, cache_dir=cache_dir)
+    server = RenderServer(app_factory, max_apps, workers)
+    address = socket_path or (host, port)
+    
+    console.print(f"Serving on [bold]{address}[/]")
+    
+    try:
+        asyncio.run(server.serve(address))
+    except KeyboardInterrupt:
+        logger.info("Server interrupted")
+    except OSError:
+        logger.exception(f"Cannot serve on {address}")
+        ui.error(f"[bold red]Cannot serve on {address}")
+        exit(1)
+        
+    statistics = server.statistics
+    logger.debug(f"{statistics}")
+    
+    console.print(f"Requests: {statistics.requests} ([red]{statistics.failed} failed[/])")
+    console.print(f"Latency: {statistics.latency_mean * 1000:.2f}ms mean, {statistics.latency_max * 1000:.2f}ms max, "
+                  f"{statistics.first_byte_latency_mean * 1000:.2f}ms to first byte")
+    console.print(f"Throughput: {statistics.requests_per_second:.2f} req/s, {statistics.bytes_per_second / 2 ** 20:.2f} MiB/s")
+
+
+@cli.command()
+@click.argument("message", nargs=-1)
+@audio_options
+@server_address_options
+@click.option(
+    "--output-file", "-o",
+    type=click.Path(exists=False, writable=True),
+    default=STDOUT_PATH,
+    help="The file to write audio to. Use - to write to stdout",
+    show_default=True
+)
+@click.option(
+    "--raw", is_flag=True, default=False,
+    help="Receive raw samples instead of a WAV file",
+    show_default=True
+)
+@click.option(
+    "--stats", is_flag=True, default=False,
+    help="Print server latency and throughput counters instead of rendering",
+    show_default=True
+)
+def client(
+    message: tuple[str],
+    tone_generator_type: str,
+    frequency: float,
+    sample_rate: int,
+    words_per_minute: int,
+    debug: bool,
+    quiet: bool,
+    audio_format: str,
+    cache_dir: str,
+    no_cache: bool,
+    socket_path: str,
+    host: str,
+    port: int,
+    output_file: str,
+    raw: bool,
+    stats: bool,
+):
+    """
+    Render MESSAGE on a running `cwi serve` daemon.
+    Cache options are ignored, the daemon uses its own
+    """
+    import json
+    from cwi.server import connect, send_request
+    
+    setup_logging(debug, use_stderr=output_file == STDOUT_PATH, quiet=quiet)
+    
+    address = socket_path or (host, port)
+    request = {"command": "stats"} if stats else {
+        "message": " ".join(message).strip(),
+        "tone": tone_generator_type,
+        "frequency": frequency,
+        "sample_rate": sample_rate,
+        "words_per_minute": words_per_minute,
+        "audio_format": audio_format,
+        "wav": not raw,
+    }
+    
+    timer = Timer("Request").tic()
+    
+    try:
+        with connect(address) as connection:
+            if stats:
+                header = send_request(connection, request)
+                click.echo(json.dumps(header, indent=2))
+                return
+            
+            if output_file == STDOUT_PATH:
+                header = send_request(connection, request, sys.stdout.buffer)
+                sys.stdout.buffer.flush()
+            else:
+                with open(output_file, "wb") as file:
+                    header = send_request(connection, request, file)
+    except (OSError, RuntimeError) as error:
+        logger.exception(f"Request to {address} failed")
+        ui.error(f"[bold red]Request to {address} failed: {error}")
+        exit(1)
+        
+    logger.debug(f"{header} -> {timer.toc()=}s")
+    console.print(f"[gray50] {header['samples']} samples received in {timer.toc():.3f}s", justify="right")
+
+
 if __name__ == "__main__":
     cli()
@@ -1,55 +1,356 @@
-from functools import lru_cache
+from itertools import chain
+from typing import Iterable
 
 import numpy as np
-from loguru import logger
+import numpy.typing as npt
 
-from cwi.const.service import MORSE_SAMPLER_CACHE_SIZE
-from cwi.data_structures import TokenString, MorseToken, AudioData
+from cwi.log import logger
+from cwi.const.service import MORSE_SAMPLER_CACHE_MAX_BYTES, MORSE_SAMPLER_GATHER_BATCH_SIZE, MORSE_SAMPLER_GLYPH_CACHE_MAX_BYTES
+from cwi.const.service import MORSE_SAMPLER_WORD_MIN_OCCURRENCES, MORSE_SAMPLER_WORD_COUNTS_MAX
+from cwi.cache import AudioCache
+from cwi.data_structures import TokenString, TokenEdit, MorseToken, AudioData
+from cwi.metrics import registry
 from cwi.tone_generators import ToneGenerator, SilenceGenerator
-from cwi.utils import chunked
+from cwi.utils import chunked, SpliceBuffer
 
 
 class MorseAudioSampler:
-    def __init__(self, tone_generator: ToneGenerator, time_unit):
-        silence_generator = SilenceGenerator.copy_of(tone_generator)
-
-        dit_tone = tone_generator.sound(time_unit)
-        dah_tone = tone_generator.sound(time_unit * 3)
-        intra_character_pause = silence_generator.sound(time_unit)
-        inter_character_pause = silence_generator.sound(time_unit * 3)
-        inter_word_pause = silence_generator.sound(time_unit * 7)
-
-        self.__audio_lookup = {
-            MorseToken.DIT: dit_tone,
-            MorseToken.DAH: dah_tone,
-            MorseToken.INTRA_CHARACTER: intra_character_pause,
-            MorseToken.INTER_CHARACTER: inter_character_pause,
-            MorseToken.INTER_WORD: inter_word_pause,
-            MorseToken.UNKNOWN: inter_character_pause
-        }
-        
-        logger.debug(f"{self.__class__.__name__} initialized with {time_unit=}s")
-        logger.debug(f"{self.__class__.__name__} {MORSE_SAMPLER_CACHE_SIZE=}")
-        
-    @lru_cache(MORSE_SAMPLER_CACHE_SIZE)
-    def __process_and_cache(self, token_chunk: str):
-        audio_chunk = np.array([])
-
-        try:
-            for symbol in token_chunk:
-                audio_chunk = np.concatenate([audio_chunk, self.__audio_lookup[symbol]])
-        except KeyError:
-            logger.exception(f"Unknown token found: {symbol}!")
+    """
+    Renders token strings to audio. Cached rendering (produce_audio_data, produce_audio_blocks)
+    stitches audio of glyphs - token layout of one character, inter-character gap included,
+    i.e. one entry of morse codes - and of whole words seen repeatedly (callsigns, CQ, 73...).
+    cache_max_bytes bounds the word cache; glyphs are few and have a budget of their own
+    """
+    
+    __INTER_CHARACTER = bytes([list(MorseToken).index(MorseToken.INTER_CHARACTER)])
+    __WORD_SEPARATOR = bytes([list(MorseToken).index(MorseToken.INTER_WORD)]) + __INTER_CHARACTER
+    
+    def __init__(self, tone_generator: ToneGenerator, time_unit, cache_max_bytes: int = MORSE_SAMPLER_CACHE_MAX_BYTES,
+                 dtype: npt.DTypeLike = np.float32):
+        """
+        dtype of produced audio is either float32 (raw generator output)
+        or int16 (raw output scaled by 32767, same as AudioData.as_int16)
+        """
+        self.__dtype = np.dtype(dtype)
+        
+        if self.__dtype not in (np.float32, np.int16):
+            raise ValueError(f"Unsupported audio dtype: {self.__dtype}")
+        
+        with registry.stage("tone_precompute"):
+            silence_generator = SilenceGenerator.copy_of(tone_generator)
+
+            dit_tone = tone_generator.sound(time_unit)
+            dah_tone = tone_generator.sound(time_unit * 3)
+            intra_character_pause = silence_generator.sound(time_unit)
+            inter_character_pause = silence_generator.sound(time_unit * 3)
+            inter_word_pause = silence_generator.sound(time_unit * 7)
+
+            self.__audio_lookup = {
+                MorseToken.DIT: dit_tone,
+                MorseToken.DAH: dah_tone,
+                MorseToken.INTRA_CHARACTER: intra_character_pause,
+                MorseToken.INTER_CHARACTER: inter_character_pause,
+                MorseToken.INTER_WORD: inter_word_pause,
+                MorseToken.UNKNOWN: inter_character_pause
+            }
+        
+            for token, audio in self.__audio_lookup.items():
+                self.__audio_lookup[token] = AudioData(audio, 1.0).to_int16() if self.__dtype == np.int16 else audio
+        
+        self.__peak = max(float(np.max(np.abs(self.__audio_lookup[token]), initial=0)) for token in (MorseToken.DIT, MorseToken.DAH))
+        
+        self.__glyph_cache = AudioCache(MORSE_SAMPLER_GLYPH_CACHE_MAX_BYTES)
+        self.__word_cache = AudioCache(cache_max_bytes)
+        self.__word_counts: dict[bytes, int] = {}
+        
+        self.__bank_lengths = np.array([self.__audio_lookup[token].size for token in MorseToken], dtype=np.intp)
+        self.__bank_offsets = np.cumsum(self.__bank_lengths) - self.__bank_lengths
+        self.__bank = np.concatenate([self.__audio_lookup[token] for token in MorseToken])
+        self.__audible_codes = [code for code, token in enumerate(MorseToken) if np.any(self.__audio_lookup[token])]
+        
+        logger.debug(f"{self.__class__.__name__} initialized with {time_unit=}s, dtype={self.__dtype}")
+        logger.debug(f"{self.__class__.__name__} {cache_max_bytes=}, {MORSE_SAMPLER_GLYPH_CACHE_MAX_BYTES=}")
+        logger.debug(f"{self.__class__.__name__} {MORSE_SAMPLER_GATHER_BATCH_SIZE=}")
+        
+    def __render_key(self, key: bytes):
+        codes = np.frombuffer(key, dtype=np.uint8)
+        audio = np.zeros(int(self.token_lengths(codes).sum()), dtype=self.__dtype)
+        self.render_codes_into(codes, audio)
+        audio.flags.writeable = False
+        
+        return audio
+    
+    def __glyph(self, key: bytes):
+        if (audio := self.__glyph_cache.get(key)) is None:
+            audio = self.__render_key(key)
+            self.__glyph_cache.put(key, audio)
             
-        logger.debug(f"{self.__class__.__name__} [cache] <- {token_chunk=}")
+        return audio
+    
+    def __word(self, key: bytes):
+        """
+        Yields:
+            Audio of the word: cached whole if it was seen often enough, else its glyphs
+        """
+        if (audio := self.__word_cache.get(key)) is not None:
+            yield audio
+            return
+        
+        if len(self.__word_counts) >= MORSE_SAMPLER_WORD_COUNTS_MAX:
+            self.__word_counts.clear()
         
-        return audio_chunk
+        occurrences = self.__word_counts[key] = self.__word_counts.get(key, 0) + 1
+        *glyphs, tail = key.split(self.__INTER_CHARACTER)
+        glyphs = [self.__glyph(glyph + self.__INTER_CHARACTER) for glyph in glyphs]
+        
+        if tail:
+            glyphs.append(self.__glyph(tail))
+        
+        if occurrences < MORSE_SAMPLER_WORD_MIN_OCCURRENCES:
+            yield from glyphs
+            return
+        
+        audio = np.concatenate(glyphs)
+        audio.flags.writeable = False
+        self.__word_cache.put(key, audio)
+        logger.debug(f"{self.__class__.__name__} [word cache] <- {len(key)} tokens")
+        
+        yield audio
+    
+    def __pieces(self, codes: npt.NDArray[np.uint8]):
+        """
+        Yields:
+            Cached audio pieces (words, glyphs, word gaps) of token codes, in order
+        """
+        words = codes.tobytes().split(self.__WORD_SEPARATOR)
+        
+        for index, word in enumerate(words):
+            if index:
+                yield self.__glyph(self.__WORD_SEPARATOR)
+            if word:
+                yield from self.__word(word)
+
+    def produce_audio_data(self, token_string: TokenString):
+        audio = np.empty(self.count_samples(token_string), dtype=self.__dtype)
+        self.render_words_into(self.encode_tokens(token_string), audio)
 
-    def produce_audio_data(self, token_string: TokenString, chunk_size: int):
-        audio = np.array([])
+        return AudioData(audio, self.__peak)
+    
+    def render_words_into(self, codes: npt.NDArray[np.uint8], out: npt.NDArray):
+        """
+        Overwrites out, exactly as long as the rendered codes, with cached audio of their
+        words and glyphs. Codes should hold whole words, e.g. be cut at word separators:
+        a cut word is cached as a word of its own
+        """
+        offset = 0
 
-        for token_chunk in chunked(token_string.tokens, chunk_size):
-            audio_chunk = self.__process_and_cache(token_chunk)
-            audio = np.concatenate([audio, audio_chunk])
+        for piece in self.__pieces(codes):
+            out[offset:offset + piece.size] = piece
+            offset += piece.size
 
-        return AudioData(audio)
+    def produce_audio_data_vectorized(self, token_string: TokenString):
+        """
+        Renders token string without per-token python loop and without caches.
+        Output is zero-initialized, so silent tokens are skipped entirely;
+        every audible token type is scattered from the packed bank at once.
+        Cached produce_audio_data is faster for all but short one-off messages,
+        this is the reference its output is checked against
+        """
+        codes = self.encode_tokens(token_string)
+        audio = np.zeros(int(self.token_lengths(codes).sum()), dtype=self.__dtype)
+        
+        self.render_codes_into(codes, audio)
+            
+        return AudioData(audio, self.__peak)
+    
+    def render_codes_into(self, codes: npt.NDArray[np.uint8], out: npt.NDArray):
+        """
+        Writes audible tokens into out, which must be zero-initialized
+        and exactly as long as the rendered codes
+        """
+        lengths = self.token_lengths(codes)
+        starts = np.cumsum(lengths) - lengths
+        
+        for code in self.__audible_codes:
+            length = int(self.__bank_lengths[code])
+            segment = self.__bank[self.__bank_offsets[code]:self.__bank_offsets[code] + length]
+            segment_range = np.arange(length)
+            batch_size = max(1, MORSE_SAMPLER_GATHER_BATCH_SIZE // max(1, length))
+            
+            for starts_batch in chunked(starts[codes == code], batch_size):
+                out[starts_batch[:, np.newaxis] + segment_range] = segment
+    
+    def bank_indices(self, codes: npt.NDArray[np.uint8]):
+        """
+        Returns:
+            Index into the packed token bank of every sample rendered from codes.
+            Valid for every sampler of equal layout_key
+        """
+        lengths = self.token_lengths(codes)
+        indices = np.repeat(self.__bank_offsets[codes] - (np.cumsum(lengths) - lengths), lengths)
+        indices += np.arange(indices.size)
+        
+        return indices
+    
+    def gather_audio_data(self, indices: npt.NDArray[np.intp], out: npt.NDArray | None = None):
+        """
+        Renders samples of precomputed bank indices (see bank_indices) with a single gather
+        into out (allocated if not provided), no scatter of tokens and no zero-initialization.
+        Pays off when one index array is reused by many samplers, e.g. same message
+        in many tones and frequencies
+        """
+        if out is None:
+            out = np.empty(indices.size, dtype=self.__dtype)
+        
+        # Indices are in range by construction; "clip" lets take write into out without a temporary
+        np.take(self.__bank, indices, out=out, mode="clip")
+        
+        return AudioData(out, self.__peak)
+    
+    def render_windows_into(self, token_string: TokenString, out: npt.NDArray, window_size: int):
+        """
+        Renders token string into zero-initialized out, exactly count_samples() long,
+        window of window_size tokens by window. Only one window of token codes and
+        of out is touched at a time, so out may be larger than RAM (e.g. a memory map)
+        
+        Yields:
+            Number of samples written so far, after every window
+        """
+        offset = 0
+        
+        for codes in chunked(self.encode_tokens(token_string), window_size):
+            size = int(self.token_lengths(codes).sum())
+            self.render_codes_into(codes, out[offset:offset + size])
+            offset += size
+            
+            yield offset
+    
+    def token_lengths(self, codes: npt.NDArray[np.uint8]):
+        """
+        Returns:
+            Sample count of each token code
+        """
+        return self.__bank_lengths[codes]
+    
+    def encode_tokens(self, token_string: TokenString):
+        """
+        Returns:
+            uint8 array of token codes (indices of MorseToken members)
+            
+        Raises:
+            ValueError: if token string contains non-token characters
+        """
+        if not token_string.is_valid:
+            raise ValueError(f"Token string contains non-token characters: {token_string}")
+        
+        return token_string.codes
+
+    def produce_audio_blocks(self, token_string: TokenString, block_size: int):
+        """
+        Lazily renders token string as a sequence of fixed-size sample blocks.
+        Only the last block may be shorter than block_size
+        
+        Yields:
+            Raw (not normalized) audio samples, block_size long
+        """
+        return self.produce_stream_blocks((token_string,), block_size)
+    
+    def produce_stream_blocks(self, token_strings: Iterable[TokenString], block_size: int):
+        """
+        Same as produce_audio_blocks for consecutive segments of one message
+        (see MorseTokenizer.tokenize_stream), consumed lazily: blocks span segment boundaries
+        and a segment is pulled only when the blocks before it are filled
+        
+        Yields:
+            Raw (not normalized) audio samples, block_size long
+        """
+        block = np.empty(block_size, dtype=self.__dtype)
+        filled = 0
+
+        for piece in chain.from_iterable(self.__pieces(self.encode_tokens(token_string)) for token_string in token_strings):
+            pos = 0
+            
+            while pos < piece.size:
+                count = min(block_size - filled, piece.size - pos)
+                block[filled:filled + count] = piece[pos:pos + count]
+                filled += count
+                pos += count
+                
+                if filled == block_size:
+                    yield block
+                    block = np.empty(block_size, dtype=self.__dtype)
+                    filled = 0
+                    
+        if filled:
+            yield block[:filled]
+
+    def count_samples(self, token_string: TokenString):
+        return int(token_string.counts @ self.__bank_lengths)
+
+    @property
+    def cache_statistics(self):
+        """
+        Returns:
+            Statistics of glyph and word caches. Glyphs are looked up only for words missing from the word cache
+        """
+        return {"glyph": self.__glyph_cache.statistics, "word": self.__word_cache.statistics}
+
+    @property
+    def peak(self):
+        return self.__peak
+    
+    @property
+    def layout_key(self):
+        """
+        Returns:
+            Token lengths: samplers of equal key (e.g. any tone at one speed and sample rate)
+            share token positions and bank indices
+        """
+        return self.__bank_lengths.tobytes()
+    
+    @property
+    def dtype(self):
+        return self.__dtype
+
+
+class IncrementalRender:
+    """
+    Audio of successive versions of a token string. Applying a TokenEdit renders only
+    the inserted tokens: audio before the edit stays in place, audio after it is moved
+    """
+    
+    def __init__(self, sampler: MorseAudioSampler):
+        self.__sampler = sampler
+        self.__audio = SpliceBuffer(sampler.dtype)
+        self.__token_ends = SpliceBuffer(np.int64)
+        
+        logger.debug(f"{self.__class__.__name__} initialized")
+        
+    @property
+    def audio_data(self):
+        """
+        Returns:
+            Current audio, a view that the next apply() changes
+        """
+        return AudioData(self.__audio.data, self.__sampler.peak)
+        
+    def apply(self, edit: TokenEdit):
+        token_ends = self.__token_ends.data
+        removed_stop = edit.start + edit.removed
+        start = int(token_ends[edit.start - 1]) if edit.start else 0
+        stop = int(token_ends[removed_stop - 1]) if removed_stop else 0
+        
+        codes = edit.inserted
+        new_ends = self.__token_ends.replace(edit.start, removed_stop, codes.size)
+        np.cumsum(self.__sampler.token_lengths(codes), out=new_ends)
+        new_ends += start
+        
+        size = int(new_ends[-1]) - start if codes.size else 0
+        audio = self.__audio.replace(start, stop, size)
+        audio.fill(0)
+        self.__sampler.render_codes_into(codes, audio)
+        
+        if shift := size - (stop - start):
+            self.__token_ends.data[edit.start + codes.size:] += shift
+            
+        logger.debug(f"{self.__class__.__name__}.apply() -> {codes.size} tokens, {size} samples rendered")
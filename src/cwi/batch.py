@@ -0,0 +1,92 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+
+from cwi.log import logger
+from cwi.const.service import BATCH_JOBS_PER_TASK
+from cwi.data_structures import BatchJob, BatchReport
+from cwi.timer import Timer
+
+
+_worker_app = None
+
+
+def read_manifest(path: str):
+    """
+    Reads batch jobs from manifest file. Each non-empty line is either
+    a JSON object {"message": ..., "output": ...} or OUTPUT<TAB>MESSAGE pair
+    
+    Raises:
+        ValueError: if any line cannot be parsed
+    """
+    jobs = []
+    
+    with open(path, "r", encoding="UTF-8") as manifest:
+        for line_number, line in enumerate(manifest, 1):
+            line = line.strip()
+            
+            if not line:
+                continue
+            
+            try:
+                if line.startswith("{"):
+                    entry = json.loads(line)
+                    jobs.append(BatchJob(entry["message"], entry["output"]))
+                else:
+                    output, message = line.split("\t", 1)
+                    jobs.append(BatchJob(message, output))
+            except (ValueError, KeyError, TypeError) as error:
+                raise ValueError(f"Invalid manifest entry at line {line_number}: {line!r}") from error
+            
+    logger.debug(f"{len(jobs)} jobs read from manifest {path=}")
+    
+    return jobs
+
+
+def _init_worker(app_factory: Callable):
+    global _worker_app
+    _worker_app = app_factory()
+    
+    
+def _render_job(job: BatchJob):
+    """
+    Returns:
+        Duration of rendered audio [seconds] or None if rendering failed
+    """
+    message = job.message.strip()
+    
+    if not message:
+        logger.error(f"Empty message for {job.output=}")
+        return None
+    
+    _worker_app.message = message
+    
+    if not _worker_app.save_audio_stream(job.output, show_progress=False):
+        return None
+    
+    return _worker_app.count_audio_samples() / _worker_app.sample_rate
+
+
+def render_batch(app_factory: Callable, jobs: list[BatchJob], max_workers: int, on_complete: Callable[[], None] = None):
+    """
+    Renders jobs in a process pool. Every worker builds a single App with app_factory
+    and reuses it, so tokenizer and tone setup is paid once per worker.
+    app_factory must be picklable, e.g. functools.partial(App, ...)
+    """
+    timer = Timer("Batch").tic()
+    report = BatchReport(len(jobs))
+    
+    with ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(app_factory,)) as executor:
+        for audio_seconds in executor.map(_render_job, jobs, chunksize=BATCH_JOBS_PER_TASK):
+            if audio_seconds is None:
+                report.failed += 1
+            else:
+                report.audio_seconds += audio_seconds
+                
+            if on_complete is not None:
+                on_complete()
+            
+    report.elapsed = timer.toc()
+    
+    return report
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from typing import Hashable
+
+import numpy.typing as npt
+
+from cwi.log import logger
+from cwi.data_structures import CacheStatistics
+
+
+class AudioCache:
+    """
+    LRU cache of audio arrays bounded by total size in bytes
+    """
+    
+    def __init__(self, max_bytes: int):
+        if max_bytes < 0:
+            raise ValueError(f"Cache size must be non-negative: {max_bytes=}")
+        
+        self.__entries: OrderedDict[Hashable, npt.NDArray] = OrderedDict()
+        self.__max_bytes = max_bytes
+        self.__statistics = CacheStatistics(max_bytes=max_bytes)
+        
+        logger.debug(f"{self.__class__.__name__} initialized with {max_bytes=}")
+        
+    def get(self, key: Hashable):
+        """
+        Returns:
+            Cached array or None if key is not cached
+        """
+        audio = self.__entries.get(key)
+        
+        if audio is None:
+            self.__statistics.misses += 1
+        else:
+            self.__statistics.hits += 1
+            self.__entries.move_to_end(key)
+            
+        return audio
+    
+    def put(self, key: Hashable, audio: npt.NDArray):
+        """
+        Stores array, evicting least recently used entries to fit the budget.
+        Arrays larger than the whole budget are not stored
+        """
+        if audio.nbytes > self.__max_bytes:
+            return
+        
+        if (previous := self.__entries.pop(key, None)) is not None:
+            self.__statistics.bytes -= previous.nbytes
+        
+        while self.__statistics.bytes + audio.nbytes > self.__max_bytes:
+            _, evicted = self.__entries.popitem(last=False)
+            self.__statistics.bytes -= evicted.nbytes
+            self.__statistics.evictions += 1
+            
+        self.__entries[key] = audio
+        self.__statistics.bytes += audio.nbytes
+        self.__statistics.entries = len(self.__entries)
+        
+    def clear(self):
+        self.__entries.clear()
+        self.__statistics.bytes = 0
+        self.__statistics.entries = 0
+    
+    def __getstate__(self):
+        """
+        Cached audio is not transferred to other processes
+        """
+        return {"max_bytes": self.__max_bytes}
+    
+    def __setstate__(self, state: dict):
+        self.__init__(state["max_bytes"])
+    
+    @property
+    def statistics(self):
+        return self.__statistics
+    
+    def __contains__(self, key: Hashable):
+        return key in self.__entries
+    
+    def __len__(self):
+        return len(self.__entries)
@@ -1,4 +1,29 @@
 PLAYBACK_BUFFER_SIZE = 1024
-SAVING_BUFFER_SIZE = 1024
-MORSE_SAMPLER_CACHE_SIZE = 128
-MORSE_SAMPLER_TOKEN_CHUNK_SIZE = 64
+SAVING_BUFFER_SIZE = 2 ** 16
+MORSE_SAMPLER_CACHE_MAX_BYTES = 64 * 2 ** 20
+MORSE_SAMPLER_GLYPH_CACHE_MAX_BYTES = 16 * 2 ** 20
+MORSE_SAMPLER_WORD_MIN_OCCURRENCES = 2
+MORSE_SAMPLER_WORD_COUNTS_MAX = 2 ** 16
+MORSE_SAMPLER_GATHER_BATCH_SIZE = 2 ** 20
+DISK_CACHE_MAX_BYTES = 2 ** 30
+DISK_CACHE_FORMAT_VERSION = 2
+BATCH_JOBS_PER_TASK = 16
+WAVETABLE_SIZE = 4096
+PLAYBACK_RING_BUFFER_SIZE = 2 ** 16
+STDOUT_PATH = "-"
+IMA_ADPCM_BLOCK_ALIGN = 256
+IMA_ADPCM_BATCH_BLOCKS = 1024
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 7373
+SERVER_MAX_APPS = 16
+SERVER_REQUEST_MAX_BYTES = 2 ** 24
+DECODER_FRAME_DURATION = 0.004
+DECODER_THRESHOLD = 0.25
+DECODER_ESTIMATION_RUNS = 64
+DECODER_BLOCK_SIZE = 2 ** 18
+DECODER_UNKNOWN_CHARACTER = "*"
+MIXER_BLOCK_SIZE = 2 ** 16
+MAPPED_WINDOW_TOKENS = 256
+TOKENIZER_STREAM_MAX_PENDING = 2 ** 20
+INPUT_CHUNK_SIZE = 2 ** 16
+GRID_VARIANTS_PER_TASK = 8
@@ -1,9 +1,16 @@
+import re
+from collections import Counter
 from dataclasses import dataclass
+from functools import cache
+from typing import Iterable, Iterator
 
-from loguru import logger
+import numpy as np
 
-from cwi.data_structures import TokenString, MorseToken
+from cwi.log import logger
+from cwi.data_structures import TokenString, TokenEdit, MorseToken
 from cwi.const import morse_codes
+from cwi.const.service import TOKENIZER_STREAM_MAX_PENDING
+from cwi.utils import SpliceBuffer, common_prefix_length, common_suffix_length
 
 
 @dataclass(frozen=True)
@@ -16,24 +23,17 @@ class ConversionRule:
 
 
 class MorseTokenizer:
-    __RULES_TO_APPLY = (
-        ConversionRule(
-            MorseToken.DIT, f"{MorseToken.DIT}{MorseToken.INTRA_CHARACTER}"
-        ),
-        ConversionRule(
-            MorseToken.DAH, f"{MorseToken.DAH}{MorseToken.INTRA_CHARACTER}"
-        ),
-        ConversionRule(
-            f"{MorseToken.INTRA_CHARACTER}{MorseToken.INTER_CHARACTER}",
-            MorseToken.INTER_CHARACTER,
-        ),
-    )
-
     __VALID_PREDEFINED_TOKENS = set(
         (MorseToken.DIT.value,
          MorseToken.DAH.value,
          MorseToken.INTER_WORD.value)
     )
+    
+    __LAST_WORD = re.compile(r"\S*\Z")
+    
+    # Token character -> character of its code, so translated strings encode straight to token codes
+    __TOKEN_CODES = str.maketrans({token.value: chr(code) for code, token in enumerate(MorseToken)})
+    __UNKNOWN_ENTRY = f"{MorseToken.UNKNOWN}{MorseToken.INTER_CHARACTER}".translate(__TOKEN_CODES)
 
     def __init__(self):
         self.__morse_codes = morse_codes.DEFAULT_MORSE_CODES.copy()
@@ -41,10 +41,12 @@ class MorseTokenizer:
         if invalid_codes := self.__validate_morse_codes(self.__morse_codes):
             raise ValueError(f"Invalid morse codes provided: {invalid_codes}")
 
-        self.__known_conversions = set(self.__morse_codes.keys())
+        self.__translation_table = str.maketrans(
+            {char: self.__layout_code(code) for char, code in self.__morse_codes.items()}
+        )
+        self.__known_chars = frozenset(self.__morse_codes)
 
         logger.debug(f"{self.__class__.__name__} initialized with {self.__morse_codes=}")
-        logger.debug(f"{self.__class__.__name__} known rules: {self.__RULES_TO_APPLY=}")
         logger.debug(f"{self.__class__.__name__} valid predefined tokens: {self.__VALID_PREDEFINED_TOKENS=}")
 
     def __validate_morse_codes(self, morse_codes: dict):
@@ -57,30 +59,216 @@ class MorseTokenizer:
                 invalid_morse_codes.add(code)
 
         return invalid_morse_codes
+    
+    @classmethod
+    def __layout_code(cls, code: str):
+        """
+        Final token layout of one character: symbols separated by
+        intra-character pauses and followed by inter-character pause,
+        as characters of token codes
+        """
+        return f"{MorseToken.INTRA_CHARACTER.join(code)}{MorseToken.INTER_CHARACTER}".translate(cls.__TOKEN_CODES)
 
-    def tokenize(self, string: str):
-        tokens = ""
-        original_string = string.strip()
-        string_to_process = string.strip().upper()
-        unknown_chars = set()
-
-        for char in string_to_process:
-            if char not in self.__known_conversions:
-                unknown_chars.add(char)
-
-            tokens += f"{self.__morse_codes.get(char, MorseToken.UNKNOWN)}{MorseToken.INTER_CHARACTER}"
+    def __translation_table_of(self, string: str):
+        """
+        Unknown characters are found up front and added to a copy of the table:
+        str.translate takes its fast path only with a plain dict, not with a __missing__ hook
+        
+        Returns:
+            (translation table covering every character of string, unknown characters)
+        """
+        unknown_chars = set(string).difference(self.__known_chars)
+        
+        if not unknown_chars:
+            return self.__translation_table, unknown_chars
+        
+        return self.__translation_table | dict.fromkeys(map(ord, unknown_chars), self.__UNKNOWN_ENTRY), unknown_chars
 
-        for rule in self.__RULES_TO_APPLY:
-            tokens = rule.apply(tokens)
+    def tokenize(self, string: str):
+        return self.__tokenize(string.strip())
+    
+    def __tokenize(self, original_string: str):
+        string_to_process = original_string.upper()
+        translation_table, unknown_chars = self.__translation_table_of(string_to_process)
+            
+        tokens = string_to_process.translate(translation_table)
 
-        token_string = TokenString(tokens, original_string, unknown_chars, set(MorseToken.__members__.values()))
+        # Translation table holds only validated codes, so no further check is needed
+        codes = np.frombuffer(tokens.encode("ascii"), dtype=np.uint8)
+        token_string = TokenString(codes, original_string, unknown_chars, is_valid=True)
 
-        logger.debug(f"{self.__class__.__name__}.tokenize('{string}') -> {token_string}")
+        logger.debug(f"{self.__class__.__name__}.tokenize() -> {token_string.length} tokens")
 
         if unknown_chars:
             logger.warning(f"Unknown characters found: {unknown_chars}")
 
         return token_string
+    
+    def tokenize_stream(self, chunks: Iterable[str]) -> Iterator[TokenString]:
+        """
+        Tokenizes text arriving in chunks (lines, blocks of a file, ...) with bounded memory.
+        Segments are cut after whole words: a word split by a chunk boundary is held back
+        until it is complete, and whitespace before it goes with it, so word gaps are kept.
+        Concatenated segments equal tokenize() of the whole text, leading and trailing whitespace
+        of the whole text included. Words longer than TOKENIZER_STREAM_MAX_PENDING are cut
+        
+        Yields:
+            TokenString of every complete segment
+        """
+        pending = ""
+        started = False
+        
+        for chunk in chunks:
+            text = pending + chunk
+            
+            if not started:
+                text = text.lstrip()
+                started = bool(text)
+            
+            # Last word may continue in the next chunk
+            tail_start = self.__LAST_WORD.search(text).start()
+            head = text[:tail_start].rstrip()
+            pending = text[len(head):]
+            
+            if not head and len(pending) > TOKENIZER_STREAM_MAX_PENDING:
+                head, pending = pending, ""
+            
+            if head:
+                yield self.__tokenize(head)
+                
+        if tail := pending.rstrip():
+            yield self.__tokenize(tail)
+    
+    def layout_characters(self, string: str):
+        """
+        Token layout of every character of string, which must be uppercased already
+        
+        Returns:
+            (layouts as characters of token codes, unknown characters)
+        """
+        translation_table, unknown_chars = self.__translation_table_of(string)
+        layouts = [translation_table[ord(char)] for char in string]
+        
+        return layouts, unknown_chars
+    
+    def tokenize_many(self, strings: Iterable[str]):
+        """
+        Tokenizes every string with the same prepared translation table
+        
+        Yields:
+            TokenString for each string, in order
+        """
+        for string in strings:
+            yield self.tokenize(string)
+
+
+class IncrementalTokenizer:
+    """
+    Tokenizes successive versions of one message, e.g. while it is typed.
+    Token offsets and readable form (see TokenPurifier) of the characters of the previous version
+    are kept, so only characters between the common prefix and suffix of two versions are translated
+    again and token counts are updated by the difference. Besides the prefix and suffix search,
+    an edit costs O(edited characters) plus moving the items after it
+    """
+    
+    def __init__(self, tokenizer: MorseTokenizer | None = None):
+        self.__tokenizer = tokenizer or MorseTokenizer()
+        self.__text = ""
+        self.__codes = SpliceBuffer(np.uint8)
+        self.__character_ends = SpliceBuffer(np.int64)
+        self.__readable = SpliceBuffer(np.uint8)
+        self.__readable_ends = SpliceBuffer(np.int64)
+        self.__counts = np.zeros(len(MorseToken), dtype=np.int64)
+        self.__unknown_chars = Counter()
+        self.__token_string = TokenString(np.empty(0, dtype=np.uint8))
+        
+        logger.debug(f"{self.__class__.__name__} initialized")
+        
+    @property
+    def token_string(self):
+        """
+        Returns:
+            Tokens of the current version, codes are a view that the next update() changes
+        """
+        return self.__token_string
+    
+    @property
+    def readable(self):
+        """
+        Returns:
+            TokenPurifier.purify() of the current version
+        """
+        return self.__readable.data.tobytes().decode("ascii")
+    
+    @staticmethod
+    def __span(item_ends: SpliceBuffer, first: int, stop: int):
+        """
+        Returns:
+            Range of items of characters [first, stop)
+        """
+        ends = item_ends.data
+        
+        return int(ends[first - 1]) if first else 0, int(ends[stop - 1]) if stop else 0
+    
+    @classmethod
+    def __splice(cls, items: SpliceBuffer, item_ends: SpliceBuffer, first: int, stop: int, pieces: list[str]):
+        """
+        Replaces items of characters [first, stop) by pieces, ASCII items of every new character
+        
+        Returns:
+            Inserted items
+        """
+        start, end = cls.__span(item_ends, first, stop)
+        inserted = np.frombuffer("".join(pieces).encode("ascii"), dtype=np.uint8)
+        
+        new_ends = item_ends.replace(first, stop, len(pieces))
+        np.cumsum(np.fromiter(map(len, pieces), dtype=np.int64, count=len(pieces)), out=new_ends)
+        new_ends += start
+        
+        if shift := inserted.size - (end - start):
+            item_ends.data[first + len(pieces):] += shift
+            
+        items.replace(start, end, inserted.size)[:] = inserted
+        
+        return inserted
+        
+    def update(self, string: str):
+        """
+        Tokenizes the next version of the message
+        
+        Returns:
+            TokenEdit that turns the previous token string into the new one
+        """
+        source = string.strip()
+        text = source.upper()
+        
+        prefix = common_prefix_length(self.__text, text)
+        suffix = common_suffix_length(self.__text, text, min(len(self.__text), len(text)) - prefix)
+        old_stop, new_stop = len(self.__text) - suffix, len(text) - suffix
+        
+        removed_text, inserted_text = self.__text[prefix:old_stop], text[prefix:new_stop]
+        layouts, missing_chars = self.__tokenizer.layout_characters(inserted_text)
+        
+        start, stop = self.__span(self.__character_ends, prefix, old_stop)
+        self.__counts -= TokenString.count_codes(self.__codes.data[start:stop])
+        
+        inserted = self.__splice(self.__codes, self.__character_ends, prefix, old_stop, layouts)
+        self.__splice(self.__readable, self.__readable_ends, prefix, old_stop, TokenPurifier.purify_layouts(layouts))
+        self.__counts += TokenString.count_codes(inserted)
+        
+        self.__unknown_chars.subtract(char for char in removed_text if char in self.__unknown_chars)
+        self.__unknown_chars.update(char for char in inserted_text if char in missing_chars)
+        self.__unknown_chars = +self.__unknown_chars
+        
+        self.__text = text
+        self.__token_string = TokenString(self.__codes.data, source, set(self.__unknown_chars), counts=self.__counts.copy())
+        
+        logger.debug(f"{self.__class__.__name__}.update() -> {len(inserted_text)} characters retokenized")
+        
+        if missing_chars:
+            logger.warning(f"Unknown characters found: {missing_chars}")
+        
+        return TokenEdit(start, stop - start, inserted)
 
 
 class TokenPurifier:    
@@ -99,12 +287,52 @@ class TokenPurifier:
         def __init__(self):
             logger.debug(f"{self.__class__.__name__} initialized")
             logger.debug(f"{self.__class__.__name__} known rules: {self.__RULES_TO_APPLY=}")
+            
+        @classmethod
+        @cache
+        def __code_table(cls):
+            """
+            Rules applied to every token type: rules map a token to at most one character,
+            so purifying is a single bytes.translate of token codes
+            
+            Returns:
+                (translation table of codes, codes to delete)
+            """
+            table = bytearray(range(256))
+            deleted = bytearray()
+            
+            for code, token in enumerate(MorseToken):
+                replacement = token.value
+                
+                for rule in cls.__RULES_TO_APPLY:
+                    replacement = rule.apply(replacement)
+                    
+                if len(replacement) > 1:
+                    raise ValueError(f"Rules must map token to at most one character: {token} -> {replacement}")
+                
+                if replacement:
+                    table[code] = ord(replacement)
+                else:
+                    deleted.append(code)
+            
+            return bytes(table), bytes(deleted)
         
         @classmethod
         def purify(cls, token_string: TokenString):
-            tokens = token_string.tokens
+            table, deleted = cls.__code_table()
             
-            for rule in cls.__RULES_TO_APPLY:
-                tokens = rule.apply(tokens)
-                
-            return tokens
+            return token_string.codes.tobytes().translate(table, deleted).decode("ascii")
+        
+        @classmethod
+        def purify_layouts(cls, layouts: list[str]):
+            """
+            Purifies every character layout of MorseTokenizer.layout_characters() on its own,
+            distinct layouts once. Joined results equal purify() of the joined layouts
+            
+            Returns:
+                Readable form of every layout
+            """
+            table, deleted = cls.__code_table()
+            readable = {layout: layout.encode("ascii").translate(table, deleted).decode("ascii") for layout in set(layouts)}
+            
+            return [readable[layout] for layout in layouts]
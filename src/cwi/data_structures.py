@@ -1,9 +1,12 @@
 from dataclasses import dataclass, field
+from functools import cached_property
 from enum import StrEnum
 
 import numpy as np
 import numpy.typing as npt
 
+from cwi.utils import chunked
+
 
 class MorseToken(StrEnum):
     DIT = "."
@@ -19,38 +22,293 @@ class ToneGeneratorType(StrEnum):
     SAW = "saw"
     TRIANGLE = "triangle"
     SQUARE = "square"
+    
+    
+class AudioFormat(StrEnum):
+    PCM16 = "pcm16"
+    PCM8 = "pcm8"
+    MULAW = "mulaw"
+    IMA_ADPCM = "ima-adpcm"
+
+
+# bytes.translate tables: token character -> code (index of MorseToken member), characters
+# out of the token space -> len(MorseToken); and back, with "?" for codes out of the token space
+_TOKEN_CODES = bytes(next((code for code, token in enumerate(MorseToken) if ord(token) == byte), len(MorseToken)) for byte in range(256))
+_TOKEN_CHARS = ("".join(MorseToken).encode("ascii") + b"?" * 256)[:256]
+_COUNT_CHUNK_SIZE = 2 ** 20
 
 
-@dataclass
 class TokenString:
-    tokens: str
-    source: str
-    unknown_entries: set[str]
-    token_space: set[str]
-    length: int = field(init=False)
-    is_valid: bool = field(init=False)
+    """
+    Morse tokens of a message as read-only uint8 codes (indices of MorseToken members).
+    counts holds the number of tokens of every type, so e.g. sample count of the message
+    is known without scanning it. is_valid is decided by the producer: MorseTokenizer output
+    is valid by construction, from_tokens() checks every character
+    """
     
-    def __post_init__(self):
-        self.length = len(self.tokens)
-        self.is_valid = set(self.tokens).issubset(self.token_space)
-            
-            
+    __slots__ = ("codes", "source", "unknown_entries", "counts", "is_valid")
+    
+    token_space = frozenset(MorseToken)
+    
+    def __init__(self, codes: npt.NDArray[np.uint8], source: str = "", unknown_entries: set[str] | None = None,
+                 is_valid: bool = True, counts: npt.NDArray[np.int64] | None = None):
+        """
+        counts, if known by the producer, must be count_codes() of codes
+        """
+        codes = np.asarray(codes, dtype=np.uint8).view()
+        codes.flags.writeable = False
+        
+        self.codes = codes
+        self.source = source
+        self.unknown_entries = set() if unknown_entries is None else unknown_entries
+        self.counts = self.count_codes(codes) if counts is None else counts
+        self.is_valid = is_valid
+        
+    @staticmethod
+    def count_codes(codes: npt.NDArray[np.uint8]):
+        """
+        Returns:
+            Number of tokens of every type among codes
+        """
+        counts = np.zeros(len(MorseToken), dtype=np.int64)
+        
+        # bincount works on intp copy of its input, so long inputs are counted in chunks
+        for chunk in chunked(codes, _COUNT_CHUNK_SIZE):
+            counts += np.bincount(chunk, minlength=len(MorseToken))[:len(MorseToken)]
             
+        return counts
+        
+    @classmethod
+    def from_tokens(cls, tokens: str, source: str = "", unknown_entries: set[str] | None = None):
+        """
+        TokenString of token characters, e.g. ".^-#"
+        """
+        codes = np.frombuffer(tokens.encode("ascii", errors="replace").translate(_TOKEN_CODES), dtype=np.uint8)
+        
+        return cls(codes, source, unknown_entries, is_valid=not np.any(codes == len(MorseToken)))
+    
+    @property
+    def tokens(self):
+        """
+        Returns:
+            Tokens as string of token characters
+        """
+        return self.codes.tobytes().translate(_TOKEN_CHARS).decode("ascii")
+    
+    @property
+    def length(self):
+        return self.codes.size
+    
+    def __repr__(self):
+        return f"{self.__class__.__name__}(length={self.length}, source={self.source[:32]!r}, is_valid={self.is_valid})"
+
+
+@dataclass(frozen=True)
+class TokenEdit:
+    """
+    codes[start:start + removed] of the previous token string are replaced by inserted codes
+    """
+    start: int
+    removed: int
+    inserted: npt.NDArray[np.uint8]
+
+
 @dataclass
 class Message:
     actual: str = field(init=False)
     morse_tokens: TokenString = field(init=False)
-    morse_readable: str = field(init=False)
+    morse_readable: str | None = field(init=False)
 
 
 @dataclass(frozen=True)
 class AudioData:
+    """
+    Raw audio samples with their known absolute peak.
+    If peak is not provided, it is computed from data once
+    """
     data: npt.NDArray
-
+    peak: float | None = None
+    
+    def __post_init__(self):
+        if self.peak is None:
+            object.__setattr__(self, "peak", float(np.max(np.abs(self.data), initial=0)))
+    
     @property
+    def dtype(self):
+        return self.data.dtype
+
+    @cached_property
     def as_float32(self):
-        return np.float32(self.data / np.max(np.abs(self.data)))
+        if self.data.dtype == np.float32 and self.peak == 1.0:
+            return self.data
+        
+        return self.to_float32()
 
-    @property
+    @cached_property
     def as_int16(self):
-        return np.int16(self.data * 32767)
\ No newline at end of file
+        if self.data.dtype == np.int16:
+            return self.data
+        
+        return self.to_int16()
+    
+    def to_float32(self, out: npt.NDArray[np.float32] | None = None):
+        """
+        Writes samples normalized by peak into out, allocated if not provided
+        """
+        if out is None:
+            out = np.empty(self.data.shape, dtype=np.float32)
+            
+        if self.peak:
+            np.multiply(self.data, np.float32(1 / self.peak), out=out, casting="unsafe")
+        else:
+            out.fill(0)
+            
+        return out
+    
+    def to_int16(self, out: npt.NDArray[np.int16] | None = None):
+        """
+        Writes samples scaled to int16 range into out, allocated if not provided.
+        Raw samples of peak up to 1 are scaled by 32767 as they are, louder ones (e.g. a mix)
+        are normalized by peak like to_float32, so they do not wrap around
+        """
+        if out is None:
+            out = np.empty(self.data.shape, dtype=np.int16)
+            
+        if self.data.dtype == np.int16:
+            np.copyto(out, self.data)
+        else:
+            scale = 32767 / self.peak if self.peak > 1 else 32767
+            np.multiply(self.data, np.float32(scale), out=out, casting="unsafe")
+            
+        return out
+
+
+@dataclass
+class CacheStatistics:
+    max_bytes: int
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    bytes: int = 0
+    entries: int = 0
+    
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+@dataclass
+class StageMetrics:
+    calls: int = 0
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    bytes_allocated: int | None = None
+    samples: int = 0
+    
+    @property
+    def samples_per_second(self):
+        return self.samples / self.wall_time if self.wall_time else 0.0
+
+
+@dataclass(frozen=True)
+class BatchJob:
+    message: str
+    output: str
+
+
+@dataclass
+class BatchReport:
+    messages: int
+    failed: int = 0
+    audio_seconds: float = 0.0
+    elapsed: float = 0.0
+    
+    @property
+    def messages_per_second(self):
+        return self.messages / self.elapsed if self.elapsed else 0.0
+    
+    @property
+    def audio_seconds_per_second(self):
+        return self.audio_seconds / self.elapsed if self.elapsed else 0.0
+
+
+@dataclass
+class PlaybackStatistics:
+    frames_played: int = 0
+    underruns: int = 0
+    underrun_frames: int = 0
+
+
+@dataclass(frozen=True)
+class RenderRequest:
+    message: str
+    tone: str = ToneGeneratorType.SINE.value
+    frequency: float = 800.0
+    sample_rate: int = 44100
+    words_per_minute: int = 20
+    audio_format: str = AudioFormat.PCM16.value
+    wav: bool = True
+    
+    @property
+    def app_key(self):
+        """
+        Settings that determine rendered audio; requests with equal keys share one warm App
+        """
+        return (self.tone, self.frequency, self.sample_rate, self.words_per_minute)
+
+
+@dataclass(frozen=True)
+class Station:
+    """
+    One transmitting station of a pileup. offset is the start time of its message [seconds],
+    amplitude scales its raw tone
+    """
+    message: str
+    frequency: float = 800.0
+    words_per_minute: int = 20
+    offset: float = 0.0
+    amplitude: float = 1.0
+    tone: str = ToneGeneratorType.SINE.value
+
+
+@dataclass(frozen=True)
+class RenderVariant:
+    """
+    Audio settings of one output of a multi-configuration (grid) render
+    """
+    tone: str = ToneGeneratorType.SINE.value
+    frequency: float = 800.0
+    words_per_minute: int = 20
+
+
+@dataclass
+class ServerStatistics:
+    requests: int = 0
+    failed: int = 0
+    samples: int = 0
+    bytes_sent: int = 0
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+    first_byte_latency_total: float = 0.0
+    uptime: float = 0.0
+    
+    @property
+    def completed(self):
+        return self.requests - self.failed
+    
+    @property
+    def latency_mean(self):
+        return self.latency_total / self.completed if self.completed else 0.0
+    
+    @property
+    def first_byte_latency_mean(self):
+        return self.first_byte_latency_total / self.completed if self.completed else 0.0
+    
+    @property
+    def requests_per_second(self):
+        return self.requests / self.uptime if self.uptime else 0.0
+    
+    @property
+    def bytes_per_second(self):
+        return self.bytes_sent / self.uptime if self.uptime else 0.0
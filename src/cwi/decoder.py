@@ -0,0 +1,249 @@
+from itertools import pairwise
+from math import pi
+from typing import Iterable, Iterator
+
+import numpy as np
+import numpy.typing as npt
+
+from cwi.log import logger
+from cwi.const import morse_codes
+from cwi.const.service import DECODER_FRAME_DURATION, DECODER_THRESHOLD, DECODER_ESTIMATION_RUNS, DECODER_UNKNOWN_CHARACTER
+from cwi.data_structures import MorseToken
+
+
+def invert_morse_codes(codes: dict[str, str]):
+    """
+    Returns:
+        code -> character mapping; for codes shared by several characters
+        (e.g. Latin and Cyrillic) the first one wins. Word separators are left out
+    """
+    inverse = {}
+
+    for char, code in codes.items():
+        if code != MorseToken.INTER_WORD:
+            inverse.setdefault(code, char)
+
+    return inverse
+
+
+class GoertzelDetector:
+    """
+    Tone power at one frequency in consecutive frames of a sample stream.
+    The Goertzel recurrence of a frame equals a single DFT bin, so it is evaluated
+    in closed form as projection on cos/sin basis: one matrix product per block of frames.
+    Power is normalized so that a full-frame tone of amplitude A gives about A ** 2
+    """
+
+    def __init__(self, frequency: float, sample_rate: int, frame_size: int):
+        omega = 2 * pi * frequency / sample_rate
+        phase = omega * np.arange(frame_size)
+
+        self.__frame_size = frame_size
+        self.__basis = np.stack([np.cos(phase), np.sin(phase)], axis=1).astype(np.float32) * np.float32(2 / frame_size)
+        self.__pending = np.empty(0, dtype=np.float32)
+
+    @property
+    def frame_size(self):
+        return self.__frame_size
+
+    def process(self, samples: npt.NDArray) -> npt.NDArray[np.float32]:
+        """
+        Returns:
+            Power of every frame completed by samples; incomplete frame is kept for the next call
+        """
+        samples = np.concatenate([self.__pending, np.asarray(samples, dtype=np.float32)])
+        frames_count = samples.size // self.__frame_size
+        frames = samples[:frames_count * self.__frame_size].reshape(frames_count, self.__frame_size)
+        self.__pending = samples[frames_count * self.__frame_size:].copy()
+
+        projection = frames @ self.__basis
+
+        return np.einsum("ij,ij->i", projection, projection)
+
+
+class MorseDecoder:
+    """
+    Streaming Morse audio decoder. Frames whose tone power exceeds threshold * peak power
+    seen so far are key-down. Key-down and key-up runs are measured in frames, dit length
+    is either given or estimated from the first runs, and runs are mapped to MorseTokens
+    in the same layout MorseTokenizer produces.
+
+    Memory does not depend on stream length: only the current block,
+    the current run and (until dit length is known) a few runs are kept
+    """
+
+    __DAH_UNITS = 2
+    __INTER_CHARACTER_UNITS = 2
+    __INTER_WORD_UNITS = 5
+
+    def __init__(self, frequency: float, sample_rate: int, dit_duration: float | None = None,
+                 frame_duration: float = DECODER_FRAME_DURATION, threshold: float = DECODER_THRESHOLD):
+        frame_size = max(1, round(sample_rate * frame_duration))
+
+        self.__detector = GoertzelDetector(frequency, sample_rate, frame_size)
+        self.__frame_duration = frame_size / sample_rate
+        self.__threshold = threshold
+        self.__dit_frames = dit_duration / self.__frame_duration if dit_duration else None
+
+        self.__peak_power = 0.0
+        self.__key_down = False
+        self.__run_frames = 0
+        self.__started = False
+        self.__pending_runs = []
+        self.__frames = 0
+
+        logger.debug(f"{self.__class__.__name__} initialized with {frequency=}, {sample_rate=}, {frame_size=}, {dit_duration=}")
+
+    @property
+    def dit_duration(self):
+        """
+        Returns:
+            Given or estimated dit duration [seconds], None if not estimated yet
+        """
+        return self.__dit_frames * self.__frame_duration if self.__dit_frames else None
+
+    @property
+    def duration(self):
+        """
+        Returns:
+            Duration of audio processed so far [seconds]
+        """
+        return self.__frames * self.__frame_duration
+
+    @staticmethod
+    def estimate_dit(run_lengths: Iterable[int]):
+        """
+        Shortest runs are one unit long (dits and intra-character gaps),
+        so dit is the mean of runs shorter than twice the shortest one.
+        Messages without one-unit runs (e.g. only dahs in separate words) are ambiguous
+
+        Returns:
+            Dit length in run length units
+        """
+        lengths = np.fromiter(run_lengths, dtype=np.float64)
+        shortest = lengths.min()
+
+        return float(lengths[lengths < 2 * shortest].mean())
+
+    def __runs(self, samples: npt.NDArray):
+        """
+        Returns:
+            [(key_down, frames), ...] runs completed within samples
+        """
+        power = self.__detector.process(samples)
+
+        if not power.size:
+            return []
+
+        self.__frames += power.size
+        self.__peak_power = max(self.__peak_power, float(power.max()))
+
+        key_down = power > self.__peak_power * self.__threshold if self.__peak_power else np.zeros(power.size, dtype=bool)
+        edges = np.flatnonzero(key_down[1:] != key_down[:-1]) + 1
+        runs = []
+
+        for start, end in pairwise([0, *edges.tolist(), key_down.size]):
+            state = bool(key_down[start])
+
+            if state == self.__key_down:
+                self.__run_frames += end - start
+                continue
+
+            runs.append((self.__key_down, self.__run_frames))
+            self.__key_down = state
+            self.__run_frames = end - start
+
+        return runs
+
+    def __tokens(self, runs: list[tuple[bool, int]], final: bool = False):
+        if not self.__started:
+            # Leading silence carries no information
+            while runs and not runs[0][0]:
+                runs.pop(0)
+            self.__started = bool(runs)
+
+        runs = [run for run in runs if run[1]]
+
+        if self.__dit_frames is None:
+            self.__pending_runs.extend(runs)
+
+            if len(self.__pending_runs) < DECODER_ESTIMATION_RUNS and not final:
+                return ""
+            if not self.__pending_runs:
+                return ""
+
+            self.__dit_frames = self.estimate_dit(frames for _, frames in self.__pending_runs)
+            logger.debug(f"{self.__class__.__name__} estimated dit duration: {self.dit_duration}s")
+
+            runs, self.__pending_runs = self.__pending_runs, []
+
+        tokens = []
+
+        for key_down, frames in runs:
+            units = frames / self.__dit_frames
+
+            if key_down:
+                tokens.append(MorseToken.DIT if units < self.__DAH_UNITS else MorseToken.DAH)
+            elif units < self.__INTER_CHARACTER_UNITS:
+                tokens.append(MorseToken.INTRA_CHARACTER)
+            elif units < self.__INTER_WORD_UNITS:
+                tokens.append(MorseToken.INTER_CHARACTER)
+            else:
+                tokens.append(f"{MorseToken.INTER_CHARACTER}{MorseToken.INTER_WORD}{MorseToken.INTER_CHARACTER}")
+
+        return "".join(tokens)
+
+    def decode_tokens(self, blocks: Iterable[npt.NDArray]) -> Iterator[str]:
+        """
+        Yields:
+            Token strings as soon as their runs are complete and dit length is known
+        """
+        for block in blocks:
+            if tokens := self.__tokens(self.__runs(block)):
+                yield tokens
+
+        # Last key-down run is complete at the end of stream, trailing silence ends the last character
+        final_runs = [(True, self.__run_frames)] if self.__key_down else []
+        tokens = self.__tokens(final_runs, final=True)
+
+        if self.__started:
+            tokens += MorseToken.INTER_CHARACTER
+
+        if tokens:
+            yield tokens
+
+    def decode_text(self, blocks: Iterable[npt.NDArray]) -> Iterator[str]:
+        """
+        Yields:
+            Decoded text as soon as characters are complete
+        """
+        return tokens_to_text(self.decode_tokens(blocks))
+
+    def decode(self, audio: npt.NDArray):
+        return "".join(self.decode_text([audio]))
+
+
+_INVERSE_MORSE_CODES = invert_morse_codes(morse_codes.DEFAULT_MORSE_CODES)
+
+
+def tokens_to_text(token_chunks: Iterable[str], inverse_codes: dict[str, str] = _INVERSE_MORSE_CODES) -> Iterator[str]:
+    """
+    Maps token strings in MorseTokenizer layout back to text. Characters may span chunks
+
+    Yields:
+        Text of characters completed by every chunk
+    """
+    carry = ""
+
+    for chunk in token_chunks:
+        *codes, carry = (carry + chunk).split(MorseToken.INTER_CHARACTER)
+        text = []
+
+        for code in codes:
+            if code == MorseToken.INTER_WORD:
+                text.append(" ")
+            else:
+                text.append(inverse_codes.get(code.replace(MorseToken.INTRA_CHARACTER, ""), DECODER_UNKNOWN_CHARACTER))
+
+        if text:
+            yield "".join(text)
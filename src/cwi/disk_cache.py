@@ -0,0 +1,142 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+import numpy.typing as npt
+
+from cwi.log import logger
+from cwi.const.service import DISK_CACHE_FORMAT_VERSION
+from cwi.data_structures import TokenString
+
+
+class DiskAudioCache:
+    """
+    Persistent cache of rendered audio stored as .npy files, each with its peak in a .peak file.
+    Hits are memory-mapped, so they are never loaded into RAM as a whole.
+    Least recently used files are removed once the directory exceeds max_bytes.
+    Keys include DISK_CACHE_FORMAT_VERSION, so entries of older synthesis are never hit
+    """
+    
+    SUFFIX = ".npy"
+    PEAK_SUFFIX = ".peak"
+    
+    def __init__(self, directory: str | os.PathLike, max_bytes: int):
+        self.__directory = Path(directory)
+        self.__max_bytes = max_bytes
+        
+        self.__directory.mkdir(parents=True, exist_ok=True)
+        
+        logger.debug(f"{self.__class__.__name__} initialized with {self.__directory=}, {max_bytes=}")
+        
+    @staticmethod
+    def make_key(token_string: TokenString, *parameters) -> str:
+        digest = hashlib.sha256()
+        digest.update(f"v{DISK_CACHE_FORMAT_VERSION}|".encode())
+        digest.update("|".join(map(str, parameters)).encode())
+        digest.update(b"|")
+        digest.update(token_string.codes)
+        
+        return digest.hexdigest()
+    
+    def __path_of(self, key: str):
+        return self.__directory / f"{key}{self.SUFFIX}"
+        
+    def load(self, key: str) -> npt.NDArray | None:
+        """
+        Returns:
+            Read-only memory-mapped audio or None if key is not cached
+        """
+        path = self.__path_of(key)
+        
+        try:
+            audio = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except FileNotFoundError:
+            logger.debug(f"{self.__class__.__name__} [miss] {key}")
+            return None
+        except (OSError, ValueError):
+            logger.exception(f"{self.__class__.__name__} corrupted entry {path}, removing")
+            path.unlink(missing_ok=True)
+            return None
+        
+        logger.debug(f"{self.__class__.__name__} [hit] {key}")
+        return audio
+    
+    def load_peak(self, key: str) -> float | None:
+        """
+        Returns:
+            Absolute peak of cached audio or None if it is not stored
+        """
+        try:
+            return float(self.__path_of(key).with_suffix(self.PEAK_SUFFIX).read_text())
+        except (OSError, ValueError):
+            logger.debug(f"{self.__class__.__name__} no peak of {key}")
+            return None
+    
+    def store_blocks(self, key: str, blocks: Iterable[npt.NDArray], total_samples: int, peak: float,
+                     dtype: npt.DTypeLike = np.float32) -> Iterator[npt.NDArray]:
+        """
+        Passes blocks through while writing them to the cache.
+        Entry is committed only if all total_samples were written
+        """
+        path = self.__path_of(key)
+        temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        
+        try:
+            audio = np.lib.format.open_memmap(temp_path, mode="w+", dtype=dtype, shape=(total_samples,))
+        except OSError:
+            logger.exception(f"{self.__class__.__name__} failed to create entry {path}")
+            yield from blocks
+            return
+            
+        offset = 0
+        completed = False
+        
+        try:
+            for block in blocks:
+                audio[offset:offset + block.size] = block
+                offset += block.size
+                yield block
+                
+            audio.flush()
+            completed = offset == total_samples
+        finally:
+            del audio
+            
+            if completed:
+                # Peak goes first, so every committed entry has one
+                path.with_suffix(self.PEAK_SUFFIX).write_text(repr(peak))
+                os.replace(temp_path, path)
+                logger.debug(f"{self.__class__.__name__} [store] {key}")
+                self.evict()
+            else:
+                temp_path.unlink(missing_ok=True)
+                logger.debug(f"{self.__class__.__name__} {key} discarded: {offset=}, {total_samples=}")
+            
+    def evict(self):
+        entries = []
+        
+        for path in self.__directory.glob(f"*{self.SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            
+        total_bytes = sum(size for _, size, _ in entries)
+        
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.__max_bytes:
+                break
+            
+            try:
+                path.unlink(missing_ok=True)
+                path.with_suffix(self.PEAK_SUFFIX).unlink(missing_ok=True)
+            except OSError:
+                logger.exception(f"{self.__class__.__name__} failed to evict {path.name}")
+                continue
+            
+            total_bytes -= size
+            logger.debug(f"{self.__class__.__name__} [evict] {path.name}")
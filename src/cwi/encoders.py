@@ -0,0 +1,218 @@
+import struct
+from abc import ABC, abstractmethod
+
+import numpy as np
+import numpy.typing as npt
+
+from cwi.const.service import IMA_ADPCM_BLOCK_ALIGN, IMA_ADPCM_BATCH_BLOCKS
+from cwi.data_structures import AudioFormat
+
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_MULAW = 0x0007
+WAVE_FORMAT_IMA_ADPCM = 0x0011
+
+
+class SampleEncoder(ABC):
+    """
+    Streaming encoder of int16 mono samples into WAV data chunk bytes
+    """
+    
+    FORMAT_TAG = WAVE_FORMAT_PCM
+    BITS_PER_SAMPLE = 16
+    
+    @property
+    def block_align(self):
+        return self.BITS_PER_SAMPLE // 8
+    
+    @property
+    def samples_per_block(self):
+        return 1
+    
+    @property
+    def fmt_extension(self) -> bytes | None:
+        """
+        Bytes following cbSize in fmt chunk; None for plain PCM without cbSize
+        """
+        return None
+    
+    def data_size(self, sample_count: int):
+        return -(-sample_count // self.samples_per_block) * self.block_align
+    
+    @abstractmethod
+    def encode(self, samples: npt.NDArray[np.int16]) -> npt.NDArray:
+        """
+        Returns:
+            Encoded bytes of all samples that can be encoded so far
+        """
+        pass
+    
+    def flush(self) -> npt.NDArray:
+        """
+        Returns:
+            Encoded bytes of buffered samples, padded to a full block
+        """
+        return np.empty(0, dtype=np.uint8)
+    
+    
+class Pcm16Encoder(SampleEncoder):
+    def encode(self, samples: npt.NDArray[np.int16]):
+        return np.asarray(samples, dtype="<i2")
+
+
+class Pcm8Encoder(SampleEncoder):
+    """
+    8-bit unsigned PCM, top byte of each sample offset by 128
+    """
+    
+    BITS_PER_SAMPLE = 8
+    
+    def encode(self, samples: npt.NDArray[np.int16]):
+        encoded = np.right_shift(samples, 8).astype(np.uint8)
+        encoded += 128
+        return encoded
+
+
+class MulawEncoder(SampleEncoder):
+    """
+    G.711 mu-law
+    """
+    
+    FORMAT_TAG = WAVE_FORMAT_MULAW
+    BITS_PER_SAMPLE = 8
+    
+    __BIAS = 0x84
+    __CLIP = 32635
+    # Position of the highest set bit of (biased magnitude >> 7)
+    __EXPONENTS = np.concatenate([[0], np.floor(np.log2(np.arange(1, 256))).astype(np.uint8)]).astype(np.uint8)
+    
+    @property
+    def fmt_extension(self):
+        return b""
+    
+    def encode(self, samples: npt.NDArray[np.int16]):
+        samples = samples.astype(np.int32)
+        sign = np.where(samples < 0, 0x80, 0).astype(np.uint8)
+        magnitude = np.minimum(np.abs(samples), self.__CLIP) + self.__BIAS
+        exponent = self.__EXPONENTS[magnitude >> 7]
+        mantissa = (magnitude >> (exponent + 3)) & 0x0F
+        
+        return ~(sign | (exponent << 4) | mantissa.astype(np.uint8))
+
+
+class ImaAdpcmEncoder(SampleEncoder):
+    """
+    IMA (DVI) ADPCM in WAV blocks. Every block starts from its own first sample
+    and an initial step index estimated from the block, so blocks are independent
+    and a batch of blocks is encoded in lockstep, vectorized across blocks
+    """
+    
+    FORMAT_TAG = WAVE_FORMAT_IMA_ADPCM
+    BITS_PER_SAMPLE = 4
+    
+    STEP_TABLE = np.array([
+        7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+        50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+        253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+        1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+        3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487,
+        12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767,
+    ], dtype=np.int32)
+    INDEX_TABLE = np.array([-1, -1, -1, -1, 2, 4, 6, 8], dtype=np.int32)
+    
+    def __init__(self, block_align: int = IMA_ADPCM_BLOCK_ALIGN, batch_blocks: int = IMA_ADPCM_BATCH_BLOCKS):
+        if block_align <= 4:
+            raise ValueError(f"Block align must exceed 4-byte block header: {block_align=}")
+        
+        self.__block_align = block_align
+        self.__samples_per_block = (block_align - 4) * 2 + 1
+        self.__batch_samples = self.__samples_per_block * batch_blocks
+        self.__pending = np.empty(0, dtype=np.int16)
+        
+    @property
+    def block_align(self):
+        return self.__block_align
+    
+    @property
+    def samples_per_block(self):
+        return self.__samples_per_block
+    
+    @property
+    def fmt_extension(self):
+        return struct.pack("<H", self.__samples_per_block)
+    
+    def encode(self, samples: npt.NDArray[np.int16]):
+        # Always copies: callers may reuse the samples buffer for the next block
+        self.__pending = np.concatenate([self.__pending, np.asarray(samples, dtype=np.int16)])
+        
+        if self.__pending.size < self.__batch_samples:
+            return np.empty(0, dtype=np.uint8)
+        
+        full_samples = self.__pending.size - self.__pending.size % self.__samples_per_block
+        encoded = self.encode_blocks(self.__pending[:full_samples].reshape(-1, self.__samples_per_block))
+        self.__pending = self.__pending[full_samples:].copy()
+        
+        return encoded.ravel()
+    
+    def flush(self):
+        if not self.__pending.size:
+            return np.empty(0, dtype=np.uint8)
+        
+        blocks_count = -(-self.__pending.size // self.__samples_per_block)
+        blocks = np.zeros(blocks_count * self.__samples_per_block, dtype=np.int16)
+        blocks[:self.__pending.size] = self.__pending
+        self.__pending = np.empty(0, dtype=np.int16)
+        
+        return self.encode_blocks(blocks.reshape(blocks_count, -1)).ravel()
+        
+    def encode_blocks(self, blocks: npt.NDArray[np.int16]):
+        """
+        Encodes (blocks, samples_per_block) array
+        
+        Returns:
+            (blocks, block_align) uint8 array
+        """
+        blocks_count = blocks.shape[0]
+        samples = blocks.astype(np.int32)
+        
+        predictor = samples[:, 0].copy()
+        initial_index = np.searchsorted(self.STEP_TABLE, np.abs(np.diff(samples[:, :2], axis=1))[:, 0] // 2)
+        index = np.clip(initial_index, 0, len(self.STEP_TABLE) - 1).astype(np.int32)
+        
+        encoded = np.zeros((blocks_count, self.__block_align), dtype=np.uint8)
+        encoded[:, 0:2] = predictor.astype("<i2").view(np.uint8).reshape(blocks_count, 2)
+        encoded[:, 2] = index
+        
+        nibbles = np.empty((blocks_count, self.__samples_per_block - 1), dtype=np.uint8)
+        
+        for position in range(1, self.__samples_per_block):
+            step = self.STEP_TABLE[index]
+            difference = samples[:, position] - predictor
+            negative = difference < 0
+            difference = np.abs(difference)
+            
+            code = np.zeros(blocks_count, dtype=np.int32)
+            delta = step >> 3
+            
+            for bit, fraction in ((4, 0), (2, 1), (1, 2)):
+                bit_step = step >> fraction
+                is_set = difference >= bit_step
+                code |= np.where(is_set, bit, 0)
+                difference -= np.where(is_set, bit_step, 0)
+                delta += np.where(is_set, bit_step, 0)
+                
+            predictor = np.clip(np.where(negative, predictor - delta, predictor + delta), -32768, 32767)
+            index = np.clip(index + self.INDEX_TABLE[code], 0, len(self.STEP_TABLE) - 1)
+            nibbles[:, position - 1] = code | np.where(negative, 8, 0)
+            
+        encoded[:, 4:] = nibbles[:, 0::2] | (nibbles[:, 1::2] << 4)
+        
+        return encoded
+
+
+ENCODERS = {
+    AudioFormat.PCM16: Pcm16Encoder,
+    AudioFormat.PCM8: Pcm8Encoder,
+    AudioFormat.MULAW: MulawEncoder,
+    AudioFormat.IMA_ADPCM: ImaAdpcmEncoder,
+}
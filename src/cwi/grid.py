@@ -0,0 +1,201 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from typing import Callable, Iterable
+
+import numpy as np
+import numpy.typing as npt
+
+from cwi.log import logger
+from cwi.const.service import GRID_VARIANTS_PER_TASK, SAVING_BUFFER_SIZE
+from cwi.converters import MorseTokenizer
+from cwi.audio_sampler import MorseAudioSampler
+from cwi.data_structures import RenderVariant, AudioData, AudioFormat, BatchReport
+from cwi.encoders import ENCODERS
+from cwi.metrics import registry
+from cwi.timer import Timer
+from cwi.tone_generators import TONE_GENERATORS
+from cwi.utils import chunked
+from cwi.writers import WavWriter
+
+
+_worker_renderer: "GridRenderer" = None
+
+
+class GridRenderer:
+    """
+    Renders one message with many variants of tone, frequency and speed.
+
+    Message is tokenized once. Variants of equal token lengths, i.e. of one speed, share
+    the bank index of every sample (see MorseAudioSampler.bank_indices), computed once per group,
+    so every variant is rendered by a single gather from its own tone bank.
+    Index array of the group being rendered is kept (8 bytes per sample).
+    Variants of equal settings share one MorseAudioSampler
+    """
+
+    def __init__(self, message: str, variants: Iterable[RenderVariant], sample_rate: int, tokenizer: MorseTokenizer | None = None):
+        tokenizer = tokenizer or MorseTokenizer()
+        samplers: dict[RenderVariant, MorseAudioSampler] = {}
+
+        with registry.stage("tokenize"):
+            self.__token_string = tokenizer.tokenize(message)
+
+        self.__sample_rate = sample_rate
+        self.__variants = list(variants)
+        self.__samplers = []
+        self.__groups: dict[bytes, list[int]] = {}
+        self.__bank_indices = (None, None)
+
+        for index, variant in enumerate(self.__variants):
+            if (sampler := samplers.get(variant)) is None:
+                try:
+                    tone_generator = TONE_GENERATORS[variant.tone](variant.frequency, sample_rate)
+                except KeyError:
+                    raise ValueError(f"Invalid tone generator type provided: {variant.tone}")
+
+                sampler = samplers[variant] = MorseAudioSampler(tone_generator, 1.2 / variant.words_per_minute)
+
+            self.__samplers.append(sampler)
+            self.__groups.setdefault(sampler.layout_key, []).append(index)
+
+        logger.debug(f"{self.__class__.__name__} initialized with {len(self.__variants)} variants, "
+                     f"{len(samplers)} samplers, {len(self.__groups)} groups, {self.__token_string.length} tokens")
+
+    @property
+    def variants(self):
+        return self.__variants
+
+    @property
+    def token_string(self):
+        return self.__token_string
+
+    @property
+    def sample_rate(self):
+        return self.__sample_rate
+
+    @property
+    def groups(self):
+        """
+        Returns:
+            Indices of variants sharing bank indices, per group
+        """
+        return list(self.__groups.values())
+
+    def count_samples(self, index: int):
+        return self.__samplers[index].count_samples(self.__token_string)
+
+    def __group_bank_indices(self, sampler: MorseAudioSampler):
+        key, indices = self.__bank_indices
+
+        if key != sampler.layout_key:
+            # Previous group's indices are dropped first, only one array is held at a time
+            self.__bank_indices = (None, None)
+
+            with registry.stage("layout"):
+                indices = sampler.bank_indices(sampler.encode_tokens(self.__token_string))
+
+            self.__bank_indices = (sampler.layout_key, indices)
+
+        return indices
+
+    def render(self, index: int, out: npt.NDArray | None = None):
+        """
+        Renders variant into out, count_samples() long, allocated if not provided.
+        Rendering variants group by group (see groups) computes bank indices once per group,
+        one out can be reused within a group
+
+        Returns:
+            AudioData of variant
+        """
+        sampler = self.__samplers[index]
+        indices = self.__group_bank_indices(sampler)
+
+        with registry.stage("render", indices.size):
+            return sampler.gather_audio_data(indices, out)
+
+
+def variant_file_name(variant: RenderVariant):
+    return f"{variant.tone}_{variant.frequency:g}hz_{variant.words_per_minute}wpm.wav"
+
+
+def save_wav(audio_data: AudioData, path: str, sample_rate: int, audio_format: str = AudioFormat.PCM16):
+    """
+    Writes audio as WAV file, converted to int16 block by block in one reused buffer
+    """
+    buffer = np.empty(SAVING_BUFFER_SIZE, dtype=np.int16)
+    encoder = ENCODERS[AudioFormat(audio_format)]()
+
+    with open(path, "wb") as file, WavWriter(file, sample_rate, audio_data.data.size, encoder) as writer:
+        for block in chunked(audio_data.data, SAVING_BUFFER_SIZE):
+            with registry.stage("convert", block.size):
+                converted = AudioData(block, audio_data.peak).to_int16(buffer[:block.size])
+            with registry.stage("write", block.size):
+                writer.write(converted)
+
+
+def _init_worker(renderer: GridRenderer):
+    global _worker_renderer
+    _worker_renderer = renderer
+
+
+def _render_task(indices: list[int], outputs: list[str], audio_format: str):
+    """
+    Returns:
+        Duration of every rendered variant [seconds], None where saving failed
+    """
+    durations = []
+    # Variants of a task share one group, so one output buffer of their common length is reused
+    buffer = None
+
+    for index, output in zip(indices, outputs):
+        audio_data = _worker_renderer.render(index, buffer)
+        buffer = audio_data.data
+
+        try:
+            save_wav(audio_data, output, _worker_renderer.sample_rate, audio_format)
+        except OSError:
+            logger.exception(f"Failed to save variant {index} to {output=}")
+            durations.append(None)
+        else:
+            durations.append(audio_data.data.size / _worker_renderer.sample_rate)
+
+    return durations
+
+
+def render_grid(renderer: GridRenderer, outputs: list[str], max_workers: int = 1, audio_format: str = AudioFormat.PCM16,
+                on_complete: Callable[[], None] = None):
+    """
+    Renders every variant of renderer to its WAV file of outputs, in tasks of up to
+    GRID_VARIANTS_PER_TASK variants of one group. With max_workers above 1, tasks run
+    in a process pool, every worker receives the tokenized renderer once.
+    on_complete is called after every saved variant
+    """
+    timer = Timer("Grid").tic()
+    report = BatchReport(len(outputs))
+
+    if len(outputs) != len(renderer.variants):
+        raise ValueError(f"{len(outputs)} outputs for {len(renderer.variants)} variants")
+
+    tasks = [indices for group in renderer.groups for indices in chunked(group, GRID_VARIANTS_PER_TASK)]
+    task_outputs = [[outputs[index] for index in indices] for indices in tasks]
+
+    with ExitStack() as stack:
+        if max_workers > 1:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(renderer,)))
+            results = executor.map(_render_task, tasks, task_outputs, [audio_format] * len(tasks))
+        else:
+            _init_worker(renderer)
+            results = map(_render_task, tasks, task_outputs, [audio_format] * len(tasks))
+
+        for durations in results:
+            for audio_seconds in durations:
+                if audio_seconds is None:
+                    report.failed += 1
+                else:
+                    report.audio_seconds += audio_seconds
+
+                if on_complete is not None:
+                    on_complete()
+
+    report.elapsed = timer.toc()
+
+    return report
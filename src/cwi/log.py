@@ -0,0 +1,39 @@
+"""
+Lazy loguru logger shared by cwi modules
+
+Importing loguru also imports asyncio and multiprocessing, a large part of CLI startup,
+so loguru is loaded only by enable(). Until then, log calls are dropped
+"""
+
+
+def _drop(*args, **kwargs):
+    pass
+
+
+class LazyLogger:
+    def __init__(self):
+        self.__logger = None
+
+    @property
+    def enabled(self):
+        return self.__logger is not None
+
+    def enable(self):
+        """
+        Returns:
+            loguru logger, all further log calls are forwarded to it
+        """
+        if self.__logger is None:
+            from loguru import logger
+            self.__logger = logger
+
+        return self.__logger
+
+    def __getattr__(self, name: str):
+        if self.__logger is None:
+            return _drop
+
+        return getattr(self.__logger, name)
+
+
+logger = LazyLogger()
@@ -0,0 +1,135 @@
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict
+from time import process_time
+from typing import Iterable, Iterator
+
+
+from cwi.log import logger
+from cwi.data_structures import StageMetrics, CacheStatistics
+from cwi.timer import Timer
+
+
+_DISABLED = nullcontext()
+
+
+class MetricsRegistry:
+    """
+    Collects wall time, CPU time, samples and (while tracemalloc is tracing) allocated bytes
+    of pipeline stages. When disabled, stage() returns one shared no-op context manager,
+    so instrumentation can stay in place
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.__stages: dict[str, StageMetrics] = {}
+        self.__caches: dict[str, CacheStatistics] = {}
+
+    @property
+    def stages(self):
+        return self.__stages
+
+    def stage(self, name: str, samples: int = 0):
+        if not self.enabled:
+            return _DISABLED
+
+        return self.__measure(name, samples)
+
+    @contextmanager
+    def __measure(self, name: str, samples: int):
+        stage = self.__stages.setdefault(name, StageMetrics())
+        tracing = tracemalloc.is_tracing()
+
+        if tracing:
+            allocated_before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+
+        wall_timer = Timer(name).tic()
+        cpu_timer = Timer(name, process_time).tic()
+
+        try:
+            yield stage
+        finally:
+            stage.wall_time += wall_timer.toc()
+            stage.cpu_time += cpu_timer.toc()
+            stage.calls += 1
+            stage.samples += samples
+
+            if tracing:
+                _, peak = tracemalloc.get_traced_memory()
+                stage.bytes_allocated = (stage.bytes_allocated or 0) + peak - allocated_before
+
+    def iterate(self, name: str, blocks: Iterable) -> Iterator:
+        """
+        Measures production of every block of a lazy pipeline as a call of stage name
+        """
+        if not self.enabled:
+            return iter(blocks)
+
+        return self.__iterate(name, iter(blocks))
+
+    def __iterate(self, name: str, blocks: Iterator):
+        while True:
+            with self.__measure(name, 0) as stage:
+                block = next(blocks, None)
+
+            if block is None:
+                stage.calls -= 1
+                return
+
+            stage.samples += len(block)
+            yield block
+
+    def add_samples(self, name: str, samples: int):
+        if self.enabled:
+            self.__stages.setdefault(name, StageMetrics()).samples += samples
+
+    def record_cache(self, name: str, statistics: CacheStatistics):
+        if self.enabled:
+            self.__caches[name] = statistics
+
+    def clear(self):
+        self.__stages.clear()
+        self.__caches.clear()
+
+    def as_dict(self):
+        return {
+            "stages": {name: asdict(stage) | {"samples_per_second": stage.samples_per_second}
+                       for name, stage in self.__stages.items()},
+            "caches": {name: asdict(statistics) | {"hit_rate": statistics.hit_rate}
+                       for name, statistics in self.__caches.items()},
+        }
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def profiled(prefix: str, top: int = 25):
+    """
+    Runs the block under cProfile and tracemalloc, then writes
+    prefix.prof (pstats) and prefix.memory.txt (top allocation sites)
+    """
+    import cProfile
+    
+    profile = cProfile.Profile()
+    tracemalloc.start()
+    profile.enable()
+
+    try:
+        yield
+    finally:
+        profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profile.dump_stats(f"{prefix}.prof")
+
+        with open(f"{prefix}.memory.txt", "w", encoding="UTF-8") as file:
+            file.write(f"current: {current} bytes, peak: {peak} bytes\n\n")
+
+            for statistic in snapshot.statistics("lineno")[:top]:
+                file.write(f"{statistic}\n")
+
+        logger.info(f"Profile written to {prefix}.prof and {prefix}.memory.txt")
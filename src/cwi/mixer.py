@@ -0,0 +1,161 @@
+from typing import Iterable, Iterator
+
+import numpy as np
+import numpy.typing as npt
+
+from cwi.log import logger
+from cwi.const.service import MIXER_BLOCK_SIZE
+from cwi.converters import MorseTokenizer
+from cwi.audio_sampler import MorseAudioSampler
+from cwi.data_structures import Station, AudioData
+from cwi.metrics import registry
+from cwi.tone_generators import TONE_GENERATORS
+
+
+class PileupMixer:
+    """
+    Mixes morse signals of many stations into one float32 signal.
+
+    Every station is tokenized once to token codes and absolute sample positions.
+    A window of output is mixed by rendering only tokens of each station that overlap it
+    into one reused scratch buffer and accumulating that in place, so memory depends on
+    window size only, not on the number of stations or length of their messages.
+    Stations with equal tone, frequency and speed share one MorseAudioSampler.
+    Windows are rendered by uncached scatter: stations rarely share a sampler, so glyph
+    and word caches would grow per station and, measured, slow mixing down several times
+    """
+
+    def __init__(self, stations: Iterable[Station], sample_rate: int, tokenizer: MorseTokenizer | None = None):
+        tokenizer = tokenizer or MorseTokenizer()
+        samplers: dict[tuple, MorseAudioSampler] = {}
+
+        self.__sample_rate = sample_rate
+        self.__tracks = []
+        self.__length = 0
+        self.__peak = 0.0
+        self.__scratch = np.empty(0, dtype=np.float32)
+
+        for station in stations:
+            if station.offset < 0:
+                raise ValueError(f"Station offset must not be negative: {station}")
+
+            key = (station.tone, station.frequency, station.words_per_minute)
+
+            if (sampler := samplers.get(key)) is None:
+                try:
+                    tone_generator = TONE_GENERATORS[station.tone](station.frequency, sample_rate)
+                except KeyError:
+                    raise ValueError(f"Invalid tone generator type provided: {station.tone}")
+
+                sampler = samplers[key] = MorseAudioSampler(tone_generator, 1.2 / station.words_per_minute)
+
+            with registry.stage("tokenize"):
+                codes = sampler.encode_tokens(tokenizer.tokenize(station.message.strip()))
+
+            if not codes.size:
+                logger.warning(f"{self.__class__.__name__} station without message skipped: {station}")
+                continue
+
+            lengths = sampler.token_lengths(codes)
+            ends = round(station.offset * sample_rate) + np.cumsum(lengths)
+
+            self.__tracks.append((sampler, codes, ends - lengths, ends, np.float32(station.amplitude)))
+            self.__length = max(self.__length, int(ends[-1]))
+            self.__peak += abs(station.amplitude) * sampler.peak
+
+        logger.debug(f"{self.__class__.__name__} initialized with {len(self.__tracks)} stations, "
+                     f"{len(samplers)} samplers, {self.__length} samples")
+
+    @property
+    def sample_rate(self):
+        return self.__sample_rate
+
+    @property
+    def length(self):
+        """
+        Returns:
+            Sample count of the mix, up to the end of the last station
+        """
+        return self.__length
+
+    @property
+    def duration(self):
+        return self.__length / self.__sample_rate
+
+    @property
+    def peak(self):
+        """
+        Returns:
+            Upper bound of the mix absolute peak (all stations key down at once),
+            known before mixing, so streamed blocks can be normalized consistently
+        """
+        return self.__peak
+
+    def __scratch_buffer(self, size: int):
+        if self.__scratch.size < size:
+            self.__scratch = np.empty(size, dtype=np.float32)
+
+        scratch = self.__scratch[:size]
+        scratch.fill(0)
+
+        return scratch
+
+    def mix_into(self, out: npt.NDArray[np.float32], start: int = 0):
+        """
+        Overwrites out with samples [start, start + out.size) of the mix
+
+        Returns:
+            out
+        """
+        stop = start + out.size
+        out.fill(0)
+
+        for sampler, codes, starts, ends, amplitude in self.__tracks:
+            first = int(np.searchsorted(ends, start, side="right"))
+            last = int(np.searchsorted(starts, stop, side="left"))
+
+            if first >= last:
+                continue
+
+            # Tokens at window edges are rendered whole, only their overlap is mixed
+            span_start, span_end = int(starts[first]), int(ends[last - 1])
+            scratch = self.__scratch_buffer(span_end - span_start)
+            sampler.render_codes_into(codes[first:last], scratch)
+
+            overlap_start, overlap_end = max(start, span_start), min(stop, span_end)
+            segment = scratch[overlap_start - span_start:overlap_end - span_start]
+
+            if amplitude != 1:
+                segment *= amplitude
+
+            out[overlap_start - start:overlap_end - start] += segment
+
+        return out
+
+    def mix(self, block_size: int = MIXER_BLOCK_SIZE):
+        """
+        Returns:
+            Whole mix, rendered window by window into one preallocated buffer
+        """
+        audio = np.empty(self.__length, dtype=np.float32)
+
+        with registry.stage("render", audio.size):
+            for start in range(0, audio.size, block_size):
+                self.mix_into(audio[start:start + block_size], start)
+
+        # max/min instead of abs: no temporary of the mix size
+        return AudioData(audio, max(float(audio.max(initial=0)), -float(audio.min(initial=0))))
+
+    def mix_blocks(self, block_size: int = MIXER_BLOCK_SIZE) -> Iterator[npt.NDArray[np.float32]]:
+        """
+        Lazily mixes the signal as a sequence of fixed-size sample blocks.
+        Only the last block may be shorter than block_size
+
+        Yields:
+            Raw (not normalized, see peak) mixed samples
+        """
+        return registry.iterate("render", self.__blocks(block_size))
+
+    def __blocks(self, block_size: int):
+        for start in range(0, self.__length, block_size):
+            yield self.mix_into(np.empty(min(block_size, self.__length - start), dtype=np.float32), start)
@@ -0,0 +1,101 @@
+from typing import Callable
+
+import numpy as np
+import numpy.typing as npt
+
+from cwi.log import logger
+from cwi.const.service import WAVETABLE_SIZE
+
+
+PHASE_BITS = 32
+
+
+class Wavetable:
+    """
+    Single cycle of a periodic waveform sampled at `size` points,
+    read with linear interpolation by a fixed-point phase
+    """
+    
+    def __init__(self, waveform: Callable[[npt.NDArray], npt.NDArray], size: int = WAVETABLE_SIZE):
+        if size < 2 or size & (size - 1):
+            raise ValueError(f"Wavetable size must be a power of two: {size=}")
+        
+        # Guard point is evaluated at the end of the cycle rather than copied from its start,
+        # so discontinuities at the cycle boundary (sawtooth) are not smeared into the last cell
+        cycle = np.asarray(waveform(np.arange(size + 1) / size), dtype=np.float32)
+        
+        self.__size = size
+        self.__table = cycle[:-1]
+        self.__slopes = np.diff(cycle)
+        self.__peak = float(np.max(np.abs(cycle)))
+        self.__index_shift = np.uint32(PHASE_BITS - (size.bit_length() - 1))
+        self.__fraction_mask = np.uint32((1 << int(self.__index_shift)) - 1)
+        self.__fraction_scale = np.float32(1 / (1 << int(self.__index_shift)))
+        
+    @property
+    def size(self):
+        return self.__size
+    
+    @property
+    def peak(self):
+        return self.__peak
+        
+    def lookup(self, phases: npt.NDArray[np.uint32], out: npt.NDArray[np.float32]):
+        """
+        Writes waveform values at fixed-point phases (full cycle is 2 ** PHASE_BITS) into out
+        """
+        indices = phases >> self.__index_shift
+        fractions = (phases & self.__fraction_mask).astype(np.float32)
+        fractions *= self.__fraction_scale
+        
+        np.take(self.__slopes, indices, out=out)
+        out *= fractions
+        out += self.__table[indices]
+        
+        return out
+
+
+class WavetableOscillator:
+    """
+    Wavetable reader driven by a 32-bit phase accumulator.
+    Phase wraps by integer overflow; consecutive generate() calls
+    produce one continuous signal
+    """
+    
+    def __init__(self, wavetable: Wavetable, frequency: float, sample_rate: int, phase: float = 0.0):
+        self.__wavetable = wavetable
+        self.__increment = np.uint32(round(frequency / sample_rate * 2 ** PHASE_BITS) % 2 ** PHASE_BITS)
+        self.reset(phase)
+        
+        logger.debug(f"{self.__class__.__name__} initialized with {frequency=}HZ; {sample_rate=}HZ; {wavetable.size=}")
+        
+    @property
+    def phase(self):
+        """
+        Current phase [cycles]
+        """
+        return int(self.__phase) / 2 ** PHASE_BITS
+    
+    def reset(self, phase: float = 0.0):
+        self.__phase = np.uint32(round(phase % 1.0 * 2 ** PHASE_BITS) % 2 ** PHASE_BITS)
+        
+    def generate(self, samples: int, out: npt.NDArray[np.float32] | None = None):
+        """
+        Produces next `samples` samples, continuing from the current phase
+        
+        Returns:
+            float32 array, `out` if provided
+        """
+        if out is None:
+            out = np.empty(samples, dtype=np.float32)
+        elif out.size != samples:
+            raise ValueError(f"Output buffer size mismatch: {out.size=}, {samples=}")
+        
+        phases = np.arange(samples, dtype=np.uint32)
+        phases *= self.__increment
+        phases += self.__phase
+        
+        self.__wavetable.lookup(phases, out)
+        self.__phase = np.uint32((int(self.__phase) + int(self.__increment) * samples) % 2 ** PHASE_BITS)
+        
+        return out
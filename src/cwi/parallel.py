@@ -0,0 +1,93 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import numpy.typing as npt
+
+from cwi.log import logger
+from cwi.audio_sampler import MorseAudioSampler
+from cwi.data_structures import TokenString, MorseToken, AudioData
+
+
+_worker_sampler: MorseAudioSampler = None
+
+
+def _init_worker(sampler: MorseAudioSampler):
+    global _worker_sampler
+    _worker_sampler = sampler
+
+
+def _render_segment(shared_memory_name: str, total_samples: int, codes: npt.NDArray[np.uint8], offset: int):
+    shared_memory = SharedMemory(shared_memory_name)
+    
+    try:
+        audio = np.ndarray((total_samples,), dtype=_worker_sampler.dtype, buffer=shared_memory.buf)
+        segment = audio[offset:offset + int(_worker_sampler.token_lengths(codes).sum())]
+        segment[:] = 0
+        _worker_sampler.render_codes_into(codes, segment)
+        del audio, segment
+    finally:
+        shared_memory.close()
+
+
+def split_at_words(codes: npt.NDArray[np.uint8], lengths: npt.NDArray, segments: int):
+    """
+    Splits token codes right after inter-word pauses into at most `segments`
+    parts of roughly equal sample count
+    
+    Returns:
+        List of (first token, last token + 1, first sample) tuples
+    """
+    ends = np.cumsum(lengths)
+    word_ends = np.flatnonzero(codes == list(MorseToken).index(MorseToken.INTER_WORD)) + 1
+    
+    if segments <= 1 or word_ends.size == 0:
+        return [(0, codes.size, 0)]
+    
+    targets = ends[-1] * np.arange(1, segments) / segments
+    split_points = word_ends[np.searchsorted(ends[word_ends - 1], targets).clip(max=word_ends.size - 1)]
+    bounds = np.unique(np.concatenate([[0], split_points, [codes.size]]))
+    
+    return [(int(start), int(end), int(ends[start - 1]) if start else 0) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+@contextmanager
+def produce_audio_data_parallel(sampler: MorseAudioSampler, token_string: TokenString, workers: int):
+    """
+    Renders token string with a pool of worker processes writing directly
+    into one shared memory buffer. Output is identical to the serial render.
+    
+    Yields:
+        AudioData backed by shared memory, valid only inside the context
+    """
+    codes = sampler.encode_tokens(token_string)
+    lengths = sampler.token_lengths(codes)
+    total_samples = int(lengths.sum())
+    segments = split_at_words(codes, lengths, workers)
+    
+    logger.debug(f"Parallel render: {total_samples=}, {workers=}, {len(segments)} segments")
+    
+    shared_memory = SharedMemory(create=True, size=max(1, total_samples * sampler.dtype.itemsize))
+    
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(sampler,)) as executor:
+            futures = [
+                executor.submit(_render_segment, shared_memory.name, total_samples, codes[start:end], offset)
+                for start, end, offset in segments
+            ]
+            for future in futures:
+                future.result()
+                
+        audio = np.ndarray((total_samples,), dtype=sampler.dtype, buffer=shared_memory.buf)
+        
+        try:
+            yield AudioData(audio, sampler.peak)
+        finally:
+            del audio
+    finally:
+        try:
+            shared_memory.close()
+        except BufferError:
+            logger.warning("Shared audio buffer is still referenced outside of the render context")
+        shared_memory.unlink()
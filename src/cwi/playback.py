@@ -0,0 +1,207 @@
+import threading
+from time import sleep
+from typing import Callable, Iterable, Protocol
+
+import numpy as np
+import numpy.typing as npt
+
+from cwi.log import logger
+from cwi.data_structures import PlaybackStatistics
+
+
+# PortAudio callback return codes (pyaudio.paContinue, pyaudio.paComplete)
+CALLBACK_CONTINUE = 0
+CALLBACK_COMPLETE = 1
+
+
+class OutputStream(Protocol):
+    def start_stream(self): ...
+    def stop_stream(self): ...
+    def is_active(self) -> bool: ...
+    def close(self): ...
+    
+    
+StreamCallback = Callable[[bytes | None, int, dict, int], tuple[bytes, int]]
+
+
+class RingBuffer:
+    """
+    Preallocated single-producer single-consumer sample queue.
+    Writes block while the buffer is full, reads never block
+    """
+    
+    def __init__(self, capacity: int, dtype: npt.DTypeLike = np.float32):
+        if capacity <= 0:
+            raise ValueError(f"Capacity must be positive: {capacity=}")
+        
+        self.__buffer = np.zeros(capacity, dtype=dtype)
+        self.__capacity = capacity
+        self.__written = 0
+        self.__read = 0
+        self.__closed = False
+        self.__aborted = False
+        self.__condition = threading.Condition()
+        
+    @property
+    def available(self):
+        return self.__written - self.__read
+    
+    @property
+    def closed(self):
+        return self.__closed
+    
+    @property
+    def aborted(self):
+        return self.__aborted
+        
+    def write(self, samples: npt.NDArray):
+        """
+        Copies all samples into the buffer, waiting for free space.
+        Returns early if the buffer is aborted
+        """
+        position = 0
+        
+        while position < samples.size:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.available < self.__capacity or self.__aborted)
+                
+                if self.__aborted:
+                    return
+                
+                count = min(self.__capacity - self.available, samples.size - position)
+                self.__copy(samples[position:position + count], self.__written, into_buffer=True)
+                self.__written += count
+                self.__condition.notify_all()
+                
+            position += count
+            
+    def read_into(self, out: npt.NDArray):
+        """
+        Returns:
+            Number of samples copied into the beginning of out
+        """
+        with self.__condition:
+            count = min(self.available, out.size)
+            self.__copy(out[:count], self.__read, into_buffer=False)
+            self.__read += count
+            self.__condition.notify_all()
+            
+        return count
+    
+    def __copy(self, samples: npt.NDArray, counter: int, into_buffer: bool):
+        start = counter % self.__capacity
+        head = min(samples.size, self.__capacity - start)
+        
+        if into_buffer:
+            self.__buffer[start:start + head] = samples[:head]
+            self.__buffer[:samples.size - head] = samples[head:]
+        else:
+            samples[:head] = self.__buffer[start:start + head]
+            samples[head:] = self.__buffer[:samples.size - head]
+    
+    def wait_for(self, samples: int, timeout: float | None = None):
+        """
+        Waits until at least `samples` are available or no more will be written
+        """
+        with self.__condition:
+            return self.__condition.wait_for(lambda: self.available >= samples or self.__closed or self.__aborted, timeout)
+    
+    def close(self):
+        """
+        Marks the end of the stream, no more writes will follow
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+            
+    def abort(self):
+        with self.__condition:
+            self.__closed = True
+            self.__aborted = True
+            self.__condition.notify_all()
+
+
+class CallbackPlayer:
+    """
+    Plays float32 blocks through a callback-mode output stream.
+    Blocks are consumed on a producer thread and passed to the stream callback
+    through a ring buffer, so rendering overlaps with playback
+    """
+    
+    def __init__(self, open_stream: Callable[[StreamCallback], OutputStream], frames_per_buffer: int,
+                 capacity: int, prefill: int | None = None, poll_interval: float = 0.05):
+        self.__open_stream = open_stream
+        self.__frames_per_buffer = frames_per_buffer
+        self.__capacity = capacity
+        self.__prefill = min(capacity, prefill if prefill is not None else frames_per_buffer * 2)
+        self.__poll_interval = poll_interval
+        
+        logger.debug(f"{self.__class__.__name__} initialized with {frames_per_buffer=}, {capacity=}, prefill={self.__prefill}")
+        
+    def play(self, blocks: Iterable[npt.NDArray[np.float32]], on_progress: Callable[[int], None] | None = None):
+        """
+        Plays blocks until exhausted. on_progress receives number of frames played so far
+        
+        Returns:
+            PlaybackStatistics
+        """
+        ring = RingBuffer(self.__capacity)
+        statistics = PlaybackStatistics()
+        producer_errors = []
+        
+        def produce():
+            try:
+                for block in blocks:
+                    ring.write(block)
+                    if ring.aborted:
+                        break
+            except BaseException as error:
+                producer_errors.append(error)
+            finally:
+                ring.close()
+                
+        output = np.zeros(self.__frames_per_buffer, dtype=np.float32)
+                
+        def callback(in_data, frame_count, time_info, status):
+            chunk = output[:frame_count] if frame_count <= output.size else np.zeros(frame_count, dtype=np.float32)
+            count = ring.read_into(chunk)
+            chunk[count:] = 0
+            statistics.frames_played += count
+            
+            if count < frame_count:
+                if ring.closed and ring.available == 0:
+                    return chunk.tobytes(), CALLBACK_COMPLETE
+                
+                statistics.underruns += 1
+                statistics.underrun_frames += frame_count - count
+                
+            return chunk.tobytes(), CALLBACK_CONTINUE
+        
+        producer = threading.Thread(target=produce, name="cwi-playback-producer", daemon=True)
+        producer.start()
+        ring.wait_for(self.__prefill)
+        
+        stream = self.__open_stream(callback)
+        
+        try:
+            stream.start_stream()
+            
+            while stream.is_active():
+                if on_progress is not None:
+                    on_progress(statistics.frames_played)
+                sleep(self.__poll_interval)
+                
+            if on_progress is not None:
+                on_progress(statistics.frames_played)
+        finally:
+            ring.abort()
+            stream.stop_stream()
+            stream.close()
+            producer.join()
+            
+        if producer_errors:
+            raise producer_errors[0]
+        
+        logger.debug(f"{self.__class__.__name__} {statistics}")
+        
+        return statistics
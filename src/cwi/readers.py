@@ -0,0 +1,62 @@
+import wave
+from typing import BinaryIO
+
+import numpy as np
+
+from cwi.log import logger
+
+
+class PcmReader:
+    """
+    Reads raw signed 16-bit little-endian mono samples block by block
+    """
+    
+    def __init__(self, file: BinaryIO, sample_rate: int):
+        self._file = file
+        self._sample_rate = sample_rate
+        
+    @property
+    def sample_rate(self):
+        return self._sample_rate
+    
+    def blocks(self, block_size: int):
+        while data := self._file.read(block_size * 2):
+            yield np.frombuffer(data, dtype="<i2", count=len(data) // 2)
+
+
+class WavReader(PcmReader):
+    """
+    Reads 8-bit or 16-bit PCM WAV files block by block, only the first channel of multichannel files
+    
+    Raises:
+        ValueError: if file is not a PCM WAV file
+    """
+    
+    def __init__(self, file: BinaryIO):
+        try:
+            self.__wave = wave.open(file, "rb")
+        except (wave.Error, EOFError) as error:
+            raise ValueError(f"Unsupported WAV file: {error or 'truncated header'}") from error
+        
+        if self.__wave.getsampwidth() not in (1, 2):
+            raise ValueError(f"Unsupported WAV sample width: {self.__wave.getsampwidth() * 8} bits")
+        
+        super().__init__(file, self.__wave.getframerate())
+        
+        logger.debug(f"{self.__class__.__name__} {self.__wave.getparams()}")
+        
+    @property
+    def frames(self):
+        return self.__wave.getnframes()
+        
+    def blocks(self, block_size: int):
+        sample_width = self.__wave.getsampwidth()
+        channels = self.__wave.getnchannels()
+        
+        while data := self.__wave.readframes(block_size):
+            if sample_width == 1:
+                samples = (np.frombuffer(data, dtype=np.uint8).astype(np.int16) - 128) << 8
+            else:
+                samples = np.frombuffer(data, dtype="<i2")
+                
+            yield samples[::channels]
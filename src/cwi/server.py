@@ -0,0 +1,281 @@
+"""
+Render daemon and its client.
+
+Protocol: client sends one JSON object per line, server answers every request with
+a JSON header line followed by exactly header["bytes"] bytes of audio
+
+    -> {"message": "sos", "sample_rate": 8000, "wav": true}
+    <- {"status": "ok", "samples": 7680, "sample_rate": 8000, "bytes": 15404}
+    <- <15404 bytes of WAV file>
+
+    -> {"command": "stats"}
+    <- {"status": "ok", "requests": 1, ..., "bytes": 0}
+
+Errors are answered with {"status": "error", "error": ..., "bytes": 0}
+and the connection stays open for further requests
+"""
+import asyncio
+import json
+import socket
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from typing import BinaryIO, Callable
+
+from cwi.log import logger
+from cwi.const.service import SAVING_BUFFER_SIZE, SERVER_MAX_APPS, SERVER_REQUEST_MAX_BYTES
+from cwi.data_structures import AudioFormat, RenderRequest, ServerStatistics
+from cwi.encoders import ENCODERS
+from cwi.timer import Timer
+from cwi.writers import wav_header
+
+
+Address = str | tuple[str, int]
+
+
+def parse_request(entry: dict) -> RenderRequest:
+    """
+    Raises:
+        ValueError: if entry is not a valid render request
+    """
+    try:
+        request = RenderRequest(
+            message=str(entry["message"]),
+            tone=str(entry.get("tone", RenderRequest.tone)),
+            frequency=float(entry.get("frequency", RenderRequest.frequency)),
+            sample_rate=int(entry.get("sample_rate", RenderRequest.sample_rate)),
+            words_per_minute=int(entry.get("words_per_minute", RenderRequest.words_per_minute)),
+            audio_format=AudioFormat(entry.get("audio_format", RenderRequest.audio_format)).value,
+            wav=bool(entry.get("wav", RenderRequest.wav)),
+        )
+    except (ValueError, TypeError, KeyError) as error:
+        raise ValueError(f"Invalid request: {entry!r:.80}") from error
+
+    if not request.wav and request.audio_format == AudioFormat.IMA_ADPCM:
+        raise ValueError(f"{AudioFormat.IMA_ADPCM} requires WAV container")
+
+    if request.words_per_minute <= 0 or request.sample_rate <= 0 or request.frequency <= 0:
+        raise ValueError(f"Invalid audio settings: {request}")
+
+    return request
+
+
+class RenderServer:
+    """
+    Asyncio render daemon. Keeps up to max_apps warm App instances, one per
+    (tone, frequency, sample rate, WPM), so repeated requests skip tokenizer
+    construction, tone precomputation and audio cache warm-up.
+    Tokenizing, rendering and encoding run in a thread pool; requests for
+    the same App are serialized, requests for different Apps run concurrently
+    """
+
+    def __init__(self, app_factory: Callable, max_apps: int = SERVER_MAX_APPS, workers: int | None = None):
+        self.__app_factory = app_factory
+        self.__max_apps = max_apps
+        self.__apps = OrderedDict()
+        self.__executor = ThreadPoolExecutor(workers, thread_name_prefix="cwi-render")
+        self.__statistics = ServerStatistics()
+        self.__uptime_timer = Timer("ServerUptime")
+
+        logger.debug(f"{self.__class__.__name__} initialized: {max_apps=}, {workers=}")
+
+    @property
+    def statistics(self):
+        self.__statistics.uptime = self.__uptime_timer.toc()
+        return self.__statistics
+
+    async def serve(self, address: Address):
+        if isinstance(address, str):
+            server = await asyncio.start_unix_server(self.handle_client, address, limit=SERVER_REQUEST_MAX_BYTES)
+        else:
+            server = await asyncio.start_server(self.handle_client, *address, limit=SERVER_REQUEST_MAX_BYTES)
+
+        self.__uptime_timer.tic()
+        logger.info(f"{self.__class__.__name__} listening on {address}")
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __run(self, function: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, function, *args)
+
+    async def __get_app(self, request: RenderRequest):
+        """
+        Returns:
+            (App, asyncio.Lock) pair for request settings, App is created in executor if not warm yet
+        """
+        key = request.app_key
+
+        if key in self.__apps:
+            self.__apps.move_to_end(key)
+            return self.__apps[key]
+
+        app = await self.__run(self.__app_factory, *key)
+        entry = self.__apps.setdefault(key, (app, asyncio.Lock()))
+
+        while len(self.__apps) > self.__max_apps:
+            evicted_key, _ = self.__apps.popitem(last=False)
+            logger.debug(f"{self.__class__.__name__} evicted warm app {evicted_key}")
+
+        return entry
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername") or "unix socket"
+        logger.debug(f"{self.__class__.__name__} client connected: {peer}")
+
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    await self.__handle_line(line, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as error:
+            logger.debug(f"{self.__class__.__name__} client {peer} dropped: {error!r}")
+        except Exception:
+            # Response framing is lost once audio streaming has started, so the connection is dropped
+            self.__statistics.failed += 1
+            logger.exception(f"{self.__class__.__name__} request of {peer} failed")
+        finally:
+            writer.close()
+
+        logger.debug(f"{self.__class__.__name__} client disconnected: {peer}")
+
+    async def __handle_line(self, line: bytes, writer: asyncio.StreamWriter):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            entry = None
+            
+        if isinstance(entry, dict) and entry.get("command") == "stats":
+            statistics = self.statistics
+            response = asdict(statistics) | {
+                "latency_mean": statistics.latency_mean,
+                "first_byte_latency_mean": statistics.first_byte_latency_mean,
+                "requests_per_second": statistics.requests_per_second,
+                "bytes_per_second": statistics.bytes_per_second,
+                "warm_apps": len(self.__apps),
+            }
+            await self.__send_header(writer, status="ok", bytes=0, **response)
+            return
+
+        self.__statistics.requests += 1
+        timer = Timer("Request").tic()
+
+        try:
+            if not isinstance(entry, dict):
+                raise ValueError(f"Request must be a JSON object: {line[:80]!r}")
+            
+            request = parse_request(entry)
+            app, lock = await self.__get_app(request)
+        except Exception as error:
+            self.__statistics.failed += 1
+            logger.warning(f"{self.__class__.__name__} rejected request: {error}")
+            await self.__send_header(writer, status="error", error=str(error), bytes=0)
+            return
+
+        async with lock:
+            await self.__stream_audio(request, app, writer, timer)
+
+        logger.debug(f"{self.__class__.__name__} request served in {timer.prev_toc():.4f}s: {len(request.message)} chars")
+
+    async def __stream_audio(self, request: RenderRequest, app, writer: asyncio.StreamWriter, timer: Timer):
+        def prepare():
+            app.message = request.message
+            return app.count_audio_samples()
+
+        samples = await self.__run(prepare)
+        encoder = ENCODERS[request.audio_format]()
+        data_size = encoder.data_size(samples)
+        header = wav_header(samples, request.sample_rate, encoder) if request.wav else b""
+        padding = b"\0" * (data_size % 2) if request.wav else b""
+
+        await self.__send_header(writer, status="ok", samples=samples, sample_rate=request.sample_rate,
+                                 bytes=len(header) + data_size + len(padding))
+        writer.write(header)
+        self.__statistics.first_byte_latency_total += timer.toc()
+
+        blocks = app.generate_int16_blocks(SAVING_BUFFER_SIZE)
+
+        def encode_next():
+            """
+            Returns:
+                (encoded bytes, True if it was the last call)
+            """
+            block = next(blocks, None)
+            return (encoder.flush(), True) if block is None else (encoder.encode(block), False)
+
+        sent = 0
+        done = False
+        
+        while not done:
+            encoded, done = await self.__run(encode_next)
+
+            if encoded.size:
+                writer.write(memoryview(encoded).cast("B"))
+                sent += encoded.nbytes
+                await writer.drain()
+
+        writer.write(padding)
+        await writer.drain()
+
+        latency = timer.toc()
+        self.__statistics.samples += samples
+        self.__statistics.bytes_sent += len(header) + sent + len(padding)
+        self.__statistics.latency_total += latency
+        self.__statistics.latency_max = max(self.__statistics.latency_max, latency)
+
+    async def __send_header(self, writer: asyncio.StreamWriter, **header):
+        writer.write(json.dumps(header).encode() + b"\n")
+        await writer.drain()
+
+
+def connect(address: Address):
+    if isinstance(address, str):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+    connection.connect(address)
+    return connection
+
+
+def send_request(connection: socket.socket, request: dict, output: BinaryIO | None = None):
+    """
+    Sends one request and copies response payload into output
+
+    Raises:
+        ConnectionError: if server closes connection early
+        RuntimeError: if server reports an error
+
+    Returns:
+        Response header
+    """
+    connection.sendall(json.dumps(request).encode() + b"\n")
+    stream = connection.makefile("rb")
+
+    try:
+        line = stream.readline()
+
+        if not line:
+            raise ConnectionError("Server closed connection")
+
+        header = json.loads(line)
+        remaining = header["bytes"]
+
+        while remaining:
+            chunk = stream.read1(min(remaining, SAVING_BUFFER_SIZE))
+
+            if not chunk:
+                raise ConnectionError(f"Server closed connection, {remaining} bytes missing")
+
+            if output is not None:
+                output.write(chunk)
+            remaining -= len(chunk)
+    finally:
+        stream.close()
+
+    if header["status"] != "ok":
+        raise RuntimeError(header.get("error", "Unknown server error"))
+
+    return header
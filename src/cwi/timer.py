@@ -1,4 +1,5 @@
 from time import perf_counter
+from typing import Callable
 from datetime import timedelta
 
 
@@ -7,10 +8,14 @@ class Timer:
     Class for measuring code execution time
     """
     
-    def __init__(self, name=None):
+    def __init__(self, name=None, clock: Callable[[], float] = perf_counter):
+        """
+        clock is perf_counter (wall time) by default, process_time measures CPU time
+        """
         self.__tic = None
         self.__toc = 0.0
         self.__name = name
+        self.__clock = clock
 
     def __enter__(self):
         self.tic()
@@ -26,7 +31,7 @@ class Timer:
         Returns:
             Initial Timer instance
         """
-        self.__tic = perf_counter()
+        self.__tic = self.__clock()
         self.__toc = 0.0
         
         return self
@@ -40,7 +45,7 @@ class Timer:
             Time elapsed since last tic() called [seconds]
         """
         if self.__tic is not None:
-            self.__toc = perf_counter() - self.__tic
+            self.__toc = self.__clock() - self.__tic
             return self.__toc
         else:
             return self.__toc
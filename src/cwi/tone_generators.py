@@ -1,13 +1,20 @@
 from abc import ABC, abstractmethod
+from functools import cache
+from math import ceil
 
 import numpy as np
-from loguru import logger
+import numpy.typing as npt
+
+from cwi.log import logger
+from cwi.data_structures import ToneGeneratorType
+from cwi.oscillators import Wavetable, WavetableOscillator
 
 
 class ToneGenerator(ABC):
     def __init__(self, frequency: float | int, sample_rate: int):
         self._frequency = frequency
         self._sample_rate = sample_rate
+        self._oscillator = WavetableOscillator(self.wavetable(), frequency, sample_rate)
         
         logger.debug(f"{self.__class__.__name__} initialized with {frequency=}HZ; {sample_rate=}HZ")
 
@@ -16,18 +23,46 @@ class ToneGenerator(ABC):
         instance = cls.__new__(cls)
         instance.__init__(source._frequency, source._sample_rate)
         return instance
+    
+    @classmethod
+    @cache
+    def wavetable(cls):
+        return Wavetable(cls.waveform)
 
+    @staticmethod
     @abstractmethod
-    def sound(duration: float):
+    def waveform(phase: npt.NDArray):
+        """
+        Single cycle of the tone, phase is in cycles [0, 1)
+        """
         pass
     
+    def sound(self, duration: float):
+        """
+        Returns:
+            float32 tone of given duration, starting at zero phase
+        """
+        self._oscillator.reset()
+        return self._oscillator.generate(ceil(self._sample_rate * duration))
+    
+    def next_block(self, samples: int, out: npt.NDArray[np.float32] | None = None):
+        """
+        Returns:
+            float32 tone continuing the phase of previous next_block() call
+        """
+        return self._oscillator.generate(samples, out)
+    
     def __repr__(self):
         return f"{self.__class__.__name__}({self._frequency}, {self._sample_rate})"
 
 
 class SilenceGenerator(ToneGenerator):
+    @staticmethod
+    def waveform(phase: npt.NDArray):
+        return np.zeros_like(phase)
+    
     def sound(self, duration: float):
-        return np.zeros(int(self._sample_rate * duration))
+        return np.zeros(int(self._sample_rate * duration), dtype=np.float32)
     
     @classmethod
     def copy_of(cls, source: "ToneGenerator"):
@@ -37,24 +72,32 @@ class SilenceGenerator(ToneGenerator):
 
 
 class SineWaveToneGenerator(ToneGenerator):
-    def sound(self, duration: float):
-        t = np.arange(self._sample_rate * duration) / self._sample_rate
-        return np.sin(2 * np.pi * t * self._frequency)
+    @staticmethod
+    def waveform(phase: npt.NDArray):
+        return np.sin(2 * np.pi * phase)
 
 
 class SquareToneGenerator(ToneGenerator):
-    def sound(self, duration: float):
-        t = np.arange(self._sample_rate * duration) / self._sample_rate
-        return np.sign(np.sin(2 * np.pi * t * self._frequency))
+    @staticmethod
+    def waveform(phase: npt.NDArray):
+        return np.sign(np.sin(2 * np.pi * phase))
 
 
 class SawtoothToneGenerator(ToneGenerator):
-    def sound(self, duration: float):
-        t = np.arange(self._sample_rate * duration) / self._sample_rate
-        return 2 * (t % (1 / self._frequency)) * self._frequency - 1
+    @staticmethod
+    def waveform(phase: npt.NDArray):
+        return 2 * phase - 1
 
 
 class TriangleToneGenerator(ToneGenerator):
-    def sound(self, duration: float):
-        t = np.arange(self._sample_rate * duration) / self._sample_rate
-        return np.abs(t * self._frequency - np.floor(0.5 + t * self._frequency))
+    @staticmethod
+    def waveform(phase: npt.NDArray):
+        return np.abs(phase - np.floor(0.5 + phase))
+
+
+TONE_GENERATORS = {
+    ToneGeneratorType.SINE: SineWaveToneGenerator,
+    ToneGeneratorType.SAW: SawtoothToneGenerator,
+    ToneGeneratorType.TRIANGLE: TriangleToneGenerator,
+    ToneGeneratorType.SQUARE: SquareToneGenerator,
+}
@@ -0,0 +1,165 @@
+"""
+Terminal output of the CLI. rich is imported only when a rich console, progress bar
+or log handler is actually used: quiet mode and non-terminal output use plain text
+"""
+import re
+import shutil
+import sys
+
+
+_MARKUP = re.compile(r"\[/?[a-z][a-z0-9 ]*\]|\[/\]")
+
+_plain = False
+_quiet = False
+_stderr = False
+_console = None
+
+
+class PlainConsole:
+    """
+    Subset of rich.console.Console used by cwi, writing text without markup
+    """
+
+    def __init__(self, stderr: bool = False, quiet: bool = False):
+        self.stderr = stderr
+        self.quiet = quiet
+
+    @property
+    def file(self):
+        return sys.stderr if self.stderr else sys.stdout
+
+    @property
+    def width(self):
+        return shutil.get_terminal_size().columns
+
+    def print(self, *objects, sep: str = " ", end: str = "\n", **kwargs):
+        if not self.quiet:
+            self.file.write(_MARKUP.sub("", sep.join(map(str, objects))) + end)
+
+    def line(self, count: int = 1):
+        if not self.quiet:
+            self.file.write("\n" * count)
+
+    def rule(self, title: str = "", **kwargs):
+        self.print(f"-- {title} --" if title else "-" * 16)
+
+    def print_json(self, json: str, **kwargs):
+        if not self.quiet:
+            self.file.write(json + "\n")
+
+
+class NullProgress:
+    """
+    Progress bar that shows nothing
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return False
+
+    def add_task(self, *args, **kwargs):
+        return 0
+
+    def advance(self, *args, **kwargs):
+        pass
+
+    def update(self, *args, **kwargs):
+        pass
+
+
+class _ConsoleProxy:
+    """
+    Creates the console on first use, so importing cwi does not import rich
+    """
+
+    def __getattr__(self, name: str):
+        return getattr(get_console(), name)
+
+
+console = _ConsoleProxy()
+
+
+def configure(quiet: bool = False, use_stderr: bool = False, silent_console: bool = False):
+    """
+    quiet disables console output and rich entirely, as does output stream not being a terminal.
+    silent_console only mutes the console, e.g. while debug logs are shown instead
+    """
+    global _plain, _quiet, _stderr, _console
+
+    stream = sys.stderr if use_stderr else sys.stdout
+
+    _plain = quiet or not stream.isatty()
+    _quiet = quiet or silent_console
+    _stderr = use_stderr
+    _console = None
+
+
+def is_plain():
+    return _plain
+
+
+def get_console():
+    global _console
+
+    if _console is None:
+        if _plain:
+            _console = PlainConsole(_stderr, _quiet)
+        else:
+            from rich.console import Console
+            _console = Console(stderr=_stderr, quiet=_quiet)
+
+    return _console
+
+
+def error(message: str):
+    """
+    Prints error line, on stderr even in quiet mode
+    """
+    if _quiet:
+        sys.stderr.write(_MARKUP.sub("", message) + "\n")
+    else:
+        get_console().print(message)
+
+
+def log_sink():
+    """
+    Returns:
+        loguru sink: rich log handler on a terminal, plain stderr otherwise
+    """
+    if _plain:
+        return sys.stderr
+
+    from rich.console import Console
+    from rich.logging import RichHandler
+
+    return RichHandler(console=Console(stderr=_stderr))
+
+
+def saving_progress(path: str, disable: bool = False):
+    if _plain or _quiet or disable:
+        return NullProgress()
+
+    from rich.progress import Progress, SpinnerColumn, MofNCompleteColumn
+
+    return Progress(f"[gray50]{path}", MofNCompleteColumn(), SpinnerColumn("line", finished_text="[gray50]Complete"),
+                    console=get_console())
+
+
+def playback_progress():
+    if _plain or _quiet:
+        return NullProgress()
+
+    from rich.progress import Progress, SpinnerColumn, TimeElapsedColumn
+
+    return Progress("[green]|>", TimeElapsedColumn(), SpinnerColumn("point", finished_text="[gray50]___"), console=get_console())
+
+
+def batch_progress(manifest: str):
+    if _plain or _quiet:
+        return NullProgress()
+
+    from rich.progress import Progress, TimeElapsedColumn, MofNCompleteColumn
+
+    return Progress(f"[gray50]{manifest}", MofNCompleteColumn(), TimeElapsedColumn(), console=get_console())
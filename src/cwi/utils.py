@@ -1,5 +1,8 @@
 from typing import Iterable
 
+import numpy as np
+import numpy.typing as npt
+
 
 def chunked(iterable: Iterable, size: int):
     if type(size) != int:
@@ -7,3 +10,88 @@ def chunked(iterable: Iterable, size: int):
     
     for pos in range(0, len(iterable), size):
         yield iterable[pos:pos + size]
+
+
+def common_prefix_length(a: str, b: str):
+    """
+    Returns:
+        Length of the longest common prefix, found by bisection with slice comparisons
+    """
+    low, high = 0, min(len(a), len(b))
+    
+    if b.startswith(a[:high]):
+        return high
+    
+    while low < high:
+        middle = (low + high + 1) // 2
+        
+        if b.startswith(a[:middle]):
+            low = middle
+        else:
+            high = middle - 1
+            
+    return low
+
+
+def common_suffix_length(a: str, b: str, limit: int | None = None):
+    """
+    Returns:
+        Length of the longest common suffix, not longer than limit
+    """
+    low, high = 0, min(len(a), len(b), len(a) if limit is None else limit)
+    
+    if b.endswith(a[len(a) - high:]):
+        return high
+    
+    while low < high:
+        middle = (low + high + 1) // 2
+        
+        if b.endswith(a[len(a) - middle:]):
+            low = middle
+        else:
+            high = middle - 1
+            
+    return low
+
+
+class SpliceBuffer:
+    """
+    Growable 1-D array. Replacing a range moves only the items after it and earlier items stay in place.
+    Capacity is twice the size whenever it grows, the first allocation included, so appending
+    is amortized O(appended items). Views returned by data and replace() are valid until the next replace()
+    """
+    
+    def __init__(self, dtype: npt.DTypeLike, capacity: int = 0):
+        self.__array = np.empty(capacity, dtype=dtype)
+        self.__size = 0
+        
+    @property
+    def data(self):
+        return self.__array[:self.__size]
+    
+    def __len__(self):
+        return self.__size
+        
+    def replace(self, start: int, stop: int, size: int):
+        """
+        Replaces items [start, stop) by size uninitialized items
+        
+        Returns:
+            View of the new items
+        """
+        if not 0 <= start <= stop <= self.__size:
+            raise IndexError(f"Invalid range: {start=}, {stop=}, size={self.__size}")
+        
+        new_size = self.__size - (stop - start) + size
+        
+        if new_size > self.__array.size:
+            grown = np.empty(2 * new_size, dtype=self.__array.dtype)
+            grown[:start] = self.__array[:start]
+            grown[start + size:new_size] = self.__array[stop:self.__size]
+            self.__array = grown
+        elif stop != start + size:
+            self.__array[start + size:new_size] = self.__array[stop:self.__size]
+            
+        self.__size = new_size
+        
+        return self.__array[start:start + size]
@@ -0,0 +1,166 @@
+import mmap
+import os
+import struct
+from typing import BinaryIO
+
+import numpy as np
+import numpy.typing as npt
+
+from cwi.log import logger
+from cwi.encoders import SampleEncoder, Pcm16Encoder
+
+
+def wav_header(sample_count: int, sample_rate: int, encoder: SampleEncoder | None = None) -> bytes:
+    """
+    RIFF/WAVE mono header for given data length. Plain PCM gets the canonical 44-byte header,
+    other formats get extended fmt chunk and fact chunk
+    """
+    encoder = encoder or Pcm16Encoder()
+    data_size = encoder.data_size(sample_count)
+    bytes_per_second = -(-sample_rate * encoder.block_align // encoder.samples_per_block)
+    
+    fmt = struct.pack("<HHIIHH", encoder.FORMAT_TAG, 1, sample_rate, bytes_per_second, encoder.block_align, encoder.BITS_PER_SAMPLE)
+    chunks = b""
+    
+    if encoder.fmt_extension is not None:
+        fmt += struct.pack("<H", len(encoder.fmt_extension)) + encoder.fmt_extension
+        chunks += struct.pack("<4sII", b"fact", 4, sample_count)
+        
+    chunks = struct.pack("<4sI", b"fmt ", len(fmt)) + fmt + chunks
+    riff_size = 4 + len(chunks) + 8 + data_size + data_size % 2
+    
+    return struct.pack("<4sI4s", b"RIFF", riff_size, b"WAVE") + chunks + struct.pack("<4sI", b"data", data_size)
+
+
+class PcmWriter:
+    """
+    Writes encoded samples to a binary stream without intermediate copies
+    """
+    
+    def __init__(self, file: BinaryIO, encoder: SampleEncoder | None = None):
+        self._file = file
+        self._encoder = encoder or Pcm16Encoder()
+        self._samples_written = 0
+        self._bytes_written = 0
+        
+    @property
+    def samples_written(self):
+        return self._samples_written
+    
+    def __write_bytes(self, encoded: npt.NDArray):
+        encoded = np.ascontiguousarray(encoded)
+        self._file.write(memoryview(encoded).cast("B"))
+        self._bytes_written += encoded.nbytes
+        
+    def write(self, samples: npt.NDArray[np.int16]):
+        self.__write_bytes(self._encoder.encode(samples))
+        self._samples_written += samples.size
+        
+    def close(self):
+        self.__write_bytes(self._encoder.flush())
+        self._file.flush()
+        
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class WavWriter(PcmWriter):
+    """
+    Writes a mono WAV file whose header is written once up front from the known sample count.
+    If fewer samples are written and the stream is seekable, the header is corrected on close
+    """
+    
+    def __init__(self, file: BinaryIO, sample_rate: int, sample_count: int, encoder: SampleEncoder | None = None):
+        super().__init__(file, encoder)
+        
+        self.__sample_rate = sample_rate
+        self.__sample_count = sample_count
+        self.__header_position = file.tell() if file.seekable() else None
+        
+        self._file.write(wav_header(sample_count, sample_rate, self._encoder))
+        
+    def close(self):
+        super().close()
+        
+        if self._bytes_written % 2:
+            self._file.write(b"\0")
+        
+        if self._samples_written != self.__sample_count:
+            if self.__header_position is not None:
+                end = self._file.tell()
+                self._file.seek(self.__header_position)
+                self._file.write(wav_header(self._samples_written, self.__sample_rate, self._encoder))
+                self._file.seek(end)
+            else:
+                logger.warning(f"{self.__class__.__name__} header declares {self.__sample_count} samples, "
+                               f"{self._samples_written} written")
+                
+        self._file.flush()
+
+
+class MappedWavWriter:
+    """
+    PCM16 mono WAV file preallocated at its exact final size, with memory-mapped data chunk.
+    Samples are written in place through the samples array; the file starts zero-filled.
+    Where supported, disk space is reserved up front, so a full disk is reported
+    as OSError here instead of a fault on write. release() writes back and unmaps pages
+    of finished samples, so resident memory is bounded by what is not released yet
+    """
+    
+    def __init__(self, path: str, sample_rate: int, sample_count: int):
+        header = wav_header(sample_count, sample_rate, Pcm16Encoder())
+        
+        self.__file = open(path, "w+b")
+        self.__file.write(header)
+        self.__file.truncate(file_size := len(header) + Pcm16Encoder().data_size(sample_count))
+        self.__file.flush()
+        
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(self.__file.fileno(), 0, file_size)
+        
+        self.__map = mmap.mmap(self.__file.fileno(), 0)
+        self.__data_offset = len(header)
+        self.__released = 0
+        self.__samples = np.frombuffer(self.__map, dtype="<i2", count=sample_count, offset=self.__data_offset)
+        
+        logger.debug(f"{self.__class__.__name__} mapped {path=}, {sample_count=}")
+        
+    @property
+    def samples(self) -> npt.NDArray[np.int16]:
+        return self.__samples
+    
+    def release(self, stop: int):
+        """
+        Writes back samples before stop and drops their pages from memory
+        """
+        end = (self.__data_offset + stop * self.__samples.itemsize) // mmap.PAGESIZE * mmap.PAGESIZE
+        
+        if end <= self.__released:
+            return
+        
+        self.__map.flush(self.__released, end - self.__released)
+        
+        if hasattr(mmap, "MADV_DONTNEED"):
+            self.__map.madvise(mmap.MADV_DONTNEED, self.__released, end - self.__released)
+            
+        self.__released = end
+        
+    def close(self):
+        if self.__map.closed:
+            return
+        
+        # Array views export the map's buffer, which must be released before closing
+        del self.__samples
+        
+        self.__map.flush()
+        self.__map.close()
+        self.__file.close()
+        
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, type, value, traceback):
+        self.close()